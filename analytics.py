@@ -1,15 +1,41 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 import pandas as pd
-from collections import Counter
 import plotly.graph_objects as go
 import plotly.express as px
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from plotly.offline import get_plotlyjs
+import argparse
+import hashlib
+import json
 import os
+import random
+import shutil
+import threading
+import time
 import numpy as np
 
+import columnar
+import instrumentation
+from main_file import RETRYABLE_ERRORS, RETRY_BASE_DELAY, MAX_RETRIES
+from ingredient_index import IngredientIndex
+from json_stream import iter_json_array
+
 # ---------------- FIRESTORE CONFIG ----------------
 PROJECT_ID = "recipe-project-87528"
 SERVICE_ACCOUNT_PATH = r"serviceAccountKey.json"
+EXPORT_DIR = "firestore_export"
+CACHE_DIR = ".analytics_cache"
+INGREDIENT_INDEX_PATH = os.path.join(CACHE_DIR, "ingredient_index.npz")
+COLUMNAR_DIR = "normalized_columnar"
+METRICS_PATH = "metrics/analytics"
+
+# Parallel extraction: only the fields compute_insights reads are fetched,
+# plus updatedAt, which keys the cached ingredient index.
+RECIPE_FIELDS = ['title', 'difficulty', 'prepTimeMinutes', 'ingredients', 'updatedAt']
+INTERACTION_FIELDS = ['recipeId', 'views', 'likes', 'rating']
+PAGE_SIZE = 1000
+PARTITIONS = 8
 
 def init_firestore():
     if not firebase_admin._apps:
@@ -33,39 +59,244 @@ def fetch_data(db):
         data = i.to_dict()
         data['interactionId'] = i.id
         interactions.append(data)
+    instrumentation.record(reads=len(recipes), collection="recipes")
+    instrumentation.record(reads=len(interactions), collection="interactions")
 
     df_recipes = pd.DataFrame(recipes)
-    df_interactions = pd.DataFrame(interactions)
+    df_interactions = prepare_interactions(pd.DataFrame(interactions))
+
+    return df_recipes, df_interactions
 
+def prepare_interactions(df_interactions):
     # Ensure numeric columns exist
     for col in ['views', 'likes', 'rating']:
         if col in df_interactions.columns:
             df_interactions[col] = pd.to_numeric(df_interactions[col], errors='coerce').fillna(0)
         else:
             df_interactions[col] = 0
+    return df_interactions
+
+# ---------------- PARALLEL EXTRACTION ----------------
+def read_partition(query, page_size, stats, lock, max_retries=MAX_RETRIES):
+    # Cursor-paginates one partition. A failed page is retried from the last
+    # document already read, so nothing is fetched (or billed) twice.
+    docs, last, attempt = [], None, 0
+    while True:
+        page_query = query.limit(page_size)
+        if last is not None:
+            page_query = page_query.start_after(last)
+        try:
+            page = list(page_query.stream())
+        except RETRYABLE_ERRORS:
+            if attempt >= max_retries:
+                raise
+            time.sleep(random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt)))
+            attempt += 1
+            with lock:
+                stats['retries'] += 1
+            continue
+        attempt = 0
+        docs.extend(page)
+        with lock:
+            stats['reads'] += len(page)
+            stats['pages'] += 1
+        if len(page) < page_size:
+            return docs
+        last = page[-1]
+
+def fetch_data_parallel(db, workers=PARTITIONS * 2, partitions=PARTITIONS, page_size=PAGE_SIZE):
+    start = time.perf_counter()
+    collections = {
+        'recipes': ('recipeId', RECIPE_FIELDS),
+        'interactions': ('interactionId', INTERACTION_FIELDS),
+    }
+    lock = threading.Lock()
+    stats = {name: {'reads': 0, 'pages': 0, 'retries': 0} for name in collections}
+
+    # Both collections are split into document-ID ranges up front and every
+    # range is read concurrently with a projected query.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for name, (_, fields) in collections.items():
+            ranges = list(db.collection_group(name).get_partitions(partitions))
+            futures[name] = [
+                pool.submit(read_partition, part.query().select(fields), page_size, stats[name], lock)
+                for part in ranges
+            ]
+        results = {name: [doc for f in fs for doc in f.result()] for name, fs in futures.items()}
+
+    frames = {}
+    for name, (id_field, fields) in collections.items():
+        rows = []
+        for doc in results[name]:
+            data = doc.to_dict()
+            data[id_field] = doc.id
+            rows.append(data)
+        frames[name] = pd.DataFrame(rows, columns=fields + [id_field])
+
+    elapsed = time.perf_counter() - start
+    for name, s in stats.items():
+        instrumentation.record(reads=s['reads'], collection=name)
+        print(f"   {name}: {s['reads']} reads in {s['pages']} pages, {s['retries']} retries")
+    print(f"   parallel extraction took {elapsed:.3f}s")
+    return frames['recipes'], prepare_interactions(frames['interactions']), {**stats, 'seconds': round(elapsed, 3)}
+
+# ---------------- SNAPSHOT SOURCE ----------------
+def file_sha256(path, memo):
+    # Hashes are remembered per (size, mtime) so an unchanged export is not
+    # re-read just to prove it is unchanged.
+    st = os.stat(path)
+    key = os.path.abspath(path)
+    entry = memo.get(key)
+    if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+        return entry["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    memo[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest.hexdigest()}
+    return memo[key]["sha256"]
+
+def read_export_columns(path, id_field):
+    # Collect documents column-wise while streaming, instead of keeping a
+    # list of per-document dicts alongside the final frame.
+    columns, rows = {}, 0
+    for doc in iter_json_array(path):
+        doc.setdefault(id_field, None)
+        for key in doc:
+            if key not in columns:
+                columns[key] = [None] * rows
+        for key, values in columns.items():
+            values.append(doc.get(key))
+        rows += 1
+    return pd.DataFrame(columns)
+
+def recipe_columns(recipe_fields):
+    # recipeId and updatedAt (which keys the ingredient index) come first,
+    # whether or not the caller's fields already name them.
+    return list(dict.fromkeys(['recipeId', 'updatedAt', *recipe_fields]))
 
+def fetch_snapshot(export_dir=EXPORT_DIR, cache_dir=CACHE_DIR, categorical=False,
+                   recipe_fields=RECIPE_FIELDS, interaction_fields=INTERACTION_FIELDS):
+    memo_path = os.path.join(cache_dir, "export_hashes.json")
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path) as f:
+            memo = json.load(f)
+
+    recipes_path = os.path.join(export_dir, "recipes.json")
+    interactions_path = os.path.join(export_dir, "interactions.json")
+    key = hashlib.sha256(
+        (file_sha256(recipes_path, memo) + file_sha256(interactions_path, memo)).encode()
+    ).hexdigest()[:16]
+    snapshot_dir = os.path.join(cache_dir, f"snapshot-{key}")
+
+    if not columnar.is_table(os.path.join(snapshot_dir, "interactions")):
+        # A new export: every column is cached (interactions last, as the
+        # completion marker) and the snapshots of earlier exports are dropped.
+        columnar.write_frame(read_export_columns(recipes_path, 'recipeId'), os.path.join(snapshot_dir, "recipes"))
+        columnar.write_frame(prepare_interactions(read_export_columns(interactions_path, 'interactionId')),
+                             os.path.join(snapshot_dir, "interactions"))
+        for name in os.listdir(cache_dir):
+            if name.startswith("snapshot-") and name != os.path.basename(snapshot_dir):
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+    # Only the columns the insights read are mapped in, on the first run for
+    # an export as on every later one.
+    df_recipes = columnar.read_frame(os.path.join(snapshot_dir, "recipes"), recipe_columns(recipe_fields))
+    df_interactions = columnar.read_frame(os.path.join(snapshot_dir, "interactions"),
+                                          ['interactionId'] + list(interaction_fields), categorical=categorical)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(memo_path, "w") as f:
+        json.dump(memo, f, indent=4)
     return df_recipes, df_interactions
 
+def fetch_columnar(columnar_dir=COLUMNAR_DIR, categorical=False,
+                   recipe_fields=RECIPE_FIELDS, interaction_fields=INTERACTION_FIELDS):
+    # Normalized tables written by normalize_export.py --format columnar (or
+    # columnar.py). Ingredients come from their own table, so the returned
+    # index replaces the nested ingredient lists. categorical=True keeps the
+    # interactions' string columns as codes (see parallel_insights.py).
+    df_recipes = columnar.read_frame(os.path.join(columnar_dir, "recipe"),
+                                     recipe_columns(recipe_fields))
+    df_interactions = prepare_interactions(columnar.read_frame(
+        os.path.join(columnar_dir, "interactions"), ['interactionId'] + list(interaction_fields),
+        categorical=categorical))
+    ingredient_index = IngredientIndex.from_ingredients_table(
+        columnar.read_frame(os.path.join(columnar_dir, "ingredients"), ['recipeId', 'name']))
+    return df_recipes, df_interactions, ingredient_index
+
+# ---------------- AGGREGATION ----------------
+def aggregate_interactions(df_interactions):
+    # One groupby pass keyed by recipeId; every per-recipe metric below is
+    # derived from these sums and counts.
+    return df_interactions.groupby('recipeId').agg(
+        views=('views', 'sum'),
+        likes=('likes', 'sum'),
+        rating_sum=('rating', 'sum'),
+        rating_count=('rating', 'count'),
+        interactions=('interactionId', 'count'),
+        rows=('likes', 'size'),
+    )
+
+def recipe_stats(df_recipes, agg):
+    # Attach recipe attributes to the per-recipe aggregates. Recipes are keyed
+    # by recipeId, so two recipes sharing a title are kept apart.
+    stats = df_recipes[['recipeId', 'title', 'difficulty', 'prepTimeMinutes']].merge(
+        agg, left_on='recipeId', right_index=True, how='inner'
+    )
+    stats['avg_rating'] = stats['rating_sum'] / stats['rating_count']
+    stats['like_view_ratio'] = stats['likes'] / stats['views'].replace(0, 1)
+    stats['likes_mean'] = stats['likes'] / stats['rows']
+    # Title order first, so ties in the top-10 lists break as they did when
+    # these were per-title groupbys.
+    return stats.sort_values('title', kind='stable').reset_index(drop=True)
+
+def top_by(stats, column, name=None, n=10):
+    series = stats.set_index('title')[column].sort_values(ascending=False).head(n)
+    return series.rename(name or column)
+
 # ---------------- ANALYTICS ----------------
-def compute_insights(df_recipes, df_interactions):
-    # Merge interactions with recipe info
-    df = df_interactions.merge(
-        df_recipes[['recipeId', 'title', 'difficulty', 'prepTimeMinutes', 'ingredients']],
-        on='recipeId', how='left'
+def compute_insights(df_recipes, df_interactions, ingredient_index=None):
+    # Returns top_views, top_likes, top_rating, difficulty_dist,
+    # ingredient_counts, ingredient_engagement and the per-recipe `stats`
+    # frame (one row per recipeId: title, difficulty, prepTimeMinutes, the
+    # summed metrics, avg_rating, like_view_ratio and likes_mean). The last
+    # value used to be the interactions x recipes merge, which is no longer
+    # built; create_charts and create_charts_batch take `stats`.
+    agg = aggregate_interactions(df_interactions)
+    stats = recipe_stats(df_recipes, agg)
+    if ingredient_index is None:
+        ingredient_index = IngredientIndex.from_recipes(df_recipes)
+
+    # Correlation between prep time and per-recipe mean likes
+    correlation = None
+    if agg['likes'].sum() > 0:
+        correlation = stats['prepTimeMinutes'].corr(stats['likes_mean'])
+
+    # Per-recipe engagement totals (likes + rating) pushed through the sparse
+    # ingredient index (A^T x).
+    ingredient_engagement = ingredient_index.mean_per_ingredient(
+        agg['likes'] + agg['rating_sum'], agg['rows'], name='engagement'
     )
+    return report_insights(df_recipes, stats, correlation, ingredient_index.counter(), ingredient_engagement)
 
+def report_insights(df_recipes, stats, correlation, ingredient_counts, ingredient_engagement):
+    # Prints the insights from per-recipe stats (see recipe_stats) and
+    # per-ingredient results; shared by full and incremental runs.
     # 1. Top 10 Recipes by Views
-    top_views = df.groupby('title')['views'].sum().sort_values(ascending=False).head(10)
+    top_views = top_by(stats, 'views')
     print("\n===== Top 10 Recipes by Views =====")
     print(top_views)
 
     # 2. Top 10 Recipes by Likes
-    top_likes = df.groupby('title')['likes'].sum().sort_values(ascending=False).head(10)
+    top_likes = top_by(stats, 'likes')
     print("\n===== Top 10 Recipes by Likes =====")
     print(top_likes)
 
     # 3. Top 10 Recipes by Average Rating
-    top_rating = df.groupby('title')['rating'].mean().sort_values(ascending=False).head(10)
+    top_rating = top_by(stats, 'avg_rating', 'rating')
     print("\n===== Top 10 Recipes by Average Rating =====")
     print(top_rating.round(2))
 
@@ -78,53 +309,41 @@ def compute_insights(df_recipes, df_interactions):
     print("\n===== Difficulty Distribution =====")
     print(difficulty_dist)
 
-    # 6. Correlation between prep time and likes
-    if df['likes'].sum() > 0:
-        correlation = df.groupby('recipeId')[['prepTimeMinutes','likes']].mean().corr().iloc[0,1]
+    # 6. Correlation between prep time and likes (per-recipe mean likes)
+    if correlation is not None:
         print("\n===== Correlation between Prep Time and Likes =====")
         print(f"Correlation coefficient: {correlation:.2f}")
     else:
-        correlation = None
         print("\nCorrelation cannot be calculated (likes are all zero)")
 
     # 7. Most common ingredients
-    all_ingredients = []
-    for ing_list in df_recipes['ingredients'].dropna():
-        for ing in ing_list:
-            all_ingredients.append(ing['name'])
-    ingredient_counts = Counter(all_ingredients)
     print("\n===== Top 10 Most Common Ingredients =====")
     for ing, count in ingredient_counts.most_common(10):
         print(f"{ing}: {count}")
 
     # 8. Ingredients associated with high engagement (likes + rating)
-    df_exploded = df_recipes.explode('ingredients')
-    df_exploded['ingredient_name'] = df_exploded['ingredients'].apply(lambda x: x['name'] if pd.notnull(x) else None)
-    merged = df_interactions.merge(df_exploded[['recipeId','ingredient_name']], on='recipeId')
-    merged['engagement'] = merged['likes'] + merged['rating']
-    ingredient_engagement = merged.groupby('ingredient_name')['engagement'].mean().sort_values(ascending=False).head(10)
+    ingredient_engagement = ingredient_engagement.sort_values(ascending=False).head(10)
     print("\n===== Ingredients Associated with High Engagement =====")
     print(ingredient_engagement.round(2))
 
     # 9. Recipes with highest like/view ratio
-    df_ratio = df.groupby('title').agg({'likes':'sum','views':'sum'})
-    df_ratio['like_view_ratio'] = df_ratio['likes'] / df_ratio['views'].replace(0,1)
-    top_ratio = df_ratio.sort_values('like_view_ratio', ascending=False).head(10)
+    top_ratio = top_by(stats, 'like_view_ratio')
     print("\n===== Top Recipes by Like/View Ratio =====")
-    print(top_ratio['like_view_ratio'].round(2))
+    print(top_ratio.round(2))
 
     # 10. Recipes with most interactions
-    top_interactions = df.groupby('title')['interactionId'].count().sort_values(ascending=False).head(10)
+    top_interactions = top_by(stats, 'interactions', 'interactionId')
     print("\n===== Recipes with Most Interactions =====")
     print(top_interactions)
 
-    return top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, df
+    return top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, stats
 
 # ---------------- VISUALIZATION ----------------
-def create_charts(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, df):
-    OUTPUT_DIR = "analytics_charts"
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+CHART_DIR = "analytics_charts"
+CHART_MANIFEST = ".chart_manifest.json"
+CHART_VERSION = 1  # bump when a chart builder changes, to force a re-render
 
+def chart_top_recipes(top_views, top_likes, top_rating):
     # Top Views, Likes, Rating
     fig = go.Figure()
     top_titles = top_views.index
@@ -149,43 +368,230 @@ def create_charts(top_views, top_likes, top_rating, difficulty_dist, ingredient_
         template="plotly_white",
         height=600,
     )
-    fig.write_html(os.path.join(OUTPUT_DIR, "top_recipes_engagement.html"))
-    fig.show()
-
-    # Difficulty Distribution
-    fig2 = go.Figure([go.Bar(x=difficulty_dist.index, y=difficulty_dist.values, text=difficulty_dist.values, textposition="auto")])
-    fig2.update_layout(title="Recipe Difficulty Distribution", xaxis_title="Difficulty", yaxis_title="Count", template="plotly_white")
-    fig2.write_html(os.path.join(OUTPUT_DIR, "difficulty_distribution.html"))
-    fig2.show()
-
-    # Top Ingredients
-    top_ingredients = dict(ingredient_counts.most_common(10))
-    fig3 = go.Figure([go.Bar(x=list(top_ingredients.keys()), y=list(top_ingredients.values()), text=list(top_ingredients.values()), textposition="auto")])
-    fig3.update_layout(title="Top 10 Ingredients", xaxis_title="Ingredient", yaxis_title="Count", template="plotly_white")
-    fig3.write_html(os.path.join(OUTPUT_DIR, "top_ingredients.html"))
-    fig3.show()
-
-    # Ingredient Engagement
-    fig4 = go.Figure([go.Bar(
+    return fig
+
+def chart_difficulty(difficulty_dist):
+    fig = go.Figure([go.Bar(x=difficulty_dist.index, y=difficulty_dist.values, text=difficulty_dist.values, textposition="auto")])
+    fig.update_layout(title="Recipe Difficulty Distribution", xaxis_title="Difficulty", yaxis_title="Count", template="plotly_white")
+    return fig
+
+def chart_top_ingredients(most_common):
+    top_ingredients = dict(most_common)
+    fig = go.Figure([go.Bar(x=list(top_ingredients.keys()), y=list(top_ingredients.values()), text=list(top_ingredients.values()), textposition="auto")])
+    fig.update_layout(title="Top 10 Ingredients", xaxis_title="Ingredient", yaxis_title="Count", template="plotly_white")
+    return fig
+
+def chart_ingredient_engagement(ingredient_engagement):
+    fig = go.Figure([go.Bar(
         x=ingredient_engagement.index,
         y=ingredient_engagement.values,
         text=ingredient_engagement.round(2).values,
         textposition="auto"
     )])
-    fig4.update_layout(title="Ingredients Associated with High Engagement", xaxis_title="Ingredient", yaxis_title="Avg Engagement", template="plotly_white")
-    fig4.write_html(os.path.join(OUTPUT_DIR, "ingredient_engagement.html"))
-    fig4.show()
+    fig.update_layout(title="Ingredients Associated with High Engagement", xaxis_title="Ingredient", yaxis_title="Avg Engagement", template="plotly_white")
+    return fig
 
-    # Prep Time vs Likes Scatter
-    df_group = df.groupby('recipeId')[['prepTimeMinutes','likes']].mean().reset_index()
-    fig5 = px.scatter(df_group, x='prepTimeMinutes', y='likes', text=df_group['recipeId'],
+def chart_prep_vs_likes(df_group):
+    return px.scatter(df_group, x='prepTimeMinutes', y='likes', text=df_group['recipeId'],
                       title="Prep Time vs Likes Correlation")
-    fig5.write_html(os.path.join(OUTPUT_DIR, "prep_time_vs_likes.html"))
-    fig5.show()
+
+def chart_inputs(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, stats):
+    # Each chart name maps to its builder and the only data it depends on.
+    df_group = stats[['recipeId', 'prepTimeMinutes', 'likes_mean']].rename(columns={'likes_mean': 'likes'})
+    return {
+        "top_recipes_engagement": (chart_top_recipes, (top_views, top_likes, top_rating)),
+        "difficulty_distribution": (chart_difficulty, (difficulty_dist,)),
+        "top_ingredients": (chart_top_ingredients, (ingredient_counts.most_common(10),)),
+        "ingredient_engagement": (chart_ingredient_engagement, (ingredient_engagement,)),
+        "prep_time_vs_likes": (chart_prep_vs_likes, (df_group,)),
+    }
+
+def hash_inputs(name, inputs):
+    digest = hashlib.sha256(f"{name}:{CHART_VERSION}".encode())
+    for value in inputs:
+        if isinstance(value, (pd.Series, pd.DataFrame)):
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+            names = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+            digest.update(repr(list(names)).encode())
+        else:
+            digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+def render_chart(name, builder, inputs, output_dir, png):
+    # Runs in a worker process; the shared plotly.min.js is already in place.
+    start = time.perf_counter()
+    fig = builder(*inputs)
+    paths = [os.path.join(output_dir, f"{name}.html")]
+    fig.write_html(paths[0], include_plotlyjs="directory")
+    if png:
+        paths.append(os.path.join(output_dir, f"{name}.png"))
+        fig.write_image(paths[1], width=1000, height=600)
+    return name, time.perf_counter() - start, sum(os.path.getsize(p) for p in paths)
+
+def create_charts_batch(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, stats,
+                        output_dir=CHART_DIR, png=False, workers=None):
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    charts = chart_inputs(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, stats)
+
+    # One plotly.js bundle per directory, referenced by every chart.
+    bundle = os.path.join(output_dir, "plotly.min.js")
+    if not os.path.exists(bundle):
+        with open(bundle, "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+
+    manifest_path = os.path.join(output_dir, CHART_MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    pending = {}
+    for name, (builder, inputs) in charts.items():
+        digest = hash_inputs(name, inputs)
+        outputs = [f"{name}.html"] + ([f"{name}.png"] if png else [])
+        if manifest.get(name) == digest and all(os.path.exists(os.path.join(output_dir, o)) for o in outputs):
+            continue
+        pending[name] = (builder, inputs, digest)
+
+    rendered = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers or len(pending)) as pool:
+            futures = [pool.submit(render_chart, name, builder, inputs, output_dir, png)
+                       for name, (builder, inputs, _) in pending.items()]
+            for future in futures:
+                name, seconds, size = future.result()
+                manifest[name] = pending[name][2]
+                rendered.append((name, seconds, size))
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+
+    for name, seconds, size in rendered:
+        print(f"   rendered {name} in {seconds:.2f}s ({size / 1024:.1f} KiB)")
+    print(f"Charts: {len(rendered)} rendered, {len(charts) - len(rendered)} unchanged, "
+          f"{time.perf_counter() - start:.2f}s total")
+    return rendered
+
+def create_charts(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, stats):
+    OUTPUT_DIR = CHART_DIR
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    charts = chart_inputs(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, stats)
+    for name, (builder, inputs) in charts.items():
+        fig = builder(*inputs)
+        fig.write_html(os.path.join(OUTPUT_DIR, f"{name}.html"))
+        fig.show()
 
 # ---------------- MAIN ----------------
 if __name__ == "__main__":
-    db = init_firestore()
-    df_recipes, df_interactions = fetch_data(db)
-    top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, df = compute_insights(df_recipes, df_interactions)
-    create_charts(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, df)
+    parser = argparse.ArgumentParser(description="Compute recipe analytics and charts.")
+    parser.add_argument("--source", choices=["firestore", "snapshot", "columnar"], default="firestore",
+                        help="read live collections, the firestore_export JSON snapshot, or columnar tables")
+    parser.add_argument("--export-dir", default=EXPORT_DIR)
+    parser.add_argument("--columnar-dir", default=COLUMNAR_DIR)
+    parser.add_argument("--parallel", action="store_true",
+                        help="read both collections concurrently in projected, paginated partitions")
+    parser.add_argument("--partitions", type=int, default=PARTITIONS)
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--workers", type=int, default=PARTITIONS * 2)
+    parser.add_argument("--fake", action="store_true",
+                        help="query an in-process fake client preloaded from --export-dir")
+    parser.add_argument("--headless", action="store_true",
+                        help="render charts in parallel without opening them; skip unchanged charts")
+    parser.add_argument("--png", action="store_true", help="with --headless, also write static PNGs (needs kaleido)")
+    parser.add_argument("--chart-workers", type=int, default=None)
+    parser.add_argument("--incremental", action="store_true",
+                        help="merge only documents changed since the last run into persisted aggregates")
+    parser.add_argument("--rebuild", action="store_true", help="with --incremental, drop the stored state first")
+    parser.add_argument("--streaming", action="store_true",
+                        help="rank in fixed memory: bounded top-k over the --incremental state, or sketches "
+                             "with error bounds over raw interactions from --source snapshot/columnar; no charts")
+    parser.add_argument("--capacity", type=int, default=None, help="with --streaming, space-saving counters per ranking")
+    parser.add_argument("--insight-workers", type=int, default=None,
+                        help="aggregate interactions in this many processes, partitioned by a hash of recipeId")
+    parser.add_argument("--metrics", default=METRICS_PATH, help="write stage metrics to <path>.json and <path>.prom")
+    parser.add_argument("--profile", default=None, help="dump a cProfile file per stage into this directory")
+    args = parser.parse_args()
+
+    instrumentation.configure("analytics", args.profile)
+    start = time.perf_counter()
+    insights = None
+    if args.streaming and not args.incremental:
+        import streaming_topk
+        capacity = args.capacity or streaming_topk.CAPACITY
+        if args.source == "snapshot":
+            batches = (streaming_topk.export_interactions(args.export_dir),
+                       streaming_topk.export_recipes(args.export_dir))
+        elif args.source == "columnar":
+            batches = (streaming_topk.columnar_interactions(args.columnar_dir),
+                       streaming_topk.columnar_recipes(args.columnar_dir))
+        else:
+            parser.error("--streaming without --incremental reads from --source snapshot or columnar")
+        with instrumentation.stage("streaming"):
+            streaming_topk.sketch_report(*batches, capacity=capacity)
+        print(f"\nStreamed {args.source} in {time.perf_counter() - start:.3f}s")
+    elif args.incremental:
+        import incremental_analytics
+        if args.source == "snapshot":
+            feeds = {name: (lambda watermark, name=name: incremental_analytics.export_docs(args.export_dir, name))
+                     for name in ["recipes", "interactions"]}
+        elif args.source == "firestore":
+            if args.fake:
+                from fake_firestore import FakeFirestore
+                db = FakeFirestore.from_export(args.export_dir)
+            else:
+                db = init_firestore()
+            # The fake client holds the export's ISO strings, not timestamps.
+            feeds = {name: (lambda watermark, name=name, id_field=id_field: incremental_analytics.firestore_docs(
+                        db, name, id_field, watermark, as_string=args.fake))
+                     for name, id_field in [("recipes", "recipeId"), ("interactions", "interactionId")]}
+        else:
+            parser.error("--incremental reads from --source firestore or snapshot")
+        with instrumentation.stage("incremental"):
+            if args.streaming:
+                import streaming_topk
+                incremental_analytics.run_incremental(feeds, rebuild=args.rebuild, report=streaming_topk.exact_report)
+            else:
+                insights = incremental_analytics.run_incremental(feeds, rebuild=args.rebuild)
+    else:
+        ingredient_index = None
+        with instrumentation.stage("extract"):
+            if args.source == "columnar":
+                df_recipes, df_interactions, ingredient_index = fetch_columnar(args.columnar_dir,
+                                                                               categorical=bool(args.insight_workers))
+            elif args.source == "snapshot":
+                df_recipes, df_interactions = fetch_snapshot(args.export_dir, categorical=bool(args.insight_workers))
+            else:
+                if args.fake:
+                    from fake_firestore import FakeFirestore
+                    db = FakeFirestore.from_export(args.export_dir)
+                else:
+                    db = init_firestore()
+                if args.parallel:
+                    df_recipes, df_interactions, _ = fetch_data_parallel(db, args.workers, args.partitions, args.page_size)
+                else:
+                    df_recipes, df_interactions = fetch_data(db)
+            instrumentation.record(rows_out=len(df_recipes), collection="recipes")
+            instrumentation.record(rows_out=len(df_interactions), collection="interactions")
+        print(f"Loaded {len(df_recipes)} recipes and {len(df_interactions)} interactions "
+              f"from {args.source} in {time.perf_counter() - start:.3f}s")
+        with instrumentation.stage("insights"):
+            if ingredient_index is None:
+                ingredient_index = IngredientIndex.load_or_build(df_recipes, INGREDIENT_INDEX_PATH)
+            if args.insight_workers:
+                from parallel_insights import compute_insights_parallel
+                insights = compute_insights_parallel(df_recipes, df_interactions, ingredient_index, args.insight_workers)
+            else:
+                insights = compute_insights(df_recipes, df_interactions, ingredient_index)
+            instrumentation.record(rows_in=len(df_recipes), collection="recipes")
+            instrumentation.record(rows_in=len(df_interactions), rows_out=len(insights[-1]), collection="interactions")
+    if insights is not None:
+        top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, stats = insights
+        with instrumentation.stage("charts"):
+            if args.headless:
+                create_charts_batch(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts,
+                                    ingredient_engagement, stats, png=args.png, workers=args.chart_workers)
+            else:
+                create_charts(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement,
+                              stats)
+    print("Metrics written to", " and ".join(instrumentation.write(args.metrics)))
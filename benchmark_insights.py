@@ -0,0 +1,156 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from analytics import compute_insights
+
+# -------------------------------------------------------------------
+# CONFIG
+# -------------------------------------------------------------------
+EXPORT_DIR = "firestore_export"
+SIZES = [1_000_000, 100_000_000]
+RECIPES = 10_000
+SKIP_LEGACY_ABOVE = 10_000_000
+
+# -------------------------------------------------------------------
+# LEGACY ENGINE (per-title groupbys, as compute_insights was written)
+# -------------------------------------------------------------------
+def legacy_compute_insights(df_recipes, df_interactions):
+    df = df_interactions.merge(
+        df_recipes[['recipeId', 'title', 'difficulty', 'prepTimeMinutes', 'ingredients']],
+        on='recipeId', how='left'
+    )
+
+    top_views = df.groupby('title')['views'].sum().sort_values(ascending=False).head(10)
+    print("\n===== Top 10 Recipes by Views =====")
+    print(top_views)
+
+    top_likes = df.groupby('title')['likes'].sum().sort_values(ascending=False).head(10)
+    print("\n===== Top 10 Recipes by Likes =====")
+    print(top_likes)
+
+    top_rating = df.groupby('title')['rating'].mean().sort_values(ascending=False).head(10)
+    print("\n===== Top 10 Recipes by Average Rating =====")
+    print(top_rating.round(2))
+
+    avg_prep_time = df_recipes['prepTimeMinutes'].mean()
+    print(f"\n===== Average Preparation Time =====\n{avg_prep_time:.2f} minutes")
+
+    difficulty_dist = df_recipes['difficulty'].value_counts()
+    print("\n===== Difficulty Distribution =====")
+    print(difficulty_dist)
+
+    if df['likes'].sum() > 0:
+        correlation = df.groupby('recipeId')[['prepTimeMinutes','likes']].mean().corr().iloc[0,1]
+        print("\n===== Correlation between Prep Time and Likes =====")
+        print(f"Correlation coefficient: {correlation:.2f}")
+    else:
+        correlation = None
+        print("\nCorrelation cannot be calculated (likes are all zero)")
+
+    all_ingredients = []
+    for ing_list in df_recipes['ingredients'].dropna():
+        for ing in ing_list:
+            all_ingredients.append(ing['name'])
+    ingredient_counts = Counter(all_ingredients)
+    print("\n===== Top 10 Most Common Ingredients =====")
+    for ing, count in ingredient_counts.most_common(10):
+        print(f"{ing}: {count}")
+
+    df_exploded = df_recipes.explode('ingredients')
+    df_exploded['ingredient_name'] = df_exploded['ingredients'].apply(lambda x: x['name'] if pd.notnull(x) else None)
+    merged = df_interactions.merge(df_exploded[['recipeId','ingredient_name']], on='recipeId')
+    merged['engagement'] = merged['likes'] + merged['rating']
+    ingredient_engagement = merged.groupby('ingredient_name')['engagement'].mean().sort_values(ascending=False).head(10)
+    print("\n===== Ingredients Associated with High Engagement =====")
+    print(ingredient_engagement.round(2))
+
+    df_ratio = df.groupby('title').agg({'likes':'sum','views':'sum'})
+    df_ratio['like_view_ratio'] = df_ratio['likes'] / df_ratio['views'].replace(0,1)
+    top_ratio = df_ratio.sort_values('like_view_ratio', ascending=False).head(10)
+    print("\n===== Top Recipes by Like/View Ratio =====")
+    print(top_ratio['like_view_ratio'].round(2))
+
+    top_interactions = df.groupby('title')['interactionId'].count().sort_values(ascending=False).head(10)
+    print("\n===== Recipes with Most Interactions =====")
+    print(top_interactions)
+
+    return top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, df
+
+# -------------------------------------------------------------------
+# DATA
+# -------------------------------------------------------------------
+def load_export(export_dir=EXPORT_DIR):
+    with open(os.path.join(export_dir, "recipes.json"), encoding="utf-8") as f:
+        df_recipes = pd.DataFrame(json.load(f))
+    with open(os.path.join(export_dir, "interactions.json"), encoding="utf-8") as f:
+        df_interactions = pd.DataFrame(json.load(f))
+    for col in ['views', 'likes', 'rating']:
+        df_interactions[col] = pd.to_numeric(df_interactions[col], errors='coerce').fillna(0)
+    return df_recipes, df_interactions
+
+def synthetic_frames(n_recipes, n_interactions, seed=0):
+    rng = np.random.default_rng(seed)
+    names = [f"Ingredient {i}" for i in range(200)]
+    ingredients = [[{"name": names[j]} for j in rng.choice(200, size=rng.integers(3, 15), replace=False)]
+                   for _ in range(n_recipes)]
+    df_recipes = pd.DataFrame({
+        'recipeId': [f"recipe_{i:07d}" for i in range(n_recipes)],
+        'title': [f"Recipe {i}" for i in range(n_recipes)],
+        'difficulty': rng.choice(["easy", "medium", "hard"], n_recipes),
+        'prepTimeMinutes': rng.integers(5, 60, n_recipes),
+        'ingredients': ingredients,
+    })
+    # Zipf-like popularity: a few recipes collect most interactions.
+    weights = 1.0 / np.arange(1, n_recipes + 1) ** 1.1
+    recipe_idx = rng.choice(n_recipes, size=n_interactions, p=weights / weights.sum())
+    views = rng.integers(1, 100, n_interactions)
+    df_interactions = pd.DataFrame({
+        'interactionId': np.arange(n_interactions),
+        'recipeId': pd.Categorical.from_codes(recipe_idx, df_recipes['recipeId']).astype(object),
+        'views': views,
+        'likes': rng.integers(0, views + 1),
+        'rating': rng.integers(1, 6, n_interactions),
+    })
+    return df_recipes, df_interactions
+
+def run_quietly(fn, *args):
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        fn(*args)
+    return time.perf_counter() - start, out.getvalue()
+
+# -------------------------------------------------------------------
+# MAIN
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time compute_insights against the per-title legacy engine.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="interaction counts")
+    parser.add_argument("--recipes", type=int, default=RECIPES)
+    parser.add_argument("--skip-legacy-above", type=int, default=SKIP_LEGACY_ABOVE,
+                        help="the legacy engine's exploded join needs far more RAM; skip it above this size")
+    args = parser.parse_args()
+
+    # Titles in the export are unique, so both engines must print the same report.
+    _, legacy_out = run_quietly(legacy_compute_insights, *load_export())
+    _, new_out = run_quietly(compute_insights, *load_export())
+    if legacy_out != new_out:
+        raise AssertionError("compute_insights output differs from the legacy engine on firestore_export")
+
+    print(f"{'interactions':>14}{'legacy s':>12}{'single-pass s':>15}{'speedup':>10}")
+    for size in args.sizes:
+        df_recipes, df_interactions = synthetic_frames(args.recipes, size)
+        new_s, _ = run_quietly(compute_insights, df_recipes, df_interactions)
+        if size <= args.skip_legacy_above:
+            legacy_s, _ = run_quietly(legacy_compute_insights, df_recipes, df_interactions)
+            print(f"{size:>14}{legacy_s:>12.3f}{new_s:>15.3f}{legacy_s / new_s:>9.1f}x")
+        else:
+            print(f"{size:>14}{'-':>12}{new_s:>15.3f}{'-':>10}")
@@ -0,0 +1,57 @@
+import argparse
+import os
+
+from analytics import compute_insights
+from benchmark_insights import RECIPES, load_export, run_quietly, synthetic_frames
+from parallel_insights import compute_insights_parallel
+
+# -------------------------------------------------------------------
+# CONFIG
+# -------------------------------------------------------------------
+SIZES = [10_000_000, 100_000_000]
+
+def worker_counts(limit):
+    counts, n = [], 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    return counts + [limit]
+
+# -------------------------------------------------------------------
+# MAIN
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time map-reduce insights for 1..N workers against compute_insights.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="interaction counts")
+    parser.add_argument("--recipes", type=int, default=RECIPES)
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="worker counts to time (default: 1, 2, 4, ... up to the core count)")
+    parser.add_argument("--export-dir", default=None, help="also check the report on this export")
+    parser.add_argument("--spill-dir", default=None, help="where the shared column files go (default: system temp)")
+    args = parser.parse_args()
+    workers = args.workers or worker_counts(os.cpu_count())
+
+    # The parallel report must be the one compute_insights prints.
+    if args.export_dir:
+        frames = load_export(args.export_dir)
+        _, expected = run_quietly(compute_insights, *frames)
+        _, actual = run_quietly(lambda: compute_insights_parallel(*frames, workers=max(workers)))
+        if actual != expected:
+            raise AssertionError(f"parallel insights differ from compute_insights on {args.export_dir}")
+
+    print(f"{'interactions':>14}{'workers':>9}{'seconds':>10}{'speedup':>10}{'vs pandas':>11}")
+    for size in args.sizes:
+        df_recipes, df_interactions = synthetic_frames(args.recipes, size)
+        pandas_s, expected = run_quietly(compute_insights, df_recipes, df_interactions)
+        # Workers get recipe codes as a columnar source hands them over
+        # (analytics.py --insight-workers reads categorical columns).
+        df_interactions['recipeId'] = df_interactions['recipeId'].astype('category')
+        print(f"{size:>14}{'pandas':>9}{pandas_s:>10.3f}{'-':>10}{'1.0x':>11}")
+        base_s = None
+        for n in workers:
+            seconds, actual = run_quietly(lambda: compute_insights_parallel(
+                df_recipes, df_interactions, workers=n, spill_dir=args.spill_dir))
+            if actual != expected:
+                raise AssertionError(f"parallel insights differ from compute_insights ({size} rows, {n} workers)")
+            base_s = base_s or seconds
+            print(f"{size:>14}{n:>9}{seconds:>10.3f}{base_s / seconds:>9.1f}x{pandas_s / seconds:>10.1f}x")
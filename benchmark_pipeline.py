@@ -0,0 +1,221 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from analytics import compute_insights, create_charts_batch, fetch_data, fetch_snapshot
+from fake_firestore import FakeFirestore
+from json_stream import iter_json_array
+from main_file import bulk_write
+from synthetic_data import CSV_SUBDIR, EXPORT_SUBDIR, generate
+from validate_csv_data import validate_streaming
+
+# -------------------------------------------------------------------
+# CONFIG
+# -------------------------------------------------------------------
+WORK_DIR = "benchmark_data"
+RESULTS_FILE = "benchmark_results.json"
+SIZES = [10 ** k for k in range(3, 9)]  # interactions per dataset
+STAGES = ["seed", "extract", "validate", "analyze", "chart"]
+# seed, extract, analyze and chart hold every document in memory (the fake
+# client or the frames); validate streams the CSVs in chunks.
+IN_MEMORY_STAGES = {"seed", "extract", "analyze", "chart"}
+IN_MEMORY_LIMIT = 10_000_000
+TOLERANCE = 0.2        # slower or bigger than baseline by more than this is a regression
+NOISE_FLOOR_S = 0.1    # timings under this are too noisy to flag
+REPEAT = 5             # runs per stage; medians are compared, so one odd run isn't a regression
+SEED = 42
+
+def dataset_shape(size):
+    # Recipes and users grow with the interactions, as a real catalog would.
+    return {"interactions": size, "recipes": max(size // 100, 100), "users": max(size // 20, 50)}
+
+def dataset(work_dir, size):
+    # Generated once per size and reused; the same seed always gives the same files.
+    path = os.path.join(work_dir, f"size-{size}")
+    done = os.path.join(path, ".complete")
+    if not os.path.exists(done):
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate(path, SEED, **dataset_shape(size))
+        open(done, "w").close()
+    return path
+
+# -------------------------------------------------------------------
+# STAGES
+#
+# Each returns (seconds, rows) for the timed part only; loading the inputs
+# a stage needs is outside the timer but inside its peak RSS. Charts count
+# the recipes behind them as rows.
+# -------------------------------------------------------------------
+def stage_seed(path):
+    db = FakeFirestore()
+    export_dir = os.path.join(path, EXPORT_SUBDIR)
+    start, rows = time.perf_counter(), 0
+    for collection, id_field in [("users", "userId"), ("recipes", "recipeId"), ("interactions", "interactionId")]:
+        docs = iter_json_array(os.path.join(export_dir, f"{collection}.json"))
+        rows += bulk_write(db, collection, docs, id_field)["writes"]
+    return time.perf_counter() - start, rows
+
+def stage_extract(path):
+    db = FakeFirestore.from_export(os.path.join(path, EXPORT_SUBDIR))
+    start = time.perf_counter()
+    df_recipes, df_interactions = fetch_data(db)
+    return time.perf_counter() - start, len(df_recipes) + len(df_interactions)
+
+def stage_validate(path):
+    start = time.perf_counter()
+    report = validate_streaming(os.path.join(path, CSV_SUBDIR))
+    rows = sum(table["valid"] + table["invalid"] for table in report.values())
+    return time.perf_counter() - start, rows
+
+def load_frames(path):
+    return fetch_snapshot(os.path.join(path, EXPORT_SUBDIR), os.path.join(path, ".analytics_cache"))
+
+def stage_analyze(path):
+    df_recipes, df_interactions = load_frames(path)
+    start = time.perf_counter()
+    compute_insights(df_recipes, df_interactions)
+    return time.perf_counter() - start, len(df_interactions)
+
+def stage_chart(path):
+    df_recipes, df_interactions = load_frames(path)
+    top_views, top_likes, top_rating, difficulty_dist, ingredient_counts, ingredient_engagement, stats = \
+        compute_insights(df_recipes, df_interactions)
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        create_charts_batch(top_views, top_likes, top_rating, difficulty_dist, ingredient_counts,
+                            ingredient_engagement, stats, output_dir=output_dir)
+        return time.perf_counter() - start, len(stats)
+
+STAGE_FUNCTIONS = {"seed": stage_seed, "extract": stage_extract, "validate": stage_validate,
+                   "analyze": stage_analyze, "chart": stage_chart}
+
+def run_stage(stage, path):
+    # Runs in its own forked process, so ru_maxrss is this stage's peak (plus
+    # the harness's imports, the same for every stage); process pools the
+    # stage starts are reported as children.
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds, rows = STAGE_FUNCTIONS[stage](path)
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"seconds": round(seconds, 4), "rows": rows,
+            "rows_per_s": round(rows / seconds, 1) if seconds > 0 else None,
+            "peak_rss_mb": round(own / 1024, 1), "children_peak_rss_mb": round(children / 1024, 1)}
+
+def measure(stage, path):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as pool:
+        return pool.submit(run_stage, stage, path).result()
+
+def measure_all(stages, path, repeat=REPEAT):
+    # Runs every stage once per round rather than one stage `repeat` times
+    # in a row, so a machine that slows down or speeds up mid-benchmark
+    # shifts all stages alike instead of whichever ran at the time.
+    runs = {stage: [] for stage in stages}
+    for _ in range(repeat):
+        for stage in stages:
+            runs[stage].append(measure(stage, path))
+    return {stage: summarize(stage_runs) for stage, stage_runs in runs.items()}
+
+def summarize(runs):
+    # Every figure is the median over the runs, which neither a slow run
+    # nor a lucky fast one moves; each run's time is kept in "runs".
+    median = lambda key: statistics.median(run[key] for run in runs)
+    seconds, rows = median("seconds"), runs[0]["rows"]
+    return {"seconds": round(seconds, 4), "rows": rows,
+            "rows_per_s": round(rows / seconds, 1) if seconds > 0 else None,
+            "peak_rss_mb": round(median("peak_rss_mb"), 1),
+            "children_peak_rss_mb": round(median("children_peak_rss_mb"), 1),
+            "runs": [run["seconds"] for run in runs]}
+
+# -------------------------------------------------------------------
+# BASELINE COMPARISON
+# -------------------------------------------------------------------
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"created": datetime.now(timezone.utc).isoformat(), "commit": commit or None,
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def peak_mb(result):
+    return max(result["peak_rss_mb"], result["children_peak_rss_mb"])
+
+def compare(results, baseline, tolerance=TOLERANCE, noise_floor=NOISE_FLOOR_S):
+    # Flags every (stage, size) that got slower or bigger than the baseline
+    # by more than `tolerance`.
+    before = {(r["stage"], r["size"]): r for r in baseline["results"] if "seconds" in r}
+    regressions = []
+    for r in results:
+        old = before.get((r["stage"], r["size"]))
+        if old is None or "seconds" not in r:
+            continue
+        r["baseline_seconds"], r["baseline_peak_mb"] = old["seconds"], peak_mb(old)
+        r["time_ratio"] = round(r["seconds"] / old["seconds"], 3) if old["seconds"] else None
+        r["rss_ratio"] = round(peak_mb(r) / peak_mb(old), 3) if peak_mb(old) else None
+        slower = max(r["seconds"], old["seconds"]) >= noise_floor and (r["time_ratio"] or 0) > 1 + tolerance
+        bigger = (r["rss_ratio"] or 0) > 1 + tolerance
+        r["regression"] = [name for name, flagged in [("time", slower), ("memory", bigger)] if flagged]
+        if r["regression"]:
+            regressions.append(r)
+    return regressions
+
+# -------------------------------------------------------------------
+# MAIN
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and size every pipeline stage as the data grows.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="interactions per dataset")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--work-dir", default=WORK_DIR, help="generated datasets are kept here between runs")
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--baseline", default=None, help="an earlier --output to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per stage; medians are recorded")
+    parser.add_argument("--in-memory-limit", type=int, default=IN_MEMORY_LIMIT,
+                        help="skip stages that load every document above this many interactions")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'stage':<10}{'size':>12}{'seconds':>10}{'rows/s':>14}{'peak MB':>10}")
+    for size in args.sizes:
+        start = time.perf_counter()
+        path = dataset(args.work_dir, size)
+        print(f"{'generate':<10}{size:>12}{time.perf_counter() - start:>10.2f}")
+        skipped = [stage for stage in args.stages if stage in IN_MEMORY_STAGES and size > args.in_memory_limit]
+        measured = measure_all([stage for stage in args.stages if stage not in skipped], path, max(args.repeat, 1))
+        for stage in args.stages:
+            if stage in skipped:
+                results.append({"stage": stage, "size": size, "skipped": "above --in-memory-limit"})
+                print(f"{stage:<10}{size:>12}{'skipped':>10}")
+                continue
+            result = {"stage": stage, "size": size, **measured[stage]}
+            results.append(result)
+            print(f"{stage:<10}{size:>12}{result['seconds']:>10.3f}{result['rows_per_s'] or 0:>14,.0f}"
+                  f"{peak_mb(result):>10.1f}")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=4)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        for r in regressions:
+            print(f"REGRESSION {r['stage']} at {r['size']}: {', '.join(r['regression'])} "
+                  f"({r['seconds']}s vs {r['baseline_seconds']}s, {peak_mb(r)} MB vs {r['baseline_peak_mb']} MB)")
+        print(f"{len(regressions)} regression(s) against {args.baseline} at {args.tolerance:.0%} tolerance")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,72 @@
+import argparse
+import copy
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from search_index import EXPORT_DIR, INDEX_DIR, SearchIndex, export_recipes
+
+# -------------------------------------------------------------------
+# CONFIG
+# -------------------------------------------------------------------
+REPEATS = 50
+UPDATES = [1, 100, 10_000]
+QUERIES = [
+    ("one common term", "onion", {}),
+    ("one rare term", "saffron", {}),
+    ("three terms", "spicy paneer curry", {}),
+    ("term + facets", "garlic", {"cuisine": "Italian", "difficulty": "easy", "is_public": True}),
+    ("term + time range", "soup", {"max_time": 30}),
+    ("facets only", "", {"cuisine": ["Thai", "Mexican"], "max_time": 20}),
+]
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+# -------------------------------------------------------------------
+# MAIN
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time search index cold start, queries and incremental updates.")
+    parser.add_argument("--index", default=INDEX_DIR)
+    parser.add_argument("--export-dir", default=EXPORT_DIR, help="used to build the index if it does not exist")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--updates", type=int, nargs="+", default=UPDATES, help="recipes changed per update run")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.index):
+        build_ms, count = timed(SearchIndex(args.index).add, export_recipes(args.export_dir))
+        print(f"Built index of {count} recipes in {build_ms / 1000:.1f}s")
+
+    load_ms, index = timed(SearchIndex, args.index)
+    print(f"Cold start: {load_ms:.0f} ms for {index.live_count} recipes in {len(index.segments)} segment(s)\n")
+
+    print(f"{'query':<20}{'matches':>10}{'first ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for name, text, filters in QUERIES:
+        first_ms, (_, total) = timed(index.search, text, 10, **filters)
+        times = [timed(index.search, text, 10, **filters)[0] for _ in range(args.repeats)]
+        print(f"{name:<20}{total:>10}{first_ms:>10.1f}{np.percentile(times, 50):>9.1f}"
+              f"{np.percentile(times, 95):>9.1f}{max(times):>9.1f}")
+
+    # Updates run against a copy so the benchmark leaves the index unchanged.
+    print(f"\n{'changed recipes':<20}{'update s':>10}{'query p50 ms':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.updates:
+            path = os.path.join(tmp, f"index-{count}")
+            shutil.copytree(args.index, path)
+            copy_index = SearchIndex(path)
+            changed = []
+            for doc in itertools.islice(export_recipes(args.export_dir), count):
+                doc = copy.deepcopy(doc)
+                doc["title"] = f"Updated {doc.get('title')}"
+                doc["updatedAt"] = "2100-01-01T00:00:00+00:00"
+                changed.append(doc)
+            update_ms, _ = timed(copy_index.refresh, changed, complete=False, workers=1)
+            times = [timed(copy_index.search, "spicy paneer curry", 10)[0] for _ in range(args.repeats)]
+            print(f"{count:<20}{update_ms / 1000:>10.2f}{np.percentile(times, 50):>14.1f}")
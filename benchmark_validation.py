@@ -0,0 +1,188 @@
+import argparse
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import validate_csv_data as vectorized
+
+# -------------------------------------------------------------------
+# CONFIG
+# -------------------------------------------------------------------
+DATA_DIR = "normalized_csv_output"
+SIZES = [10_000, 100_000, 1_000_000]
+INVALID_FRACTION = 0.01
+
+# -------------------------------------------------------------------
+# ROW-BY-ROW REFERENCE (the original iterrows engine)
+# -------------------------------------------------------------------
+def is_valid_timestamp(value):
+    if pd.isna(value):
+        return False
+    try:
+        datetime.fromisoformat(str(value).replace("Z", ""))
+        return True
+    except:
+        return False
+
+def fail(reason):
+    return {"valid": False, "reason": reason}
+
+def ok():
+    return {"valid": True, "reason": ""}
+
+def validate_recipes(df):
+    results = []
+
+    for _, row in df.iterrows():
+        required = ["recipeId", "title", "description", "authorId",
+                    "difficulty", "prepTimeMinutes", "cookTimeMinutes",
+                    "totalTimeMinutes", "servings", "createdAt", "updatedAt"]
+
+        for col in required:
+            if pd.isna(row.get(col)):
+                results.append(fail(f"Missing required field: {col}"))
+                break
+        else:
+            if str(row["difficulty"]).lower() not in ["easy", "medium", "hard"]:
+                results.append(fail("Invalid difficulty value"))
+                continue
+            if row["prepTimeMinutes"] <= 0:
+                results.append(fail("prepTimeMinutes must be > 0"))
+                continue
+            if row["cookTimeMinutes"] < 0:
+                results.append(fail("cookTimeMinutes must be >= 0"))
+                continue
+            if row["prepTimeMinutes"] + row["cookTimeMinutes"] != row["totalTimeMinutes"]:
+                results.append(fail("totalTimeMinutes mismatch"))
+                continue
+            if row["servings"] <= 0:
+                results.append(fail("servings must be > 0"))
+                continue
+            if not is_valid_timestamp(row["createdAt"]):
+                results.append(fail("Invalid createdAt timestamp"))
+                continue
+            if not is_valid_timestamp(row["updatedAt"]):
+                results.append(fail("Invalid updatedAt timestamp"))
+                continue
+
+            results.append(ok())
+
+    return results
+
+def validate_ingredients(df):
+    results = []
+    for _, row in df.iterrows():
+        if pd.isna(row.get("recipeId")):
+            results.append(fail("Missing recipeId"))
+            continue
+        if pd.isna(row.get("ingredientId")):
+            results.append(fail("Missing ingredientId"))
+            continue
+        if pd.isna(row.get("name")) or str(row.get("name")).strip() == "":
+            results.append(fail("Invalid ingredient name"))
+            continue
+        if row.get("quantity") is not None and row["quantity"] < 0:
+            results.append(fail("quantity must be >= 0"))
+            continue
+
+        results.append(ok())
+    return results
+
+def validate_steps(df):
+    results = []
+    for _, row in df.iterrows():
+        if row.get("stepNumber") is None or row["stepNumber"] < 1:
+            results.append(fail("stepNumber must be >= 1"))
+            continue
+        if pd.isna(row.get("instruction")) or str(row.get("instruction")).strip() == "":
+            results.append(fail("Invalid instruction"))
+            continue
+        if row.get("approxMinutes") is not None and row["approxMinutes"] < 0:
+            results.append(fail("approxMinutes must be >= 0"))
+            continue
+
+        results.append(ok())
+    return results
+
+def validate_interactions(df):
+    results = []
+    for _, row in df.iterrows():
+        if not is_valid_timestamp(row.get("createdAt")):
+            results.append(fail("Invalid createdAt timestamp"))
+            continue
+
+        rating = row.get("rating")
+        if rating is not None and not pd.isna(rating):
+            if not (1 <= rating <= 5):
+                results.append(fail("rating must be 1–5"))
+                continue
+
+        diff_rating = row.get("difficultyRating")
+        if diff_rating is not None and not pd.isna(diff_rating):
+            if not (1 <= diff_rating <= 5):
+                results.append(fail("difficultyRating must be 1–5"))
+                continue
+
+        results.append(ok())
+    return results
+
+# -------------------------------------------------------------------
+# DATA
+# -------------------------------------------------------------------
+# Values that break one rule each, so every failure branch is exercised.
+CORRUPTIONS = {
+    "recipe.csv": [("title", None), ("difficulty", "impossible"), ("prepTimeMinutes", 0),
+                   ("cookTimeMinutes", -5), ("totalTimeMinutes", 1), ("servings", 0),
+                   ("createdAt", "2025-11"), ("updatedAt", "not a date")],
+    "ingredients.csv": [("recipeId", None), ("ingredientId", None), ("name", "  "), ("quantity", -1)],
+    "steps.csv": [("stepNumber", 0), ("instruction", ""), ("approxMinutes", -3)],
+    "interactions.csv": [("createdAt", "2025-11-20T7:19"), ("rating", 9), ("difficultyRating", 0)],
+}
+
+def scaled_frame(data_dir, name, rows, seed=0):
+    base = pd.read_csv(os.path.join(data_dir, name))
+    df = base.sample(n=rows, replace=True, random_state=seed).reset_index(drop=True)
+    bad = df.sample(frac=INVALID_FRACTION, random_state=seed + 1).index
+    for n, idx in enumerate(bad):
+        col, value = CORRUPTIONS[name][n % len(CORRUPTIONS[name])]
+        df[col] = df[col].astype(object)
+        df.at[idx, col] = value
+    return df
+
+# -------------------------------------------------------------------
+# MAIN
+# -------------------------------------------------------------------
+TABLES = [
+    ("recipe.csv", validate_recipes, vectorized.validate_recipes),
+    ("ingredients.csv", validate_ingredients, vectorized.validate_ingredients),
+    ("steps.csv", validate_steps, vectorized.validate_steps),
+    ("interactions.csv", validate_interactions, vectorized.validate_interactions),
+]
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df)
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the vectorized validators with the row-by-row engine.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--skip-rowwise-above", type=int, default=1_000_000,
+                        help="only time the vectorized engine for larger inputs")
+    args = parser.parse_args()
+
+    print(f"{'table':<18}{'rows':>10}{'rowwise s':>12}{'vectorized s':>14}{'speedup':>10}")
+    for name, rowwise_fn, vectorized_fn in TABLES:
+        for rows in args.sizes:
+            df = scaled_frame(args.data_dir, name, rows)
+            new, new_s = timed(vectorized_fn, df)
+            if rows <= args.skip_rowwise_above:
+                old, old_s = timed(rowwise_fn, df)
+                if old != new:
+                    raise AssertionError(f"{name}: vectorized results differ from row-by-row at {rows} rows")
+                print(f"{name:<18}{rows:>10}{old_s:>12.3f}{new_s:>14.3f}{old_s / new_s:>9.1f}x")
+            else:
+                print(f"{name:<18}{rows:>10}{'-':>12}{new_s:>14.3f}{'-':>10}")
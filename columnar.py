@@ -0,0 +1,402 @@
+import argparse
+import glob
+import json
+import operator
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------
+# Column-per-file storage for DataFrames.
+#
+# <dir>/_schema.json lists the columns; each column lives in its own .npy
+# file so a reader loads (or memory-maps) only the columns it asks for.
+# Strings and nested values (lists/dicts) are dictionary-encoded: the .npy
+# file holds integer codes (-1 for null) and <col>.dict.json the distinct
+# values, one dictionary for the whole table.
+#
+# Integer columns and codes are stored in the narrowest width that holds
+# them. Rows are grouped into contiguous row groups whose per-column
+# min/max/null counts are kept in the schema, so filtered reads skip groups
+# that cannot match and only slice the memory-mapped files for the rest.
+# -------------------------------------------------------------------
+SCHEMA_FILE = "_schema.json"
+FORMAT_VERSION = 2
+ROW_GROUP_SIZE = 1_000_000
+INT_WIDTHS = [np.int8, np.int16, np.int32, np.int64]
+
+FILTER_OPERATORS = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge,
+}
+
+def column_kind(series):
+    if pd.api.types.is_float_dtype(series) and len(series) and series.isna().all():
+        # read_csv gives an all-blank chunk of a text column as float NaN.
+        return "null"
+    if (pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series)
+            or pd.api.types.is_datetime64_dtype(series)):
+        return "numeric"
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred == "empty":
+        return "null"
+    if inferred == "string":
+        return "string"
+    return "json"
+
+def is_null(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+def narrowest_int(low, high):
+    for dtype in INT_WIDTHS:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+def numeric_values(series):
+    # Nullable extension dtypes (Int64, boolean) become plain numpy arrays,
+    # with NaN standing in for missing values.
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and series.hasnans:
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return series.to_numpy()
+
+def json_safe(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+# -------------------------------------------------------------------
+# WRITING
+# -------------------------------------------------------------------
+class TableWriter:
+    # Appends DataFrames in any number of pieces. Row groups are spooled to a
+    # temporary directory as they fill; close() settles each column's final
+    # width and concatenates the groups into one memory-mappable file.
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.tmp = f"{path}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(self.tmp)
+        self.columns = None
+        self.kinds = {}
+        self.dictionaries = {}
+        self.chunks = {}
+        self.row_groups = []
+        self.rows = 0
+        self.pending = []
+        self.pending_rows = 0
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+            for name in self.columns:
+                self.kinds[name] = "null"
+                self.dictionaries[name] = {}
+                self.chunks[name] = []
+        if not len(df):
+            # An empty piece (an export slice with no documents) carries
+            # object dtypes that would widen the columns it is concatenated with.
+            return
+        self.pending.append(df.reindex(columns=self.columns))
+        self.pending_rows += len(df)
+        while self.pending_rows >= self.row_group_size:
+            self._flush(self.row_group_size)
+
+    def _flush(self, size):
+        buffered = pd.concat(self.pending, ignore_index=True) if len(self.pending) > 1 else self.pending[0]
+        group, rest = buffered.iloc[:size], buffered.iloc[size:]
+        self.pending = [rest] if len(rest) else []
+        self.pending_rows = len(rest)
+
+        stats = {}
+        for i, name in enumerate(self.columns):
+            stats[name] = self._write_chunk(i, name, group[name].reset_index(drop=True))
+        self.row_groups.append({"start": self.rows, "rows": len(group), "stats": stats})
+        self.rows += len(group)
+
+    def _write_chunk(self, i, name, series):
+        kind = column_kind(series)
+        if kind == "json" and pd.api.types.infer_dtype(series, skipna=True) in ("integer", "floating",
+                                                                              "mixed-integer-float"):
+            # Object columns of plain numbers (ints with gaps) are numeric.
+            series, kind = pd.to_numeric(series), "numeric"
+        nulls = int(series.isna().sum())
+        chunk = os.path.join(self.tmp, f"c{i:03d}.g{len(self.row_groups):05d}.npy")
+
+        if kind == "null":
+            self.chunks[name].append(("null", len(series)))
+            return {"min": None, "max": None, "nulls": nulls}
+
+        previous = self.kinds[name]
+        if previous == "null" or previous == kind:
+            self.kinds[name] = kind
+        else:
+            # Strings mixed with nested values, or numbers in some row groups
+            # and text in others: every value is kept JSON-encoded, and
+            # close() converts any numeric groups.
+            self.kinds[name] = "json"
+
+        if kind == "numeric":
+            values = numeric_values(series)
+            np.save(chunk, values)
+            self.chunks[name].append(("numeric", chunk))
+            present = values[~pd.isna(values)]
+            if not len(present) or values.dtype.kind == "M":
+                return {"min": None, "max": None, "nulls": nulls}
+            return {"min": json_safe(present.min()), "max": json_safe(present.max()), "nulls": nulls}
+
+        if kind == "json":
+            series = series.map(lambda v: None if is_null(v) else json.dumps(v, default=str))
+        codes, uniques = pd.factorize(series)
+        uniques = np.asarray(uniques, dtype=object)
+        dictionary = self.dictionaries[name]
+        # Local codes are translated into the table-wide dictionary.
+        lookup = np.array([dictionary.setdefault((kind, u), len(dictionary)) for u in uniques] + [-1],
+                          dtype=np.int64)
+        np.save(chunk, lookup[codes])
+        self.chunks[name].append(("codes", chunk))
+        if kind == "string" and len(uniques):
+            return {"min": uniques.min(), "max": uniques.max(), "nulls": nulls}
+        return {"min": None, "max": None, "nulls": nulls}
+
+    def close(self):
+        if self.columns is None:
+            self.columns = []
+        if self.pending_rows or not self.row_groups:
+            if self.pending:
+                self._flush(self.pending_rows)
+        columns = [self._finish_column(i, name) for i, name in enumerate(self.columns)]
+        with open(os.path.join(self.tmp, SCHEMA_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "rows": self.rows, "columns": columns,
+                       "row_groups": self.row_groups}, f, indent=4, ensure_ascii=False, default=str)
+        # Renamed into place, so readers never see a half-written table.
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _finish_column(self, i, name):
+        kind, filename = self.kinds[name], f"c{i:03d}"
+        out = os.path.join(self.tmp, filename + ".npy")
+        chunks = self.chunks[name]
+
+        if kind == "numeric":
+            arrays = [np.load(c, mmap_mode="r") if t == "numeric" else None for t, c in chunks]
+            dtype = np.result_type(*[a.dtype for a in arrays if a is not None])
+            if any(a is None for a in arrays) and dtype.kind in "iub":
+                dtype = np.dtype(np.float64)
+            logical = dtype
+            if dtype.kind in "iu":
+                stats = [g["stats"][name] for g in self.row_groups if g["stats"][name]["min"] is not None]
+                low = min((s["min"] for s in stats), default=0)
+                high = max((s["max"] for s in stats), default=0)
+                dtype = np.dtype(narrowest_int(low, high))
+        else:
+            dictionary = self.dictionaries[name]
+            arrays = []
+            for chunk_type, chunk in chunks:
+                if chunk_type == "numeric":
+                    codes, uniques = pd.factorize(np.load(chunk))
+                    lookup = np.array([dictionary.setdefault(("json", json.dumps(json_safe(u), default=str)),
+                                                             len(dictionary)) for u in uniques] + [-1], dtype=np.int64)
+                    np.save(chunk, lookup[codes])
+                    chunk_type = "codes"
+                arrays.append(np.load(chunk, mmap_mode="r") if chunk_type == "codes" else None)
+            if kind == "json":
+                # Min/max of json values are not comparable; filters must not prune on them.
+                for group in self.row_groups:
+                    group["stats"][name].update(min=None, max=None)
+            dtype = logical = np.dtype(narrowest_int(-1, max(len(dictionary) - 1, 0)))
+            values = [None] * len(dictionary)
+            for (value_kind, value), code in dictionary.items():
+                # A column that turned json part-way encodes its earlier strings too.
+                values[code] = json.dumps(value) if kind == "json" and value_kind == "string" else value
+            with open(os.path.join(self.tmp, filename + ".dict.json"), "w", encoding="utf-8") as f:
+                f.write(json.dumps(values, ensure_ascii=False))
+
+        target = np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=(self.rows,))
+        start = 0
+        for (chunk_type, chunk), array in zip(chunks, arrays):
+            n = len(array) if array is not None else chunk
+            if array is None:
+                target[start:start + n] = -1 if kind != "numeric" else np.datetime64("NaT") if dtype.kind == "M" else np.nan
+            else:
+                target[start:start + n] = array
+                del array
+                os.remove(chunk)
+            start += n
+        target.flush()
+        del target
+        return {"name": name, "kind": "string" if kind == "null" else kind, "dtype": str(logical), "file": filename}
+
+def write_frame(df, path, row_group_size=ROW_GROUP_SIZE):
+    writer = TableWriter(path, row_group_size)
+    writer.append(df)
+    writer.close()
+
+def write_frames(frames, path, row_group_size=ROW_GROUP_SIZE):
+    writer = TableWriter(path, row_group_size)
+    for df in frames:
+        writer.append(df)
+    writer.close()
+
+# -------------------------------------------------------------------
+# READING
+# -------------------------------------------------------------------
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE), encoding="utf-8") as f:
+        schema = json.load(f)
+    # Version 1 tables have no row groups: treat them as a single group.
+    schema.setdefault("row_groups", [{"start": 0, "rows": schema["rows"], "stats": {}}])
+    return schema
+
+def read_dictionary(path, column):
+    with open(os.path.join(path, column["file"] + ".dict.json"), encoding="utf-8") as f:
+        uniques = json.load(f)
+    # The trailing None is what code -1 (null) resolves to.
+    lookup = np.empty(len(uniques) + 1, dtype=object)
+    if column["kind"] == "json":
+        # Assigned one by one so numpy does not broadcast nested lists.
+        for i, value in enumerate(uniques):
+            lookup[i] = json.loads(value)
+    else:
+        lookup[:-1] = uniques
+    lookup[-1] = None
+    return lookup
+
+def read_column(path, column, mmap=True, rows=None, compact=True, categorical=False):
+    values = np.load(os.path.join(path, column["file"] + ".npy"), mmap_mode="r" if mmap else None)
+    if rows is not None:
+        values = values[rows]
+    if column["kind"] == "numeric":
+        if not compact and column.get("dtype") and values.dtype != np.dtype(column["dtype"]):
+            values = values.astype(column["dtype"])
+        return values
+    lookup = read_dictionary(path, column)
+    if categorical and column["kind"] == "string":
+        return pd.Categorical.from_codes(np.asarray(values, dtype=np.int64), lookup[:-1])
+    return lookup[values]
+
+def group_matches(stats, filters):
+    # False only when the row group's min/max prove no row can match.
+    for name, op, value in filters:
+        s = stats.get(name)
+        if not s or s["min"] is None:
+            continue
+        try:
+            if op == "==" and not s["min"] <= value <= s["max"]:
+                return False
+            if op == "in" and not any(s["min"] <= v <= s["max"] for v in value):
+                return False
+            if op in ("<", "<=") and not FILTER_OPERATORS[op](s["min"], value):
+                return False
+            if op in (">", ">=") and not FILTER_OPERATORS[op](s["max"], value):
+                return False
+        except TypeError:
+            continue
+    return True
+
+def selected_rows(schema, filters):
+    groups = [g for g in schema["row_groups"] if group_matches(g["stats"], filters)]
+    if len(groups) == len(schema["row_groups"]):
+        return None, schema["rows"]
+    ranges = [np.arange(g["start"], g["start"] + g["rows"]) for g in groups]
+    rows = np.concatenate(ranges) if ranges else np.array([], dtype=np.int64)
+    return rows, len(rows)
+
+def read_frame(path, columns=None, mmap=True, filters=None, compact=True, categorical=False):
+    # Integer columns come back in their stored (narrow) width when compact;
+    # aggregations upcast, but pass compact=False before doing row-wise
+    # arithmetic that could overflow. categorical=True keeps string columns
+    # as codes plus dictionary instead of one object per row.
+    schema = read_schema(path)
+    filters = filters or []
+    wanted = [c for c in schema["columns"] if columns is None or c["name"] in columns]
+    rows, count = selected_rows(schema, filters)
+    index = pd.RangeIndex(count) if rows is None else pd.Index(rows)
+    # copy=False keeps memory-mapped numeric columns backed by the files.
+    df = pd.DataFrame({c["name"]: read_column(path, c, mmap, rows, compact, categorical) for c in wanted},
+                      index=index, copy=False)
+    if filters:
+        by_name = {c["name"]: c for c in schema["columns"]}
+        mask = np.ones(len(df), dtype=bool)
+        for name, op, value in filters:
+            series = df[name] if name in df.columns else pd.Series(
+                read_column(path, by_name[name], mmap, rows), index=index)
+            mask &= (series.isin(value) if op == "in" else FILTER_OPERATORS[op](series, value)).to_numpy(dtype=bool)
+        df = df[mask]
+    return df
+
+def iter_row_groups(path, columns=None, compact=True):
+    # One frame per row group, indexed by table row number like read_csv chunks.
+    schema = read_schema(path)
+    wanted = [c for c in schema["columns"] if columns is None or c["name"] in columns]
+    for group in schema["row_groups"]:
+        rows = slice(group["start"], group["start"] + group["rows"])
+        yield pd.DataFrame({c["name"]: read_column(path, c, True, rows, compact) for c in wanted},
+                           index=pd.RangeIndex(rows.start, rows.stop), copy=False)
+
+def is_table(path):
+    return os.path.exists(os.path.join(path, SCHEMA_FILE))
+
+# -------------------------------------------------------------------
+# TABLE OR CSV READERS
+#
+# A normalized table is read from a columnar directory named after the CSV
+# (e.g. recipe/ next to recipe.csv) when one exists, otherwise from the CSV.
+# Either way only the requested columns are loaded.
+# -------------------------------------------------------------------
+CSV_CHUNK_SIZE = 100_000  # rows per chunk when iter_table reads a CSV
+
+def table_path(data_dir, filename):
+    path = os.path.join(data_dir, os.path.splitext(filename)[0])
+    return path if is_table(path) else os.path.join(data_dir, filename)
+
+def as_text(df):
+    # Columnar tables keep numbers numeric; match read_csv(dtype=str).
+    for name in df.columns:
+        if not pd.api.types.is_string_dtype(df[name]):
+            df[name] = df[name].astype(str).where(df[name].notna(), None)
+    return df
+
+def read_table(path, columns=None):
+    if is_table(path):
+        return read_frame(path, columns, compact=False)
+    return pd.read_csv(path, usecols=None if columns is None else lambda c: c in columns)
+
+def iter_table(path, chunksize=CSV_CHUNK_SIZE, columns=None, text=False):
+    if is_table(path):
+        # Row groups play the part of chunks.
+        for chunk in iter_row_groups(path, columns, compact=False):
+            yield as_text(chunk) if text else chunk
+        return
+    yield from pd.read_csv(path, usecols=None if columns is None else lambda c: c in columns,
+                           dtype=str if text else None, chunksize=chunksize)
+
+# -------------------------------------------------------------------
+# CSV CONVERSION
+# -------------------------------------------------------------------
+def convert_csv_dir(data_dir, out_dir, chunksize=ROW_GROUP_SIZE, row_group_size=ROW_GROUP_SIZE):
+    # normalized_csv_output/<table>.csv -> <out_dir>/<table>/
+    os.makedirs(out_dir, exist_ok=True)
+    for csv_path in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+        table = os.path.splitext(os.path.basename(csv_path))[0]
+        start = time.perf_counter()
+        write_frames(pd.read_csv(csv_path, chunksize=chunksize), os.path.join(out_dir, table), row_group_size)
+        size = sum(os.path.getsize(p) for p in glob.glob(os.path.join(out_dir, table, "*")))
+        print(f" {table}: {os.path.getsize(csv_path)} -> {size} bytes in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert normalized CSV tables to columnar tables.")
+    parser.add_argument("data_dir", nargs="?", default="normalized_csv_output")
+    parser.add_argument("out_dir", nargs="?", default="normalized_columnar")
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    convert_csv_dir(args.data_dir, args.out_dir, args.row_group_size, args.row_group_size)
+    print(" Columnar tables written to", args.out_dir)
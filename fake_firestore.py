@@ -0,0 +1,313 @@
+import bisect
+import copy
+import functools
+import operator
+import os
+import random
+import threading
+import time
+
+from google.api_core import exceptions as gexc
+
+# -------------------------------------------------------------------
+# In-process stand-in for firestore.Client
+#
+# Implements the subset of the client API used by main_file.py and
+# analytics.py so seeding and extraction can run (and be benchmarked)
+# offline. Writes and reads are counted, and an optional per-commit
+# latency and failure rate simulate a remote backend.
+# -------------------------------------------------------------------
+class FakeSnapshot:
+    def __init__(self, doc_id, data, reference=None):
+        self.id = doc_id
+        self._data = data
+        self.reference = reference
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    def set(self, data):
+        self._client._commit([("set", self._collection, self.id, data)])
+
+    def delete(self):
+        self._client._commit([("delete", self._collection, self.id, None)])
+
+    def get(self):
+        self._client._simulate_rpc()
+        with self._client._lock:
+            data = self._client._store.get(self._collection, {}).get(self.id)
+            self._client.reads += 1
+        return FakeSnapshot(self.id, copy.deepcopy(data), self)
+
+
+OPERATORS = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge, "in": lambda a, b: a in b,
+}
+DOCUMENT_ID = "__name__"
+
+
+@functools.total_ordering
+class Descending:
+    # Inverts a value's ordering, so a sort key mixing ascending and
+    # descending fields still sorts, bisects and compares ascending.
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class FakeQuery:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    # Immutable like the real Query: every builder returns a modified copy.
+    def __init__(self, client, collection, fields=None, filters=(), orders=(), limit=None,
+                 start=None, end=None):
+        self._client = client
+        self._collection = collection
+        self._fields = fields
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._start = start
+        self._end = end
+
+    def _copy(self, **changes):
+        state = {"fields": self._fields, "filters": self._filters, "orders": self._orders,
+                 "limit": self._limit, "start": self._start, "end": self._end}
+        state.update(changes)
+        return FakeQuery(self._client, self._collection, **state)
+
+    def select(self, field_paths):
+        return self._copy(fields=tuple(field_paths))
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        # orders holds (field, descending) pairs.
+        if direction not in (self.ASCENDING, self.DESCENDING):
+            raise ValueError(f"direction must be {self.ASCENDING!r} or {self.DESCENDING!r}, got {direction!r}")
+        return self._copy(orders=self._orders + ((field_path, direction == self.DESCENDING),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def _cursor(self, document_fields_or_snapshot):
+        if isinstance(document_fields_or_snapshot, FakeSnapshot):
+            return self._sort_key(document_fields_or_snapshot.id, document_fields_or_snapshot._data or {})
+        if isinstance(document_fields_or_snapshot, dict):
+            values = [document_fields_or_snapshot.get(f) for f, _ in self._orders]
+        else:
+            values = list(document_fields_or_snapshot)
+        return tuple(Descending(value) if descending else value
+                     for value, (_, descending) in zip(values, self._orders))
+
+    def start_at(self, cursor):
+        return self._copy(start=(self._cursor(cursor), True))
+
+    def start_after(self, cursor):
+        return self._copy(start=(self._cursor(cursor), False))
+
+    def end_at(self, cursor):
+        return self._copy(end=(self._cursor(cursor), False))
+
+    def end_before(self, cursor):
+        return self._copy(end=(self._cursor(cursor), True))
+
+    def _value(self, doc_id, data, field):
+        return doc_id if field == DOCUMENT_ID else data.get(field)
+
+    def _sort_key(self, doc_id, data):
+        # Results are ordered by the requested fields, then by document ID in
+        # the direction of the last one, as Firestore does. Descending values
+        # are wrapped so the keys, and cursors made from them, sort ascending.
+        orders = self._orders
+        if not orders or orders[-1][0] != DOCUMENT_ID:
+            orders += ((DOCUMENT_ID, bool(orders) and orders[-1][1]),)
+        return tuple(Descending(self._value(doc_id, data, f)) if descending else self._value(doc_id, data, f)
+                     for f, descending in orders)
+
+    def _matches(self, doc_id, data):
+        for field, op, value in self._filters:
+            actual = self._value(doc_id, data, field)
+            if actual is None or not OPERATORS[op](actual, value):
+                return False
+        # Like Firestore, documents missing an ordered field are left out.
+        return all(f == DOCUMENT_ID or f in data for f, _ in self._orders)
+
+    def _sorted_rows(self):
+        # Sorted matches are cached per store version, so paging through a
+        # large collection costs a binary search per page, not a full sort.
+        client = self._client
+        cache_key = (self._collection, self._filters, self._orders, client._version)
+        with client._lock:
+            if any(key[-1] != client._version for key in client._query_cache):
+                client._query_cache.clear()
+            cached = client._query_cache.get(cache_key)
+            if cached is None:
+                docs = client._store.get(self._collection, {})
+                rows = sorted(((self._sort_key(doc_id, data), doc_id, data) for doc_id, data in docs.items()
+                               if self._matches(doc_id, data)), key=lambda row: row[0])
+                cached = ([row[0] for row in rows], rows)
+                client._query_cache[cache_key] = cached
+        return cached
+
+    def stream(self):
+        self._client._simulate_rpc()
+        keys, rows = self._sorted_rows()
+        i = 0
+        if self._start:
+            cursor, inclusive = self._start
+            i = bisect.bisect_left(keys, cursor)
+            if not inclusive:
+                while i < len(keys) and keys[i][:len(cursor)] == cursor:
+                    i += 1
+        results = []
+        while i < len(rows) and (self._limit is None or len(results) < self._limit):
+            if self._end:
+                cursor, before = self._end
+                prefix = keys[i][:len(cursor)]
+                if prefix > cursor or (prefix == cursor and before):
+                    break
+            results.append(rows[i])
+            i += 1
+        with self._client._lock:
+            # Firestore bills at least one read per query, even an empty one.
+            self._client.reads += max(1, len(results))
+        for _, doc_id, data in results:
+            if self._fields is not None:
+                data = {f: data[f] for f in self._fields if f in data}
+            yield FakeSnapshot(doc_id, copy.deepcopy(data),
+                               FakeDocumentReference(self._client, self._collection, doc_id))
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeQueryPartition:
+    def __init__(self, client, collection, start_at, end_at):
+        self._client = client
+        self._collection = collection
+        self.start_at = start_at
+        self.end_at = end_at
+
+    def query(self):
+        query = FakeQuery(self._client, self._collection, orders=((DOCUMENT_ID, False),))
+        if self.start_at is not None:
+            query = query.start_at((self.start_at,))
+        if self.end_at is not None:
+            query = query.end_before((self.end_at,))
+        return query
+
+
+class FakeCollectionGroup(FakeQuery):
+    def get_partitions(self, partition_count):
+        # Split the sorted document IDs into contiguous, roughly equal ranges.
+        with self._client._lock:
+            ids = sorted(self._client._store.get(self._collection, {}))
+        bounds = [ids[len(ids) * i // partition_count] for i in range(1, partition_count)] if ids else []
+        bounds = sorted(set(bounds))
+        for start, end in zip([None] + bounds, bounds + [None]):
+            yield FakeQueryPartition(self._client, self._collection, start, end)
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self._client, self.id, doc_id)
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data):
+        self._writes.append(("set", reference._collection, reference.id, data))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference._collection, reference.id, None))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self):
+        self._client._commit(self._writes)
+
+
+class FakeFirestore:
+    def __init__(self, latency_ms=0.0, failure_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+        self._store = {}
+        self._version = 0
+        self._query_cache = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def collection_group(self, collection_id):
+        return FakeCollectionGroup(self, collection_id)
+
+    @classmethod
+    def from_export(cls, export_dir, **kwargs):
+        # Preload the firestore_export snapshots, keyed like the live collections.
+        from json_stream import iter_json_array
+        client = cls(**kwargs)
+        for collection, id_field in [("recipes", "recipeId"), ("interactions", "interactionId"),
+                                     ("users", "userId")]:
+            path = os.path.join(export_dir, f"{collection}.json")
+            if os.path.exists(path):
+                client._store[collection] = {doc[id_field]: doc for doc in iter_json_array(path)}
+        return client
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def _simulate_rpc(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        if self.failure_rate:
+            with self._lock:
+                failed = self._rng.random() < self.failure_rate
+            if failed:
+                raise gexc.ServiceUnavailable("fake backend unavailable")
+
+    def _commit(self, writes):
+        self._simulate_rpc()
+        with self._lock:
+            for op, collection, doc_id, data in writes:
+                docs = self._store.setdefault(collection, {})
+                if op == "set":
+                    docs[doc_id] = copy.deepcopy(data)
+                else:
+                    docs.pop(doc_id, None)
+            self.writes += len(writes)
+            self.commits += 1
+            self._version += 1
@@ -0,0 +1,188 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import instrumentation
+from json_stream import iter_json_array
+from main_file import BATCH_SIZE, CONCURRENCY, MAX_RETRIES, batch_size_arg, bulk_write, init_firestore, report_writes
+
+# -------------------------------------------------------------------
+# DIFF-BASED SYNC
+#
+# Makes Firestore match a local source (the firestore_export snapshots or
+# the seed generators) by writing only the difference. A SQLite manifest
+# keeps the content hash of every document as it was last written:
+#   added      IDs the manifest has never seen         -> set
+#   changed    IDs whose hash differs                  -> set
+#   deleted    manifest IDs missing from the source    -> delete
+#   unchanged  everything else                         -> nothing
+# Nothing is read back from Firestore, so a re-run over unchanged data costs
+# no reads and no writes. Each batch commit (up to 500 writes) goes into the
+# manifest as soon as it has committed; a run that dies part-way redoes at
+# most the batches that were in flight, and writing a document twice is
+# harmless. The manifest describes one target database: edits made to
+# Firestore behind its back are not seen, and --rebuild-manifest rewrites
+# everything.
+# -------------------------------------------------------------------
+MANIFEST_PATH = ".sync_manifest.sqlite"
+METRICS_PATH = "metrics/sync"
+EXPORT_DIR = "firestore_export"
+DIFF_BATCH = 20_000
+COLLECTIONS = [("users", "userId"), ("recipes", "recipeId"), ("interactions", "interactionId")]
+# The seed generators stamp the clock on every run, so these are left out
+# of their hashes; the export's timestamps are data and are hashed.
+CLOCK_FIELDS = ("createdAt", "updatedAt")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    collection TEXT, docId TEXT, hash TEXT, PRIMARY KEY (collection, docId));
+CREATE TEMP TABLE IF NOT EXISTS batch_docs (docId TEXT PRIMARY KEY, hash TEXT);
+CREATE TEMP TABLE IF NOT EXISTS seen (docId TEXT PRIMARY KEY);
+"""
+
+# ---------------- MANIFEST ----------------
+def open_manifest(path=MANIFEST_PATH, rebuild=False):
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if rebuild and os.path.exists(path):
+            os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def canonical(value):
+    # Timestamps hash the same whether they arrive as datetimes or ISO strings.
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+def content_hash(doc, ignore=()):
+    data = {key: value for key, value in doc.items() if key not in ignore}
+    text = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=canonical)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def diff_batch(conn, collection, chunk, id_field, ignore=()):
+    # Returns the added and changed documents of one batch (a repeated ID
+    # keeps its last version) and the hashes to record once they're written.
+    latest = {doc[id_field]: doc for doc in chunk}
+    hashes = {doc_id: content_hash(doc, ignore) for doc_id, doc in latest.items()}
+    conn.execute("DELETE FROM batch_docs")
+    conn.executemany("INSERT INTO batch_docs VALUES (?, ?)", hashes.items())
+    conn.execute("INSERT OR IGNORE INTO seen SELECT docId FROM batch_docs")
+    added, changed = [], []
+    for doc_id, known in conn.execute(
+            "SELECT b.docId, m.hash IS NOT NULL FROM batch_docs b "
+            "LEFT JOIN manifest m ON m.collection = ? AND m.docId = b.docId "
+            "WHERE m.hash IS NULL OR m.hash != b.hash", (collection,)):
+        (changed if known else added).append(latest[doc_id])
+    return added, changed, hashes
+
+# ---------------- SYNC ----------------
+def sync_collection(db, conn, collection, docs, id_field, ignore=(), delete=True, prepare=None,
+                    batch_size=BATCH_SIZE, concurrency=CONCURRENCY, max_retries=MAX_RETRIES,
+                    diff_batch_size=DIFF_BATCH):
+    # `docs` is the whole collection as it should be; `prepare` turns a
+    # document into what is written (the hash is of the document as given).
+    start = time.perf_counter()
+    counts = dict.fromkeys(["added", "changed", "deleted", "unchanged"], 0)
+    totals = dict.fromkeys(["writes", "deletes", "batches", "retries"], 0)
+
+    def push(chunk, on_commit, deleting=False):
+        stats = bulk_write(db, collection, chunk, id_field, batch_size=batch_size, concurrency=concurrency,
+                           max_retries=max_retries, delete=deleting, on_commit=on_commit)
+        totals["deletes" if deleting else "writes"] += stats["writes"]
+        totals["batches"] += stats["batches"]
+        totals["retries"] += stats["retries"]
+
+    conn.execute("DELETE FROM seen")
+    docs = iter(docs)
+    while chunk := list(itertools.islice(docs, diff_batch_size)):
+        added, changed, hashes = diff_batch(conn, collection, chunk, id_field, ignore)
+        pending = added + changed
+
+        def written(batch, hashes=hashes):
+            conn.executemany("INSERT OR REPLACE INTO manifest VALUES (?, ?, ?)",
+                             ((collection, doc[id_field], hashes[doc[id_field]]) for doc in batch))
+            conn.commit()
+        if pending:
+            push(map(prepare, pending) if prepare else pending, written)
+        conn.commit()
+        counts["added"] += len(added)
+        counts["changed"] += len(changed)
+        counts["unchanged"] += len(hashes) - len(pending)
+
+    if delete:
+        gone = [row[0] for row in conn.execute(
+            "SELECT docId FROM manifest WHERE collection = ? AND docId NOT IN (SELECT docId FROM seen)",
+            (collection,))]
+
+        def removed(batch):
+            conn.executemany("DELETE FROM manifest WHERE collection = ? AND docId = ?",
+                             ((collection, doc[id_field]) for doc in batch))
+            conn.commit()
+        push(({id_field: doc_id} for doc_id in gone), removed, deleting=True)
+        counts["deleted"] = len(gone)
+
+    elapsed = time.perf_counter() - start
+    return {**counts, **totals, "seconds": round(elapsed, 3),
+            "writes_per_sec": round(totals["writes"] / elapsed, 1) if elapsed > 0 else 0.0}
+
+def sync_writer(conn, ignore=CLOCK_FIELDS, **options):
+    # A main_file writer: seed_users/seed_recipes/seed_interactions hand it
+    # each collection whole and only the difference is written.
+    def writer(db, collection, docs, id_field):
+        return sync_collection(db, conn, collection, docs, id_field, ignore=ignore, **options)
+    return writer
+
+def restore_timestamps(doc):
+    # The export holds ISO strings where live documents hold timestamps.
+    return {key: datetime.fromisoformat(value) if key in CLOCK_FIELDS and isinstance(value, str) else value
+            for key, value in doc.items()}
+
+def sync_export(db, conn, export_dir=EXPORT_DIR, as_string=False, **options):
+    results = {}
+    for collection, id_field in COLLECTIONS:
+        path = os.path.join(export_dir, f"{collection}.json")
+        if not os.path.exists(path):
+            continue
+        with instrumentation.stage(f"sync_{collection}"):
+            results[collection] = sync_collection(db, conn, collection, iter_json_array(path), id_field,
+                                                  prepare=None if as_string else restore_timestamps, **options)
+        report_writes(collection, results[collection])
+    return results
+
+# -------------------------------------------------------------------
+# MAIN
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write only the documents that differ from the last sync.")
+    parser.add_argument("--export-dir", default=EXPORT_DIR)
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="content hashes of what the target holds")
+    parser.add_argument("--rebuild-manifest", action="store_true", help="forget the manifest and rewrite everything")
+    parser.add_argument("--no-delete", action="store_true", help="keep documents missing from the export")
+    parser.add_argument("--batch-size", type=batch_size_arg, default=BATCH_SIZE,
+                        help=f"writes per batch commit, at most {BATCH_SIZE}")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES)
+    parser.add_argument("--fake", action="store_true", help="sync an in-process fake client instead of Firestore")
+    parser.add_argument("--metrics", default=METRICS_PATH, help="write stage metrics to <path>.json and <path>.prom")
+    args = parser.parse_args()
+    instrumentation.configure("sync")
+
+    if args.fake:
+        from fake_firestore import FakeFirestore
+        # The fake starts empty in every process, so its manifest must too.
+        db, manifest = FakeFirestore(), ":memory:"
+    else:
+        db, manifest = init_firestore(), args.manifest
+
+    conn = open_manifest(manifest, args.rebuild_manifest)
+    try:
+        sync_export(db, conn, args.export_dir, as_string=args.fake, delete=not args.no_delete,
+                    batch_size=args.batch_size, concurrency=args.concurrency, max_retries=args.max_retries)
+    finally:
+        conn.close()
+    print(" Metrics written to", " and ".join(instrumentation.write(args.metrics)))
@@ -0,0 +1,277 @@
+from collections import Counter, defaultdict
+import json
+import math
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+import instrumentation
+from analytics import CACHE_DIR, prepare_interactions, recipe_stats, report_insights
+from json_stream import iter_json_array
+
+# -------------------------------------------------------------------
+# INCREMENTAL ANALYTICS
+#
+# The aggregates compute_insights derives from full scans are kept in a
+# SQLite file between runs:
+#   recipe_agg          per-recipe sums and counts (aggregate_interactions)
+#   ingredient_agg      per-ingredient occurrences and engagement sums
+#   interaction_ledger  each interaction's last counted contribution
+#   meta                updatedAt watermarks and the prep-time/likes co-moments
+# A run reads only documents changed at or after the watermark. A changed
+# interaction first has its ledgered contribution subtracted, so updates are
+# merged exactly and re-reading a document is harmless. Deleted documents
+# are not seen by a watermark and need a full rebuild (--rebuild).
+# -------------------------------------------------------------------
+STATE_PATH = os.path.join(CACHE_DIR, "incremental.sqlite")
+BATCH_SIZE = 100_000
+RECIPE_COLUMNS = ['recipeId', 'title', 'difficulty', 'prepTimeMinutes', 'ingredients']
+INTERACTION_COLUMNS = ['interactionId', 'recipeId', 'views', 'likes', 'rating']
+MOMENTS = ['n', 'sx', 'sy', 'sxx', 'syy', 'sxy', 'likes_total']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS recipes (
+    recipeId TEXT PRIMARY KEY, title TEXT, difficulty TEXT, prepTimeMinutes NUMERIC);
+CREATE TABLE IF NOT EXISTS recipe_ingredients (
+    recipeId TEXT, position INTEGER, name TEXT, PRIMARY KEY (recipeId, position));
+CREATE TABLE IF NOT EXISTS recipe_agg (
+    recipeId TEXT PRIMARY KEY, views NUMERIC, likes NUMERIC, rating_sum NUMERIC,
+    rating_count INTEGER, interactions INTEGER, row_count INTEGER);
+CREATE TABLE IF NOT EXISTS ingredient_agg (
+    name TEXT PRIMARY KEY, occurrences INTEGER, engagement NUMERIC, row_count INTEGER);
+CREATE TABLE IF NOT EXISTS interaction_ledger (
+    interactionId TEXT PRIMARY KEY, recipeId TEXT, views NUMERIC, likes NUMERIC, rating NUMERIC);
+"""
+
+# ---------------- STATE ----------------
+def open_state(path=STATE_PATH, rebuild=False):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if rebuild and os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def read_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+def write_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+def with_keys(conn, keys):
+    # Stages the keys of a batch in a temp table so lookups are one join.
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch_keys (key TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM batch_keys")
+    conn.executemany("INSERT OR IGNORE INTO batch_keys VALUES (?)", ((k,) for k in keys))
+
+def recipe_state(conn, recipe_ids):
+    # Everything a recipe contributes to the global aggregates.
+    with_keys(conn, recipe_ids)
+    state = {}
+    for rid, present, prep, likes, rating_sum, rows in conn.execute(
+            "SELECT k.key, r.recipeId IS NOT NULL, r.prepTimeMinutes, a.likes, a.rating_sum, a.row_count "
+            "FROM batch_keys k LEFT JOIN recipes r ON r.recipeId = k.key "
+            "LEFT JOIN recipe_agg a ON a.recipeId = k.key"):
+        state[rid] = {"present": bool(present), "prep": prep, "likes": likes or 0,
+                      "engagement": (likes or 0) + (rating_sum or 0), "rows": rows or 0, "names": []}
+    for rid, name in conn.execute(
+            "SELECT i.recipeId, i.name FROM recipe_ingredients i JOIN batch_keys k ON i.recipeId = k.key "
+            "ORDER BY i.recipeId, i.position"):
+        state[rid]["names"].append(name)
+    return state
+
+def apply_contributions(conn, state, moments, sign):
+    # Adds (sign=+1) or removes (sign=-1) the recipes' share of the
+    # co-moments and of every ingredient aggregate they appear in.
+    ingredients = defaultdict(lambda: [0, 0.0, 0])
+    for s in state.values():
+        moments['likes_total'] += sign * s['likes']
+        if s['present'] and s['rows'] > 0 and s['prep'] is not None:
+            x, y = float(s['prep']), s['likes'] / s['rows']
+            for key, value in (('n', 1), ('sx', x), ('sy', y), ('sxx', x * x), ('syy', y * y), ('sxy', x * y)):
+                moments[key] += sign * value
+        for name in s['names']:
+            entry = ingredients[name]
+            entry[0] += sign
+            entry[1] += sign * s['engagement']
+            entry[2] += sign * s['rows']
+    conn.executemany(
+        "INSERT INTO ingredient_agg VALUES (?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+        "occurrences = occurrences + excluded.occurrences, engagement = engagement + excluded.engagement, "
+        "row_count = row_count + excluded.row_count",
+        ((name, *values) for name, values in ingredients.items()))
+    conn.execute("DELETE FROM ingredient_agg WHERE occurrences <= 0")
+
+def merge_recipes(conn, df, moments):
+    df = df.drop_duplicates('recipeId', keep='last')
+    ids = df['recipeId'].tolist()
+    apply_contributions(conn, recipe_state(conn, ids), moments, -1)
+    rows = df[['recipeId', 'title', 'difficulty', 'prepTimeMinutes']]
+    conn.executemany("INSERT OR REPLACE INTO recipes VALUES (?, ?, ?, ?)",
+                     rows.astype(object).where(rows.notna(), None).itertuples(index=False))
+    conn.executemany("DELETE FROM recipe_ingredients WHERE recipeId = ?", ((rid,) for rid in ids))
+    conn.executemany("INSERT INTO recipe_ingredients VALUES (?, ?, ?)",
+                     ((rid, pos, ing['name']) for rid, ings in zip(ids, df['ingredients'])
+                      if isinstance(ings, list) for pos, ing in enumerate(ings) if ing.get('name') is not None))
+    apply_contributions(conn, recipe_state(conn, ids), moments, +1)
+
+def merge_interactions(conn, df, moments):
+    df = prepare_interactions(df.drop_duplicates('interactionId', keep='last'))
+    with_keys(conn, df['interactionId'])
+    old = pd.read_sql_query(
+        "SELECT l.* FROM interaction_ledger l JOIN batch_keys k ON l.interactionId = k.key", conn)
+    touched = set(df['recipeId'].dropna()) | set(old['recipeId'].dropna())
+    apply_contributions(conn, recipe_state(conn, touched), moments, -1)
+
+    # Per-recipe delta: new contributions minus the ones they replace.
+    def per_recipe(frame):
+        return frame.groupby('recipeId').agg(views=('views', 'sum'), likes=('likes', 'sum'),
+                                             rating_sum=('rating', 'sum'), n=('rating', 'size'))
+    delta = per_recipe(df).sub(per_recipe(old), fill_value=0)
+    conn.executemany(
+        "INSERT INTO recipe_agg VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(recipeId) DO UPDATE SET "
+        "views = views + excluded.views, likes = likes + excluded.likes, "
+        "rating_sum = rating_sum + excluded.rating_sum, rating_count = rating_count + excluded.rating_count, "
+        "interactions = interactions + excluded.interactions, row_count = row_count + excluded.row_count",
+        ((rid, r.views, r.likes, r.rating_sum, int(r.n), int(r.n), int(r.n))
+         for rid, r in zip(delta.index, delta.itertuples(index=False))))
+    conn.execute("DELETE FROM recipe_agg WHERE row_count <= 0")
+    rows = df[INTERACTION_COLUMNS]
+    conn.executemany("INSERT OR REPLACE INTO interaction_ledger VALUES (?, ?, ?, ?, ?)",
+                     rows.astype(object).where(rows.notna(), None).itertuples(index=False))
+    apply_contributions(conn, recipe_state(conn, touched), moments, +1)
+
+# ---------------- CHANGE FEEDS ----------------
+def change_times(df):
+    # When a document last changed: updatedAt, or createdAt if never updated.
+    changed = df['updatedAt'] if 'updatedAt' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    if 'createdAt' in df.columns:
+        changed = changed.fillna(df['createdAt'])
+    return pd.to_datetime(changed.astype(str), format="ISO8601", utc=True, errors="coerce")
+
+def batches_since(docs, watermark, columns, batch_size=BATCH_SIZE):
+    # Yields (frame, newest change time) for documents changed at or after the
+    # watermark. >= rather than >: merges are idempotent, so re-reading
+    # documents that share the watermark's timestamp is safe.
+    since = pd.Timestamp(watermark) if watermark else None
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            yield from filter_batch(batch, since, columns)
+            batch = []
+    if batch:
+        yield from filter_batch(batch, since, columns)
+
+def filter_batch(batch, since, columns):
+    df = pd.DataFrame(batch)
+    changed = change_times(df)
+    if since is not None:
+        keep = (changed >= since).to_numpy(dtype=bool) | changed.isna().to_numpy()
+        df, changed = df[keep], changed[keep]
+    if len(df):
+        yield df.reindex(columns=columns), changed.max()
+
+def export_docs(export_dir, collection):
+    return iter_json_array(os.path.join(export_dir, f"{collection}.json"))
+
+def firestore_docs(db, collection, id_field, watermark, as_string=False):
+    # Only documents changed at or past the watermark are read, by the same
+    # rule as change_times. Firestore can't filter on a missing field, so
+    # documents without updatedAt (such as exported interactions) come from
+    # a second query on createdAt; that query's documents that do have
+    # updatedAt belong to the first one and are skipped.
+    queries = [(db.collection(collection), False)]
+    if watermark:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        since = pd.Timestamp(watermark)
+        value = since.isoformat() if as_string else since.to_pydatetime()
+        queries = [(db.collection(collection).where(filter=FieldFilter(field, ">=", value)), only_missing)
+                   for field, only_missing in [("updatedAt", False), ("createdAt", True)]]
+    reads = 0
+    try:
+        for query, only_missing in queries:
+            for doc in query.stream():
+                reads += 1
+                data = doc.to_dict()
+                if only_missing and data.get("updatedAt") is not None:
+                    continue
+                data[id_field] = doc.id
+                yield data
+    finally:
+        instrumentation.record(reads=reads, collection=collection)
+
+# ---------------- RUN ----------------
+def refresh(conn, feeds):
+    # feeds: {"recipes": docs_since(watermark) -> iterable, "interactions": ...}
+    moments = read_meta(conn, "moments", dict.fromkeys(MOMENTS, 0.0))
+    counts = {}
+    for collection, columns, merge in [("recipes", RECIPE_COLUMNS, merge_recipes),
+                                       ("interactions", INTERACTION_COLUMNS, merge_interactions)]:
+        key = f"watermark_{collection}"
+        watermark = read_meta(conn, key)
+        newest, documents = None, 0
+        for df, changed in batches_since(feeds[collection](watermark), watermark, columns):
+            merge(conn, df, moments)
+            documents += len(df)
+            if pd.notna(changed) and (newest is None or changed > newest):
+                newest = changed
+        if newest is not None and (watermark is None or newest > pd.Timestamp(watermark)):
+            write_meta(conn, key, newest.isoformat())
+        counts[collection] = documents
+    write_meta(conn, "moments", moments)
+    conn.commit()
+    return counts
+
+def correlation_from_moments(m):
+    # Pearson's r from the running sums, as Series.corr over recipe_stats.
+    n = m['n']
+    if n < 2:
+        return float('nan')
+    sxx = m['sxx'] - m['sx'] ** 2 / n
+    syy = m['syy'] - m['sy'] ** 2 / n
+    sxy = m['sxy'] - m['sx'] * m['sy'] / n
+    if sxx <= 0 or syy <= 0:
+        return float('nan')
+    return sxy / math.sqrt(sxx * syy)
+
+def insights_from_state(conn):
+    # Per-recipe frames are recipe-sized; no interaction is re-read.
+    df_recipes = pd.read_sql_query(
+        "SELECT recipeId, title, difficulty, prepTimeMinutes FROM recipes ORDER BY recipeId", conn)
+    agg = pd.read_sql_query(
+        "SELECT recipeId, views, likes, rating_sum, rating_count, interactions, row_count AS rows "
+        "FROM recipe_agg", conn, index_col='recipeId')
+    stats = recipe_stats(df_recipes, agg)
+
+    moments = read_meta(conn, "moments", dict.fromkeys(MOMENTS, 0.0))
+    correlation = correlation_from_moments(moments) if moments['likes_total'] > 0 else None
+
+    # Counter order follows first appearance, as IngredientIndex.from_recipes.
+    occurrences = dict(conn.execute("SELECT name, occurrences FROM ingredient_agg"))
+    order = dict.fromkeys(name for (name,) in conn.execute(
+        "SELECT name FROM recipe_ingredients ORDER BY recipeId, position"))
+    ingredient_counts = Counter({name: occurrences[name] for name in order if name in occurrences})
+
+    engagement = pd.read_sql_query(
+        "SELECT name, engagement, row_count FROM ingredient_agg WHERE row_count > 0", conn)
+    ingredient_engagement = pd.Series(
+        (engagement['engagement'] / engagement['row_count']).to_numpy(),
+        index=pd.Index(engagement['name'], name='ingredient_name'), name='engagement').sort_index()
+
+    return report_insights(df_recipes, stats, correlation, ingredient_counts, ingredient_engagement)
+
+def run_incremental(feeds, state_path=STATE_PATH, rebuild=False, report=insights_from_state):
+    start = time.perf_counter()
+    conn = open_state(state_path, rebuild)
+    try:
+        counts = refresh(conn, feeds)
+        print(f"Merged {counts['recipes']} changed recipes and {counts['interactions']} changed interactions "
+              f"in {time.perf_counter() - start:.3f}s")
+        return report(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,111 @@
+from collections import Counter
+import os
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------
+# SPARSE INGREDIENT x RECIPE INDEX
+#
+# A CSR incidence matrix: row r (a recipe) holds the integer codes of its
+# ingredient names in codes[indptr[r]:indptr[r + 1]]. Ingredient frequency is
+# a column count and ingredient engagement is A^T x for a per-recipe vector x,
+# so no interactions x ingredients frame is ever materialized.
+# -------------------------------------------------------------------
+class IngredientIndex:
+    def __init__(self, recipe_ids, indptr, codes, names, fingerprint=""):
+        self.recipe_ids = np.asarray(recipe_ids, dtype=object)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.names = np.asarray(names, dtype=object)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_recipes(cls, df_recipes):
+        lengths, names = [], []
+        for ing_list in df_recipes['ingredients']:
+            if not isinstance(ing_list, list):
+                lengths.append(0)
+                continue
+            lengths.append(len(ing_list))
+            names.extend(ing['name'] for ing in ing_list)
+        # factorize numbers names in first-seen order, which keeps Counter
+        # tie-breaking identical to counting the nested dicts directly.
+        codes, uniques = pd.factorize(pd.Series(names, dtype=object), use_na_sentinel=False)
+        indptr = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        return cls(df_recipes['recipeId'].to_numpy(), indptr, codes, uniques, recipes_fingerprint(df_recipes))
+
+    @classmethod
+    def from_ingredients_table(cls, df_ingredients):
+        # normalized_csv_output/ingredients.csv: one row per (recipeId, ingredient).
+        df_ingredients = df_ingredients.dropna(subset=['recipeId', 'name'])
+        rows, recipe_ids = pd.factorize(df_ingredients['recipeId'])
+        order = np.argsort(rows, kind='stable')
+        codes, uniques = pd.factorize(df_ingredients['name'].to_numpy()[order])
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(recipe_ids)))])
+        return cls(recipe_ids, indptr, codes, uniques)
+
+    # ---------------- QUERIES ----------------
+    def row_lengths(self):
+        return np.diff(self.indptr)
+
+    def counts(self):
+        return np.bincount(self.codes, minlength=len(self.names))
+
+    def counter(self):
+        return Counter(dict(zip(self.names.tolist(), self.counts().tolist())))
+
+    def align(self, per_recipe):
+        # Per-recipe values (indexed by recipeId) in this index's row order.
+        return per_recipe.reindex(self.recipe_ids).fillna(0).to_numpy(dtype=np.float64)
+
+    def transpose_dot(self, recipe_values):
+        # Sparse A^T x: every ingredient occurrence contributes its recipe's value.
+        weights = np.repeat(recipe_values, self.row_lengths())
+        return np.bincount(self.codes, weights=weights, minlength=len(self.names))
+
+    def mean_per_ingredient(self, totals, counts, name=None):
+        # Mean of a per-interaction metric over every interaction of every
+        # recipe containing the ingredient, from per-recipe sums and counts.
+        numerator = self.transpose_dot(self.align(totals))
+        denominator = self.transpose_dot(self.align(counts))
+        present = denominator > 0
+        means = pd.Series(numerator[present] / denominator[present],
+                          index=pd.Index(self.names[present], name='ingredient_name'), name=name)
+        return means.sort_index()
+
+    # ---------------- PERSISTENCE ----------------
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, recipe_ids=self.recipe_ids.astype(str), indptr=self.indptr, codes=self.codes,
+                 names=self.names.astype(str), fingerprint=np.array(self.fingerprint))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['recipe_ids'], data['indptr'], data['codes'], data['names'],
+                       str(data['fingerprint']))
+
+    @classmethod
+    def load_or_build(cls, df_recipes, path):
+        # Reuse the on-disk index while the recipes it was built from are
+        # unchanged. Recipes that can't be fingerprinted are always rebuilt,
+        # and the index built from them isn't cached.
+        fingerprint = recipes_fingerprint(df_recipes)
+        if fingerprint and os.path.exists(path):
+            index = cls.load(path)
+            if index.fingerprint == fingerprint:
+                return index
+        index = cls.from_recipes(df_recipes)
+        if fingerprint:
+            index.save(path)
+        return index
+
+def recipes_fingerprint(df_recipes):
+    # Every ingredient edit bumps updatedAt, so recipeId + updatedAt stands in
+    # for the ingredients. Without updatedAt on every recipe an edit can't be
+    # seen, and "" (no fingerprint) is returned.
+    if 'updatedAt' not in df_recipes.columns or df_recipes['updatedAt'].isna().any():
+        return ""
+    hashed = pd.util.hash_pandas_object(df_recipes[['recipeId', 'updatedAt']].astype(str), index=False)
+    return f"{len(df_recipes)}:{int(hashed.sum()) & 0xFFFFFFFFFFFFFFFF:016x}"
@@ -0,0 +1,175 @@
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+from datetime import datetime, timezone
+
+# -------------------------------------------------------------------
+# PIPELINE INSTRUMENTATION
+#
+# Scripts wrap their steps in `with stage("name"):` and report what flowed
+# through them with record(rows_in=, rows_out=, reads=, writes=, deletes=,
+# collection=). Per stage this keeps:
+#   seconds           wall time, summed over calls
+#   peak_rss_bytes    the process's peak resident memory during the stage
+#   children_peak_rss_bytes
+#                     the largest peak of a child process (a pool worker)
+#                     that exited during the stage; 0 if none beat the
+#                     children seen before it (see children_peak_rss)
+#   collections       rows in/out and Firestore document reads/writes/deletes,
+#                     per collection (or table)
+# write() saves everything as <path>.json and <path>.prom (Prometheus text
+# format). Counters are recorded against the innermost open stage, from any
+# thread. With a profile directory set, each outermost stage is run under
+# cProfile and dumped to <dir>/<stage>.prof; otherwise the cost of a stage
+# is two clock reads, two small /proc reads and two getrusage calls.
+# -------------------------------------------------------------------
+METRIC_PREFIX = "pipeline"
+COUNTERS = ["rows_in", "rows_out", "reads", "writes", "deletes"]
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+# ---------------- PEAK MEMORY ----------------
+def peak_rss():
+    # VmHWM can be reset between stages (see reset_peak_rss); ru_maxrss is
+    # the fallback, a peak over the whole process lifetime.
+    try:
+        with open(PROC_STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def children_peak_rss():
+    # The peak of the largest child reaped so far. The kernel can't reset it,
+    # so a stage only owns the value when it rises while the stage runs; pool
+    # workers count once the pool has shut down.
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+def reset_peak_rss():
+    try:
+        with open(PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+# ---------------- RECORDER ----------------
+class Metrics:
+    def __init__(self, job="pipeline"):
+        self.job = job
+        self.profile_dir = None
+        self.stages = {}
+        self.stack = []
+        self.lock = threading.Lock()
+        self.started = datetime.now(timezone.utc).isoformat()
+
+    def configure(self, job=None, profile_dir=None):
+        self.job = job or self.job
+        self.profile_dir = profile_dir
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def entry(self, name):
+        if name not in self.stages:
+            self.stages[name] = {"calls": 0, "seconds": 0.0, "peak_rss_bytes": 0, "children_peak_rss_bytes": 0,
+                                 "collections": {}}
+        return self.stages[name]
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # A nested stage resets the peak-memory watermark, so the peak seen
+        # before it is handed up to the enclosing stage first.
+        with self.lock:
+            if self.stack:
+                self.stack[-1]["peak"] = max(self.stack[-1]["peak"], peak_rss())
+            frame = {"name": name, "peak": 0, "children": children_peak_rss()}
+            self.stack.append(frame)
+            self.entry(name)
+        reset_peak_rss()
+        profiler = None
+        if self.profile_dir and len(self.stack) == 1:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+            with self.lock:
+                self.stack.remove(frame)
+                peak = max(frame["peak"], peak_rss())
+                entry = self.entry(name)
+                entry["calls"] += 1
+                entry["seconds"] += seconds
+                entry["peak_rss_bytes"] = max(entry["peak_rss_bytes"], peak)
+                children = children_peak_rss()
+                if children > frame["children"]:
+                    entry["children_peak_rss_bytes"] = max(entry["children_peak_rss_bytes"], children)
+                if self.stack:
+                    self.stack[-1]["peak"] = max(self.stack[-1]["peak"], peak)
+
+    def record(self, collection="", stage=None, **counts):
+        # Adds to the innermost open stage (or `stage`); outside any stage the
+        # counts go to a stage named after the job.
+        with self.lock:
+            name = stage or (self.stack[-1]["name"] if self.stack else self.job)
+            totals = self.entry(name)["collections"].setdefault(collection, dict.fromkeys(COUNTERS, 0))
+            for key, value in counts.items():
+                totals[key] += int(value)
+
+    # ---------------- OUTPUT ----------------
+    def snapshot(self):
+        with self.lock:
+            return {"job": self.job, "started": self.started,
+                    "finished": datetime.now(timezone.utc).isoformat(),
+                    "stages": json.loads(json.dumps(self.stages))}
+
+    def prometheus(self):
+        def labels(stage, collection=""):
+            pairs = [("job", self.job), ("stage", stage)] + ([("collection", collection)] if collection else [])
+            return ",".join(f'{k}="{v}"' for k, v in pairs)
+
+        stages = self.snapshot()["stages"]
+        lines = []
+        for metric, kind, text, key in [
+            ("stage_duration_seconds", "gauge", "Wall time spent in the stage.", "seconds"),
+            ("stage_calls", "gauge", "Times the stage ran.", "calls"),
+            ("stage_peak_rss_bytes", "gauge", "Peak resident memory while the stage ran.", "peak_rss_bytes"),
+            ("stage_children_peak_rss_bytes", "gauge", "Peak resident memory of child processes that exited "
+             "during the stage.", "children_peak_rss_bytes"),
+        ]:
+            lines += [f"# HELP {METRIC_PREFIX}_{metric} {text}", f"# TYPE {METRIC_PREFIX}_{metric} {kind}"]
+            lines += [f"{METRIC_PREFIX}_{metric}{{{labels(name)}}} {entry[key]}" for name, entry in stages.items()]
+        for key, text in [("rows_in", "Rows read by the stage."), ("rows_out", "Rows produced by the stage."),
+                          ("reads", "Firestore documents read."), ("writes", "Firestore documents written."),
+                          ("deletes", "Firestore documents deleted.")]:
+            metric = f"{METRIC_PREFIX}_{key}_total"
+            lines += [f"# HELP {metric} {text}", f"# TYPE {metric} counter"]
+            lines += [f"{metric}{{{labels(name, collection)}}} {totals[key]}"
+                      for name, entry in stages.items() for collection, totals in entry["collections"].items()
+                      if totals[key]]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # <path>.json and <path>.prom, each replaced whole.
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        for suffix, text in [(".json", json.dumps(self.snapshot(), indent=4)), (".prom", self.prometheus())]:
+            with open(path + suffix + ".tmp", "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(path + suffix + ".tmp", path + suffix)
+        return path + ".json", path + ".prom"
+
+# One recorder per process, shared by every module.
+METRICS = Metrics()
+configure = METRICS.configure
+stage = METRICS.stage
+record = METRICS.record
+write = METRICS.write
@@ -0,0 +1,124 @@
+import json
+import os
+
+# -------------------------------------------------------------------
+# Incremental reader for the firestore_export layout: one top-level JSON
+# array of documents. The file is read in fixed-size blocks and documents are
+# decoded one at a time, so memory follows the largest document rather than
+# the file size.
+# -------------------------------------------------------------------
+BLOCK_SIZE = 1 << 20
+WHITESPACE = " \t\n\r"
+
+def iter_json_array(path, block_size=BLOCK_SIZE):
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def fill():
+            nonlocal buf, pos, eof
+            block = f.read(block_size)
+            eof = not block
+            buf = buf[pos:] + block
+            pos = 0
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in WHITESPACE:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        fill()
+        skip_whitespace()
+        if buf[pos:pos + 1] != "[":
+            raise ValueError(f"{path}: expected a top-level JSON array")
+        pos += 1
+
+        while True:
+            skip_whitespace()
+            if buf[pos:pos + 1] == "]":
+                return
+            try:
+                doc, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # The document runs past the buffer; read more and retry.
+                if eof:
+                    raise
+                fill()
+                continue
+            if end == len(buf) and not eof:
+                # A number at the very end of the buffer may be truncated.
+                fill()
+                continue
+            pos = end
+            yield doc
+
+            skip_whitespace()
+            if buf[pos:pos + 1] == ",":
+                pos += 1
+            elif buf[pos:pos + 1] != "]":
+                raise ValueError(f"{path}: expected ',' or ']' at offset {pos}")
+
+# -------------------------------------------------------------------
+# Byte-range slices, so several processes can each parse part of one
+# export. In a pretty-printed array every top-level document starts right
+# after "," + the same newline-and-indent that precedes the first one, and
+# JSON strings cannot hold a raw newline, so that marker never occurs inside
+# a document. A slice [start, stop) owns the documents whose opening byte
+# lies in it. Compact arrays (no newline before the first document) have no
+# such marker; array_layout returns None for them.
+# -------------------------------------------------------------------
+def array_layout(path, probe_size=BLOCK_SIZE):
+    # (offset of the first document, separator marker), or None.
+    with open(path, "rb") as f:
+        head = f.read(probe_size)
+    stripped = head.lstrip()
+    if not stripped.startswith(b"["):
+        raise ValueError(f"{path}: expected a top-level JSON array")
+    bracket = len(head) - len(stripped)
+    lead = len(stripped[1:]) - len(stripped[1:].lstrip())
+    first = bracket + 1 + lead
+    indent = head[bracket + 1:first]
+    if b"\n" not in indent or head[first:first + 1] != b"{":
+        return None
+    return first, b"," + indent + b"{"
+
+def document_at_or_after(f, pos, layout, block_size=BLOCK_SIZE):
+    # Byte offset of the first document starting at or after pos, or None.
+    first, marker = layout
+    if pos <= first:
+        return first
+    offset = pos - (len(marker) - 1)
+    f.seek(offset)
+    carry = b""
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return None
+        data = carry + block
+        hit = data.find(marker)
+        if hit >= 0:
+            return offset - len(carry) + hit + len(marker) - 1
+        carry = data[-(len(marker) - 1):]
+        offset += len(block)
+
+def read_slice(path, start, stop, layout):
+    # The documents whose opening byte lies in [start, stop), parsed at once.
+    with open(path, "rb") as f:
+        begin = document_at_or_after(f, start, layout)
+        end = document_at_or_after(f, stop, layout)
+        if begin is None or (end is not None and begin >= end):
+            return []
+        f.seek(begin)
+        data = f.read() if end is None else f.read(end - begin)
+    # Up to the next document's separator, or up to the array's "]".
+    data = data.rstrip()
+    data = data[:-1].rstrip()
+    return json.loads(b"[" + data + b"]")
+
+def slices(path, slice_bytes):
+    size = os.path.getsize(path)
+    return [(start, min(start + slice_bytes, size)) for start in range(0, size, slice_bytes)]
@@ -1,7 +1,14 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core import exceptions as gexc
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime, timedelta
+import argparse
+import itertools
 import random
+import time
+
+import instrumentation
 
 # -------------------------------------------------------------------
 # CONFIG
@@ -9,6 +16,22 @@ import random
 PROJECT_ID = "recipe-project-87528"
 SERVICE_ACCOUNT_PATH = r"serviceAccountKey.json"
 
+METRICS_PATH = "metrics/seed"
+SYNC_SEED = 42
+
+# Bulk write tuning (Firestore caps a batch at 500 writes)
+BATCH_SIZE = 500
+CONCURRENCY = 8
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.5
+RETRYABLE_ERRORS = (
+    gexc.Aborted,
+    gexc.DeadlineExceeded,
+    gexc.InternalServerError,
+    gexc.ResourceExhausted,
+    gexc.ServiceUnavailable,
+)
+
 # -------------------------------------------------------------------
 # INIT FIRESTORE
 # -------------------------------------------------------------------
@@ -18,10 +41,105 @@ def init_firestore():
         firebase_admin.initialize_app(cred, {"projectId": PROJECT_ID})
     return firestore.client()
 
+# -------------------------------------------------------------------
+# WRITERS
+# -------------------------------------------------------------------
+def write_one_by_one(db, collection, docs, id_field):
+    count = 0
+    try:
+        for doc in docs:
+            db.collection(collection).document(doc[id_field]).set(doc)
+            count += 1
+    finally:
+        instrumentation.record(writes=count, rows_in=count, collection=collection)
+    return {"writes": count}
+
+def _commit_with_retry(db, collection, chunk, id_field, max_retries, delete=False):
+    attempt = 0
+    while True:
+        batch = db.batch()
+        for doc in chunk:
+            reference = db.collection(collection).document(doc[id_field])
+            if delete:
+                batch.delete(reference)
+            else:
+                batch.set(reference, doc)
+        try:
+            batch.commit()
+            return attempt
+        except RETRYABLE_ERRORS:
+            if attempt >= max_retries:
+                raise
+            # Exponential backoff with full jitter; a batch commit is atomic,
+            # so resending the whole chunk is safe.
+            time.sleep(random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt)))
+            attempt += 1
+
+def bulk_write(db, collection, docs, id_field, batch_size=BATCH_SIZE,
+               concurrency=CONCURRENCY, max_retries=MAX_RETRIES, delete=False, on_commit=None):
+    # With delete=True only each document's id_field is used and the
+    # documents are deleted; "writes" then counts deletes. on_commit is
+    # called with each batch's documents once that batch has committed.
+    if not 1 <= batch_size <= BATCH_SIZE:
+        raise ValueError(f"batch_size must be between 1 and {BATCH_SIZE} (Firestore's limit), got {batch_size}")
+    start = time.perf_counter()
+    docs = iter(docs)
+    writes = batches = retries = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = {}
+        while True:
+            # Keep at most `concurrency` batches in flight so a generator of
+            # documents is consumed lazily instead of being queued up front.
+            while len(in_flight) < concurrency:
+                chunk = list(itertools.islice(docs, batch_size))
+                if not chunk:
+                    break
+                future = pool.submit(_commit_with_retry, db, collection, chunk, id_field, max_retries, delete)
+                in_flight[future] = chunk
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                retries += future.result()
+                chunk = in_flight.pop(future)
+                committed = len(chunk)
+                writes += committed
+                batches += 1
+                instrumentation.record(**{"deletes" if delete else "writes": committed},
+                                       rows_in=committed, collection=collection)
+                if on_commit is not None:
+                    on_commit(chunk)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "writes": writes,
+        "batches": batches,
+        "retries": retries,
+        "seconds": round(elapsed, 3),
+        "writes_per_sec": round(writes / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+def batch_size_arg(value):
+    # argparse type for --batch-size: Firestore rejects a larger batch only
+    # at commit time, after every retry.
+    size = int(value)
+    if not 1 <= size <= BATCH_SIZE:
+        raise argparse.ArgumentTypeError(f"must be between 1 and {BATCH_SIZE}, got {size}")
+    return size
+
+def report_writes(label, stats):
+    if "unchanged" in stats:
+        print(f"   {label}: {stats['added']} added, {stats['changed']} changed, {stats['deleted']} deleted, "
+              f"{stats['unchanged']} unchanged")
+    if "writes_per_sec" in stats:
+        print(f"   {label}: {stats['writes']} writes in {stats['batches']} batches, "
+              f"{stats['retries']} retries, {stats['seconds']}s ({stats['writes_per_sec']} writes/sec)")
+
 # -------------------------------------------------------------------
 # SEED USERS
 # -------------------------------------------------------------------
-def seed_users(db):
+def seed_users(db, writer=write_one_by_one):
     now = datetime.utcnow()
 
     users = [
@@ -33,10 +151,10 @@ def seed_users(db):
         {"userId": "user_bhakti", "displayName": "Bhakti", "email": "bhakti@example.com", "createdAt": now - timedelta(days=1), "skillLevel": "expert", "dietPreferences": ["non-veg"]},
     ]
 
-    for user in users:
-        db.collection("users").document(user["userId"]).set(user)
+    stats = writer(db, "users", users, "userId")
 
     print(f" Seeded {len(users)} users.")
+    report_writes("users", stats)
 
 # -------------------------------------------------------------------
 # RECIPE FUNCTIONS
@@ -80,18 +198,21 @@ def create_surmai_fry_recipe(now):
     }
 
 def create_synthetic_recipe(recipe_id_suffix, title, cuisine, category, difficulty,
-                            prep_time, cook_time, servings, author_id, now):
+                            prep_time, cook_time, servings, author_id, now,
+                            rng=random, ingredients=None, steps=None, max_age_days=30):
     total_time = prep_time + cook_time
-    ingredients = [
-        {"ingredientId": f"{recipe_id_suffix}-ING-01", "name": "Onion", "quantity": 1, "unit": "piece", "notes": "finely chopped"},
-        {"ingredientId": f"{recipe_id_suffix}-ING-02", "name": "Tomato", "quantity": 2, "unit": "piece", "notes": "pureed"},
-        {"ingredientId": f"{recipe_id_suffix}-ING-03", "name": "Oil", "quantity": 2, "unit": "tbsp", "notes": ""},
-    ]
-    steps = [
-        {"stepNumber": 1, "instruction": "Heat oil and sauté onions until golden.", "approxMinutes": 5},
-        {"stepNumber": 2, "instruction": "Add tomatoes and cook until soft.", "approxMinutes": 7},
-        {"stepNumber": 3, "instruction": "Add spices and cook for 5 minutes.", "approxMinutes": 5},
-    ]
+    if ingredients is None:
+        ingredients = [
+            {"ingredientId": f"{recipe_id_suffix}-ING-01", "name": "Onion", "quantity": 1, "unit": "piece", "notes": "finely chopped"},
+            {"ingredientId": f"{recipe_id_suffix}-ING-02", "name": "Tomato", "quantity": 2, "unit": "piece", "notes": "pureed"},
+            {"ingredientId": f"{recipe_id_suffix}-ING-03", "name": "Oil", "quantity": 2, "unit": "tbsp", "notes": ""},
+        ]
+    if steps is None:
+        steps = [
+            {"stepNumber": 1, "instruction": "Heat oil and sauté onions until golden.", "approxMinutes": 5},
+            {"stepNumber": 2, "instruction": "Add tomatoes and cook until soft.", "approxMinutes": 7},
+            {"stepNumber": 3, "instruction": "Add spices and cook for 5 minutes.", "approxMinutes": 5},
+        ]
     return {
         "recipeId": f"recipe_{recipe_id_suffix}",
         "title": title,
@@ -107,15 +228,15 @@ def create_synthetic_recipe(recipe_id_suffix, title, cuisine, category, difficul
         "ingredients": ingredients,
         "steps": steps,
         "tags": [cuisine.lower(), category.lower()],
-        "createdAt": now - timedelta(days=random.randint(1, 30)),
-        "updatedAt": now - timedelta(days=random.randint(0, 5)),
+        "createdAt": now - timedelta(days=rng.randint(1, max_age_days)),
+        "updatedAt": now - timedelta(days=rng.randint(0, 5)),
         "isPublic": True,
     }
 
 # -------------------------------------------------------------------
 # SEED RECIPES
 # -------------------------------------------------------------------
-def seed_recipes(db):
+def seed_recipes(db, writer=write_one_by_one, rng=random):
     now = datetime.utcnow()
     recipes = []
     recipes.append(create_surmai_fry_recipe(now))  # Your main recipe first
@@ -140,30 +261,24 @@ def seed_recipes(db):
     ]
 
     for spec in synthetic_specs:
-        recipes.append(create_synthetic_recipe(*spec, now))
+        recipes.append(create_synthetic_recipe(*spec, now, rng=rng))
 
-    for recipe in recipes:
-        db.collection("recipes").document(recipe["recipeId"]).set(recipe)
+    stats = writer(db, "recipes", recipes, "recipeId")
 
     print(f" Seeded {len(recipes)} recipes.")
+    report_writes("recipes", stats)
+    return [recipe["recipeId"] for recipe in recipes]
 
 # -------------------------------------------------------------------
 # SEED INTERACTIONS WITH VIEWS, LIKES, RATINGS
 # -------------------------------------------------------------------
-def seed_interactions(db):
-    now = datetime.utcnow()
-    user_ids = ["user_adi", "user_chef_1", "user_chef_2", "user_taster_1", "user_taster_2", "user_bhakti"]
-
-    recipes_stream = db.collection("recipes").stream()
-    recipe_ids = [r.id for r in recipes_stream]
-
-    count = 0
+def generate_interactions(recipe_ids, user_ids, now, rng=random):
     for recipe_id in recipe_ids:
         for user_id in user_ids:
             # Generate fixed views and likes
-            views = random.randint(10, 100)
-            likes = random.randint(5, views)
-            rating = random.randint(3, 5)
+            views = rng.randint(10, 100)
+            likes = rng.randint(5, views)
+            rating = rng.randint(3, 5)
 
             interaction_data = {
                 "interactionId": f"{recipe_id}_{user_id}",
@@ -172,22 +287,84 @@ def seed_interactions(db):
                 "views": views,
                 "likes": likes,
                 "rating": rating,
-                "createdAt": now - timedelta(days=random.randint(0, 30)),
+                "createdAt": now - timedelta(days=rng.randint(0, 30)),
                 "updatedAt": now,
-                "source": random.choice(["web", "mobile"])
+                "source": rng.choice(["web", "mobile"])
             }
 
-            db.collection("interactions").document(interaction_data["interactionId"]).set(interaction_data)
-            count += 1
+            yield interaction_data
+
+def seed_interactions(db, writer=write_one_by_one, recipe_ids=None, rng=random):
+    now = datetime.utcnow()
+    user_ids = ["user_adi", "user_chef_1", "user_chef_2", "user_taster_1", "user_taster_2", "user_bhakti"]
+
+    # seed_recipes returns the IDs it wrote; the collection is only read
+    # back when seeding interactions on their own.
+    if recipe_ids is None:
+        recipe_ids = [r.id for r in db.collection("recipes").stream()]
+        instrumentation.record(reads=len(recipe_ids), collection="recipes")
+
+    stats = writer(db, "interactions", generate_interactions(recipe_ids, user_ids, now, rng), "interactionId")
 
-    print(f" Seeded {count} interactions with views, likes, and ratings.")
+    print(f" Seeded {len(recipe_ids) * len(user_ids)} interactions with views, likes, and ratings.")
+    report_writes("interactions", stats)
 
 # -------------------------------------------------------------------
 # MAIN
 # -------------------------------------------------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed the recipes Firestore database.")
+    parser.add_argument("--bulk", action="store_true", help="write in concurrent batches instead of one set() per document")
+    parser.add_argument("--batch-size", type=batch_size_arg, default=BATCH_SIZE,
+                        help=f"writes per batch commit, at most {BATCH_SIZE}")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES)
+    parser.add_argument("--fake", action="store_true", help="seed an in-process fake client instead of Firestore")
+    parser.add_argument("--fake-latency-ms", type=float, default=0.0, help="simulated round trip per commit")
+    parser.add_argument("--fake-failure-rate", type=float, default=0.0, help="fraction of commits that fail")
+    parser.add_argument("--sync", action="store_true",
+                        help="write only documents that differ from the last sync (see firestore_sync.py)")
+    parser.add_argument("--manifest", default=None, help="sync manifest path (default: firestore_sync.MANIFEST_PATH)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help=f"seed the generated values (--sync defaults to {SYNC_SEED} so re-runs match)")
+    parser.add_argument("--metrics", default=METRICS_PATH, help="write stage metrics to <path>.json and <path>.prom")
+    parser.add_argument("--profile", default=None, help="dump a cProfile file per stage into this directory")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    db = init_firestore()
-    seed_users(db)
-    seed_recipes(db)
-    seed_interactions(db)
+    args = parse_args()
+    instrumentation.configure("seed", args.profile)
+    if args.fake:
+        from fake_firestore import FakeFirestore
+        db = FakeFirestore(latency_ms=args.fake_latency_ms, failure_rate=args.fake_failure_rate)
+    else:
+        db = init_firestore()
+
+    writer = write_one_by_one
+    if args.bulk:
+        def writer(db, collection, docs, id_field):
+            return bulk_write(db, collection, docs, id_field, batch_size=args.batch_size,
+                              concurrency=args.concurrency, max_retries=args.max_retries)
+
+    seed = SYNC_SEED if args.sync and args.seed is None else args.seed
+    rng = random if seed is None else random.Random(seed)
+    manifest = None
+    if args.sync:
+        from firestore_sync import MANIFEST_PATH, open_manifest, sync_writer
+        # The fake starts empty in every process, so its manifest must too.
+        manifest = open_manifest(":memory:" if args.fake else args.manifest or MANIFEST_PATH)
+        writer = sync_writer(manifest, batch_size=args.batch_size, concurrency=args.concurrency,
+                             max_retries=args.max_retries)
+
+    try:
+        with instrumentation.stage("seed_users"):
+            seed_users(db, writer)
+        with instrumentation.stage("seed_recipes"):
+            recipe_ids = seed_recipes(db, writer, rng)
+        with instrumentation.stage("seed_interactions"):
+            seed_interactions(db, writer, recipe_ids, rng)
+    finally:
+        if manifest is not None:
+            manifest.close()
     print(" Seeding complete.")
+    print(" Metrics written to", " and ".join(instrumentation.write(args.metrics)))
@@ -0,0 +1,173 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import io
+import itertools
+import os
+import time
+
+import pandas as pd
+
+import columnar
+from json_stream import array_layout, iter_json_array, read_slice, slices
+from schema import INGREDIENT_COLUMNS, INTERACTION_COLUMNS, RECIPE_COLUMNS, STEP_COLUMNS
+
+# -------------------------------------------------------------------
+# CONFIG
+# -------------------------------------------------------------------
+EXPORT_DIR = "firestore_export"
+OUTPUT_DIR = "normalized_csv_output"
+SLICE_BYTES = 8 << 20  # bytes of export JSON per work unit
+SHARD_SIZE = 10_000  # documents per work unit when the export can't be sliced
+
+# The columnar output keeps the engagement counters and updatedAt that the
+# CSV schema leaves out, so analytics can read it directly.
+COLUMNAR_EXTRA = {"interactions": ["views", "likes", "updatedAt"]}
+
+TABLES = {
+    "recipe": RECIPE_COLUMNS,
+    "ingredients": INGREDIENT_COLUMNS,
+    "steps": STEP_COLUMNS,
+    "interactions": INTERACTION_COLUMNS,
+}
+
+# -------------------------------------------------------------------
+# FLATTENING
+# -------------------------------------------------------------------
+def cell(value):
+    # Lists (tags, dietPreferences) are stored comma-joined, as in the CSVs.
+    if isinstance(value, list):
+        return ",".join(str(v) for v in value)
+    return value
+
+def flatten_recipes(docs):
+    recipes, ingredients, steps = [], [], []
+    for doc in docs:
+        recipe_id = doc.get("recipeId")
+        recipes.append([cell(doc.get(c)) for c in RECIPE_COLUMNS])
+        for ing in doc.get("ingredients") or []:
+            ingredients.append([recipe_id] + [ing.get(c) for c in INGREDIENT_COLUMNS[1:]])
+        for step in doc.get("steps") or []:
+            steps.append([recipe_id] + [step.get(c) for c in STEP_COLUMNS[1:]])
+    return {"recipe": recipes, "ingredients": ingredients, "steps": steps}
+
+def flatten_interactions(docs):
+    columns = INTERACTION_COLUMNS + COLUMNAR_EXTRA["interactions"]
+    return {"interactions": [[cell(doc.get(c)) for c in columns] for doc in docs]}
+
+FLATTENERS = {"recipes": flatten_recipes, "interactions": flatten_interactions}
+
+def csv_text(rows, width):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(row[:width] for row in rows)
+    return buf.getvalue()
+
+def normalize_shard(kind, docs, fmt):
+    # Runs in a worker. Results come back to the parent, which appends them in
+    # shard order: CSV text to the open files, frames to one columnar table.
+    tables = FLATTENERS[kind](docs)
+    if fmt == "csv":
+        return len(docs), {table: csv_text(rows, len(TABLES[table])) for table, rows in tables.items()}
+    return len(docs), {table: pd.DataFrame(rows, columns=TABLES[table] + COLUMNAR_EXTRA.get(table, []))
+                       for table, rows in tables.items()}
+
+def normalize_slice(kind, path, start, stop, layout, fmt):
+    # Runs in a worker that parses its own byte range of the export, so
+    # neither parsing nor documents go through the parent.
+    return normalize_shard(kind, read_slice(path, start, stop, layout), fmt)
+
+# -------------------------------------------------------------------
+# DRIVER
+# -------------------------------------------------------------------
+def batches(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+def work_units(kind, path, fmt, shard_size, slice_bytes):
+    # (function, args) per shard, in file order. Pretty-printed exports are
+    # split into byte ranges (see json_stream.read_slice); a compact one is
+    # parsed by the parent and its documents shipped in batches.
+    layout = array_layout(path)
+    if layout is not None:
+        for start, stop in slices(path, slice_bytes):
+            yield normalize_slice, (kind, path, start, stop, layout, fmt)
+    else:
+        for docs in batches(iter_json_array(path), shard_size):
+            yield normalize_shard, (kind, docs, fmt)
+
+def normalize(export_dir=EXPORT_DIR, out_dir=OUTPUT_DIR, fmt="csv", shard_size=SHARD_SIZE, workers=None,
+              row_group_size=columnar.ROW_GROUP_SIZE, slice_bytes=SLICE_BYTES):
+    workers = workers or os.cpu_count()
+    os.makedirs(out_dir, exist_ok=True)
+    sources = {"recipes": ["recipe", "ingredients", "steps"], "interactions": ["interactions"]}
+    stats = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for kind, tables in sources.items():
+            start = time.perf_counter()
+            handles = {}
+            if fmt == "csv":
+                for table in tables:
+                    handles[table] = open(os.path.join(out_dir, f"{table}.csv"), "w", encoding="utf-8", newline="")
+                    handles[table].write(",".join(TABLES[table]) + "\n")
+            else:
+                for table in tables:
+                    handles[table] = columnar.TableWriter(os.path.join(out_dir, table), row_group_size)
+            documents, completed = 0, False
+            try:
+                # Parsing, flattening and formatting are sharded across
+                # workers, with at most 2x workers shards in flight; the parent
+                # only appends the results in order.
+                pending = []
+                units = work_units(kind, os.path.join(export_dir, f"{kind}.json"), fmt, shard_size, slice_bytes)
+                for unit in itertools.chain(units, [None]):
+                    if unit is not None:
+                        function, unit_args = unit
+                        pending.append(pool.submit(function, *unit_args))
+                    while pending and (len(pending) >= 2 * workers or unit is None):
+                        count, tables = pending.pop(0).result()
+                        documents += count
+                        for table, result in tables.items():
+                            if fmt == "csv":
+                                handles[table].write(result)
+                            else:
+                                handles[table].append(result)
+                completed = True
+            finally:
+                for handle in handles.values():
+                    if fmt == "csv" or completed:
+                        handle.close()
+                    else:
+                        # A failed run must not publish a partial table.
+                        handle.abort()
+
+            elapsed = time.perf_counter() - start
+            stats[kind] = {"documents": documents, "seconds": round(elapsed, 3),
+                           "docs_per_sec": round(documents / elapsed, 1) if elapsed > 0 else 0.0}
+            print(f" Normalized {documents} {kind} in {elapsed:.2f}s ({stats[kind]['docs_per_sec']} docs/sec)")
+
+    return stats
+
+# -------------------------------------------------------------------
+# MAIN
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flatten firestore_export JSON into normalized tables.")
+    parser.add_argument("--export-dir", default=EXPORT_DIR)
+    parser.add_argument("--out", default=OUTPUT_DIR)
+    parser.add_argument("--format", choices=["csv", "columnar"], default="csv")
+    parser.add_argument("--slice-mb", type=float, default=SLICE_BYTES / 2 ** 20,
+                        help="export JSON per work unit; each worker parses its own slice")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE,
+                        help="documents per work unit for compact (single-line) exports")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--row-group-size", type=int, default=columnar.ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    normalize(args.export_dir, args.out, args.format, args.shard_size, args.workers, args.row_group_size,
+              max(int(args.slice_mb * 2 ** 20), 1))
+    print(" Normalized tables written to", args.out)
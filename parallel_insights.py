@@ -0,0 +1,134 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analytics import recipe_stats, report_insights
+from incremental_analytics import MOMENTS, correlation_from_moments
+from ingredient_index import IngredientIndex
+
+# -------------------------------------------------------------------
+# MAP-REDUCE INSIGHTS
+#
+# compute_insights over a process pool. Interactions are split by a hash of
+# recipeId, so every recipe's rows land in exactly one partition:
+#   share   the parent groups the rows by partition once (a counting sort
+#           on each row's owner, stable so rows keep their order within a
+#           recipe) and writes the recipe codes and measure columns to .npy
+#           files with per-partition offsets; workers memory-map them,
+#           nothing row-sized is pickled
+#   map     each worker scans only its partition's rows, a chunk at a time,
+#           and sums them per recipe (views, likes, rating sums and counts,
+#           interactions, rows), plus the prep-time/likes co-moments
+#   reduce  the disjoint per-recipe partials are concatenated, the moments
+#           summed, and the same report as compute_insights is printed
+# -------------------------------------------------------------------
+CHUNK_ROWS = 4_000_000
+MEASURE_COLUMNS = ['views', 'likes', 'rating']
+
+def share_interactions(df_recipes, df_interactions, directory, partitions):
+    # Returns the recipe keys; code i in codes.npy is keys[i], -1 is null.
+    recipe = df_interactions['recipeId']
+    if isinstance(recipe.dtype, pd.CategoricalDtype):
+        codes, keys = recipe.cat.codes.to_numpy(), recipe.cat.categories
+    else:
+        codes, keys = pd.factorize(recipe.to_numpy())
+    keys = pd.Index(np.asarray(keys, dtype=object), name='recipeId')
+    codes = codes.astype(np.int32, copy=False)
+    owner_dtype = np.int16 if partitions < np.iinfo(np.int16).max else np.int32
+    owner = (pd.util.hash_array(keys.to_numpy()) % np.uint64(partitions)).astype(owner_dtype)
+
+    # Rows of partition p are rows[offsets[p]:offsets[p + 1]]; null recipes
+    # go to a trailing bucket no worker reads. int16 owners make the stable
+    # argsort a radix sort, linear in the rows.
+    row_owner = np.append(owner, owner_dtype(partitions))[codes]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(row_owner, minlength=partitions + 1))])
+    in_order = partitions == 1 and offsets[-2] == len(codes)
+    order = None if in_order else np.argsort(row_owner, kind='stable')
+    arrange = (lambda values: values) if order is None else (lambda values: values[order])
+
+    np.save(os.path.join(directory, "codes.npy"), arrange(codes))
+    for col in MEASURE_COLUMNS:
+        np.save(os.path.join(directory, f"{col}.npy"), arrange(df_interactions[col].to_numpy(dtype=np.float64)))
+    np.save(os.path.join(directory, "counted.npy"), arrange(df_interactions['interactionId'].notna().to_numpy()))
+    np.save(os.path.join(directory, "owner.npy"), owner)
+    np.save(os.path.join(directory, "offsets.npy"), offsets)
+    # Prep time per key; NaN for recipes the report's inner join drops.
+    prep = pd.to_numeric(df_recipes.drop_duplicates('recipeId').set_index('recipeId')['prepTimeMinutes'],
+                         errors='coerce').reindex(keys)
+    np.save(os.path.join(directory, "prep.npy"), prep.to_numpy(dtype=np.float64))
+    return keys
+
+def aggregate_partition(directory, partition, chunk_rows=CHUNK_ROWS):
+    load = lambda name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+    codes, counted = load("codes"), load("counted")
+    measures = {col: load(col) for col in MEASURE_COLUMNS}
+    owned = np.flatnonzero(np.asarray(load("owner")) == partition)
+    first, last = np.asarray(load("offsets"))[partition:partition + 2]
+
+    # code -> slot among this partition's recipes; every row in the range
+    # belongs to one of them.
+    slots = np.full(len(load("owner")), -1, dtype=np.int64)
+    slots[owned] = np.arange(len(owned))
+    size = len(owned)
+    sums = {name: np.zeros(size) for name in ['views', 'likes', 'rating_sum', 'rating_count', 'interactions', 'rows']}
+    for start in range(first, last, chunk_rows):
+        stop = min(start + chunk_rows, last)
+        slot = slots[codes[start:stop]]
+        for col, out in [('views', 'views'), ('likes', 'likes'), ('rating', 'rating_sum')]:
+            values = np.asarray(measures[col][start:stop])
+            present = ~np.isnan(values)
+            sums[out] += np.bincount(slot, np.where(present, values, 0.0), minlength=size)
+            if col == 'rating':
+                sums['rating_count'] += np.bincount(slot, present, minlength=size)
+        sums['interactions'] += np.bincount(slot, np.asarray(counted[start:stop]), minlength=size)
+        sums['rows'] += np.bincount(slot, minlength=size)
+
+    # Co-moments of prep time and per-recipe mean likes over the recipes the
+    # report keeps (pairwise-complete, as Series.corr).
+    seen = sums['rows'] > 0
+    x = np.asarray(load("prep"))[owned]
+    y = np.divide(sums['likes'], sums['rows'], out=np.zeros(size), where=seen)
+    pair = seen & ~np.isnan(x)
+    x, y = x[pair], y[pair]
+    moments = {'n': float(len(x)), 'sx': x.sum(), 'sy': y.sum(), 'sxx': (x * x).sum(), 'syy': (y * y).sum(),
+               'sxy': (x * y).sum(), 'likes_total': sums['likes'][seen].sum()}
+    return owned[seen], {name: values[seen] for name, values in sums.items()}, moments
+
+def reduce_partials(partials, keys, df_interactions):
+    codes = np.concatenate([owned for owned, _, _ in partials])
+    agg = pd.DataFrame({name: np.concatenate([sums[name] for _, sums, _ in partials])
+                        for name in partials[0][1]}, index=keys[codes])
+    # Same dtypes as the groupby: integer sums stay integers, counts are int64.
+    for col, out in [('views', 'views'), ('likes', 'likes'), ('rating', 'rating_sum')]:
+        if df_interactions[col].dtype.kind in "iub":
+            agg[out] = agg[out].astype(np.int64)
+    for name in ['rating_count', 'interactions', 'rows']:
+        agg[name] = agg[name].astype(np.int64)
+    moments = {name: sum(m[name] for _, _, m in partials) for name in MOMENTS}
+    return agg.sort_index(), moments
+
+def compute_insights_parallel(df_recipes, df_interactions, ingredient_index=None, workers=None,
+                              partitions=None, spill_dir=None, chunk_rows=CHUNK_ROWS):
+    workers = workers or os.cpu_count()
+    partitions = partitions or workers
+    with tempfile.TemporaryDirectory(dir=spill_dir) as directory:
+        keys = share_interactions(df_recipes, df_interactions, directory, partitions)
+        if workers == 1:
+            partials = [aggregate_partition(directory, p, chunk_rows) for p in range(partitions)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                partials = list(pool.map(aggregate_partition, [directory] * partitions, range(partitions),
+                                         [chunk_rows] * partitions))
+    agg, moments = reduce_partials(partials, keys, df_interactions)
+
+    stats = recipe_stats(df_recipes, agg)
+    if ingredient_index is None:
+        ingredient_index = IngredientIndex.from_recipes(df_recipes)
+    correlation = correlation_from_moments(moments) if moments['likes_total'] > 0 else None
+    ingredient_engagement = ingredient_index.mean_per_ingredient(
+        agg['likes'] + agg['rating_sum'], agg['rows'], name='engagement'
+    )
+    return report_insights(df_recipes, stats, correlation, ingredient_index.counter(), ingredient_engagement)
@@ -0,0 +1,475 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import instrumentation
+from analytics import (COLUMNAR_DIR, EXPORT_DIR, INGREDIENT_INDEX_PATH, INTERACTION_FIELDS, RECIPE_FIELDS,
+                       aggregate_interactions, fetch_columnar, fetch_data, fetch_snapshot, init_firestore,
+                       recipe_stats)
+from ingredient_index import IngredientIndex
+
+# -------------------------------------------------------------------
+# WARM QUERY SERVICE
+#
+# Loads recipes and interactions once and answers the analytics insights as
+# parameterized HTTP queries, instead of a fresh analytics.py process per
+# dashboard refresh:
+#   GET /top?metric=likes&n=10      views, likes, rating, like_view_ratio, interactions
+#   GET /ingredients?by=count&n=10  count or engagement
+#   GET /summary                    prep time, difficulty mix, prep-time/likes correlation
+#   GET /insights                   all ten insights at once
+#   GET /version, GET /metrics, POST /reload
+# Every query takes cuisine= and difficulty= (comma-separated, any case)
+# and since=/until= (ISO dates, interactions' createdAt in [since, until)).
+#
+# Interactions are kept sorted by createdAt, so a date range is a binary
+# search and one slice to aggregate; without one, the per-recipe sums built
+# at load time are reused. Recipe filters only select rows of those sums.
+#
+# Answers are cached as encoded JSON, along with the per-recipe stats they
+# came from, in an LRU bounded by CACHE_BYTES. Keys carry the data version:
+# a reload (POST /reload, or the source files changing under --poll) swaps
+# in new data, bumps the version and empties the cache, while queries that
+# already started finish on the data they began with. Concurrent requests
+# for a key that is being computed wait for that one computation.
+# -------------------------------------------------------------------
+HOST = "127.0.0.1"
+PORT = 8765
+CACHE_BYTES = 256 * 1024 * 1024
+POLL_SECONDS = 5.0
+DEFAULT_N = 10
+MAX_N = 1000
+RECIPE_COLUMNS = RECIPE_FIELDS + ['cuisine']
+INTERACTION_COLUMNS = INTERACTION_FIELDS + ['createdAt']
+AGG_COLUMNS = ['interactionId', 'recipeId', 'views', 'likes', 'rating']
+# Query metric -> recipe_stats column; the names follow analytics.py's lists.
+METRICS = {"views": "views", "likes": "likes", "rating": "avg_rating",
+           "like_view_ratio": "like_view_ratio", "interactions": "interactions"}
+QUERIES = ["top", "ingredients", "summary", "insights"]
+
+# ---------------- SOURCES ----------------
+def snapshot_source(export_dir=EXPORT_DIR):
+    def load():
+        df_recipes, df_interactions = fetch_snapshot(export_dir, recipe_fields=RECIPE_COLUMNS,
+                                                     interaction_fields=INTERACTION_COLUMNS)
+        return df_recipes, df_interactions, IngredientIndex.load_or_build(df_recipes, INGREDIENT_INDEX_PATH)
+    paths = [os.path.join(export_dir, f"{name}.json") for name in ["recipes", "interactions"]]
+    return load, lambda: file_stamps(paths)
+
+def columnar_source(columnar_dir=COLUMNAR_DIR):
+    def load():
+        return fetch_columnar(columnar_dir, recipe_fields=RECIPE_COLUMNS, interaction_fields=INTERACTION_COLUMNS)
+    paths = [os.path.join(columnar_dir, table, columnar.SCHEMA_FILE)
+             for table in ["recipe", "interactions", "ingredients"]]
+    return load, lambda: file_stamps(paths)
+
+def firestore_source(db):
+    # Live collections have no cheap change marker: reload with POST /reload.
+    def load():
+        df_recipes, df_interactions = fetch_data(db)
+        return df_recipes, df_interactions, IngredientIndex.load_or_build(df_recipes, INGREDIENT_INDEX_PATH)
+    return load, None
+
+def file_stamps(paths):
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps.append((path, st.st_size, st.st_mtime_ns))
+        except OSError:
+            stamps.append((path, None, None))
+    return tuple(stamps)
+
+# ---------------- WARM DATA ----------------
+def utc_times(values):
+    return pd.to_datetime(pd.Series(values), utc=True, errors='coerce', format='ISO8601')
+
+def casefolded(values):
+    return pd.Series(values, dtype=object).map(lambda v: v.casefold() if isinstance(v, str) else v)
+
+class WarmData:
+    # One loaded version of the data; never modified after construction.
+    def __init__(self, version, df_recipes, df_interactions, ingredient_index):
+        self.version = version
+        self.loaded_at = pd.Timestamp.now(tz="UTC").isoformat()
+        self.recipes = df_recipes.reset_index(drop=True)
+        self.cuisines = casefolded(self.recipes.get('cuisine', pd.Series(None, index=self.recipes.index)))
+        self.difficulties = casefolded(self.recipes['difficulty'])
+
+        # Sorted by createdAt; undated interactions (NaT, the smallest int64)
+        # come first and are left out of every date range.
+        times = utc_times(df_interactions['createdAt']) if 'createdAt' in df_interactions \
+            else pd.Series(pd.NaT, index=df_interactions.index, dtype='datetime64[ns, UTC]')
+        ns = times.dt.tz_convert(None).to_numpy().astype('datetime64[ns]').view(np.int64)
+        order = np.argsort(ns, kind='stable')
+        self.times = ns[order]
+        self.undated = int(np.count_nonzero(times.isna().to_numpy()))
+        self.interactions = df_interactions[AGG_COLUMNS].take(order).reset_index(drop=True)
+        self.agg = aggregate_interactions(self.interactions)
+        self.index = ingredient_index
+
+    def rows_between(self, since, until):
+        lo = self.undated if since is None else max(self.undated, int(np.searchsorted(self.times, since.value)))
+        hi = len(self.times) if until is None else int(np.searchsorted(self.times, until.value))
+        return lo, max(lo, hi)
+
+    def recipe_mask(self, cuisines, difficulties):
+        mask = np.ones(len(self.recipes), dtype=bool)
+        if cuisines:
+            mask &= self.cuisines.isin(cuisines).to_numpy()
+        if difficulties:
+            mask &= self.difficulties.isin(difficulties).to_numpy()
+        return mask
+
+# ---------------- QUERIES ----------------
+def parse_list(params, name):
+    values = [v.strip().casefold() for raw in params.get(name, []) for v in raw.split(",") if v.strip()]
+    return tuple(sorted(set(values)))
+
+def parse_time(params, name):
+    raw = params.get(name, [None])[-1]
+    if not raw:
+        return None
+    try:
+        ts = pd.Timestamp(raw)
+    except ValueError:
+        raise ValueError(f"{name}: not an ISO date or timestamp: {raw!r}")
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+def parse_query(name, params):
+    # A canonical, hashable key: the same question always maps to one key.
+    if name not in QUERIES:
+        raise KeyError(name)
+    filters = (parse_list(params, "cuisine"), parse_list(params, "difficulty"),
+               parse_time(params, "since"), parse_time(params, "until"))
+    options = ()
+    if name == "top":
+        metric = params.get("metric", ["likes"])[-1]
+        if metric not in METRICS:
+            raise ValueError(f"metric: one of {', '.join(METRICS)}")
+        options = (metric,)
+    elif name == "ingredients":
+        by = params.get("by", ["count"])[-1]
+        if by not in ("count", "engagement"):
+            raise ValueError("by: count or engagement")
+        options = (by,)
+    if name in ("top", "ingredients"):
+        try:
+            n = int(params.get("n", [DEFAULT_N])[-1])
+        except ValueError:
+            raise ValueError("n: an integer")
+        options += (min(max(n, 1), MAX_N),)
+    return name, filters, options
+
+def plain(value):
+    # JSON-safe scalars: numpy numbers to Python, NaN to null.
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    return value
+
+def top_rows(stats, metric, n):
+    # Same ordering as analytics.top_by, keeping recipeId alongside title.
+    column = METRICS[metric]
+    rows = stats.loc[stats[column].sort_values(ascending=False).head(n).index]
+    return [{"recipeId": plain(rid), "title": plain(title), metric: plain(value)}
+            for rid, title, value in zip(rows['recipeId'], rows['title'], rows[column])]
+
+def filtered_stats(data, filters):
+    # Per-recipe stats (analytics.recipe_stats) under the recipe and date filters.
+    cuisines, difficulties, since, until = filters
+    if since is None and until is None:
+        agg = data.agg
+    else:
+        lo, hi = data.rows_between(since, until)
+        agg = aggregate_interactions(data.interactions.iloc[lo:hi])
+    recipes = data.recipes[data.recipe_mask(cuisines, difficulties)]
+    stats = recipe_stats(recipes, agg)
+    return recipes, agg[agg.index.isin(stats['recipeId'])], stats
+
+def ingredient_rows(data, recipes, agg, by, n, whole):
+    if by == "count":
+        if whole:
+            counts = data.index.counter()
+        else:
+            rows = np.isin(data.index.recipe_ids, recipes['recipeId'].to_numpy(dtype=object))
+            totals = np.bincount(data.index.codes, weights=np.repeat(rows, data.index.row_lengths()),
+                                 minlength=len(data.index.names)).astype(np.int64)
+            counts = Counter({name: count for name, count in zip(data.index.names.tolist(), totals.tolist())
+                              if count})
+        return [{"ingredient": name, "count": count} for name, count in counts.most_common(n)]
+    engagement = data.index.mean_per_ingredient(agg['likes'] + agg['rating_sum'], agg['rows'], name='engagement')
+    engagement = engagement.sort_values(ascending=False).head(n)
+    return [{"ingredient": name, "engagement": plain(value)} for name, value in engagement.items()]
+
+def summary(recipes, agg, stats):
+    correlation = None
+    if agg['likes'].sum() > 0:
+        correlation = plain(stats['prepTimeMinutes'].corr(stats['likes_mean']))
+    prep = pd.to_numeric(recipes['prepTimeMinutes'], errors='coerce').mean()
+    return {"recipes": len(recipes), "recipes_with_interactions": len(stats),
+            "interactions": int(agg['rows'].sum()), "avg_prep_time_minutes": plain(prep),
+            "difficulty_distribution": {str(k): int(v) for k, v in recipes['difficulty'].value_counts().items()},
+            "prep_time_likes_correlation": correlation}
+
+# ---------------- SERVICE ----------------
+def size_of(value):
+    if isinstance(value, bytes):
+        return len(value)
+    return sum(int(frame.memory_usage(index=True).sum()) for frame in value)
+
+class QueryService:
+    def __init__(self, load, fingerprint=None, cache_bytes=CACHE_BYTES):
+        self.load = load
+        self.fingerprint = fingerprint
+        self.cache_bytes = cache_bytes
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cached = 0
+        self._inflight = {}
+        self.hits = self.misses = 0
+        self.data = None
+        self.stamp = None
+        self.reload()
+
+    # ---------------- DATA VERSIONS ----------------
+    def reload(self):
+        # Loads outside the cache lock, so queries keep being answered from
+        # the current version until the new one is swapped in.
+        with self.reload_lock:
+            stamp = self.fingerprint() if self.fingerprint else None
+            start = time.perf_counter()
+            with instrumentation.stage("load"):
+                df_recipes, df_interactions, ingredient_index = self.load()
+                if ingredient_index is None:
+                    ingredient_index = IngredientIndex.from_recipes(df_recipes)
+                version = self.data.version + 1 if self.data else 1
+                data = WarmData(version, df_recipes, df_interactions, ingredient_index)
+            with self.lock:
+                self.data, self.stamp = data, stamp
+                self._cache.clear()
+                self._cached = 0
+            print(f"Loaded version {version}: {len(data.recipes)} recipes, {len(data.interactions)} interactions "
+                  f"in {time.perf_counter() - start:.3f}s")
+            return version
+
+    def refresh(self):
+        # Reloads when the source files changed since the last load.
+        if self.fingerprint and self.fingerprint() != self.stamp:
+            return self.reload()
+        return None
+
+    def watch(self, interval=POLL_SECONDS):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as exc:  # keep serving the loaded version
+                    print(f"Reload failed: {exc!r}")
+        threading.Thread(target=loop, name="query-service-watch", daemon=True).start()
+
+    # ---------------- CACHE ----------------
+    def cached(self, data, key, compute):
+        # Single flight: the first request for a key computes it, concurrent
+        # ones wait for its result instead of recomputing.
+        key = (data.version,) + key
+        with self.lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            pending = self._inflight.get(key)
+            if pending is None:
+                self.misses += 1
+                pending = self._inflight[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+        try:
+            value = compute()
+        except BaseException as exc:
+            with self.lock:
+                del self._inflight[key]
+            pending.set_exception(exc)
+            raise
+        with self.lock:
+            del self._inflight[key]
+            # A result computed on a version that has since been replaced is
+            # returned but not kept.
+            if data is self.data:
+                self._cache[key] = value
+                self._cached += size_of(value)
+                while self._cached > self.cache_bytes and len(self._cache) > 1:
+                    _, old = self._cache.popitem(last=False)
+                    self._cached -= size_of(old)
+        pending.set_result(value)
+        return value
+
+    def stats_for(self, data, filters):
+        return self.cached(data, ("stats", filters), lambda: filtered_stats(data, filters))
+
+    def answer(self, data, name, filters, options):
+        recipes, agg, stats = self.stats_for(data, filters)
+        whole = not any(filters)
+        if name == "top":
+            return {"metric": options[0], "recipes": top_rows(stats, *options)}
+        if name == "ingredients":
+            return {"by": options[0], "ingredients": ingredient_rows(data, recipes, agg, *options, whole)}
+        if name == "summary":
+            return summary(recipes, agg, stats)
+        return {"top_views": top_rows(stats, "views", DEFAULT_N),
+                "top_likes": top_rows(stats, "likes", DEFAULT_N),
+                "top_rating": top_rows(stats, "rating", DEFAULT_N),
+                **summary(recipes, agg, stats),
+                "top_ingredients": ingredient_rows(data, recipes, agg, "count", DEFAULT_N, whole),
+                "ingredient_engagement": ingredient_rows(data, recipes, agg, "engagement", DEFAULT_N, whole),
+                "top_like_view_ratio": top_rows(stats, "like_view_ratio", DEFAULT_N),
+                "top_interactions": top_rows(stats, "interactions", DEFAULT_N)}
+
+    def query(self, name, params):
+        # Returns (data version, encoded JSON). params: name -> list of
+        # strings, as parse_qs gives them. Raises KeyError for an unknown
+        # query and ValueError for a bad parameter.
+        name, filters, options = parse_query(name, params)
+        data = self.data
+        cuisines, difficulties, since, until = filters
+
+        def compute():
+            result = {"query": name, "version": data.version,
+                      "filters": {"cuisine": list(cuisines), "difficulty": list(difficulties),
+                                  "since": since and since.isoformat(), "until": until and until.isoformat()},
+                      **self.answer(data, name, filters, options)}
+            return json.dumps(result, default=plain).encode("utf-8")
+        return data.version, self.cached(data, ("query", name, filters, options), compute)
+
+    def status(self):
+        with self.lock:
+            data = self.data
+            return {"version": data.version, "loaded_at": data.loaded_at, "recipes": len(data.recipes),
+                    "interactions": len(data.interactions),
+                    "cache": {"entries": len(self._cache), "bytes": self._cached, "limit": self.cache_bytes,
+                              "hits": self.hits, "misses": self.misses}}
+
+# ---------------- HTTP ----------------
+class QueryHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open, so a dashboard's repeated queries
+    # don't pay for a TCP handshake each; with Nagle's algorithm on, the body
+    # written after the headers would wait out the client's delayed ACK.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    service = None
+    verbose = False
+
+    def send(self, status, body, version=None, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if version is not None:
+            self.send_header("X-Data-Version", str(version))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def error(self, status, message):
+        self.send(status, json.dumps({"error": message}).encode("utf-8"))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        name = url.path.strip("/")
+        if name == "version":
+            return self.send(200, json.dumps(self.service.status()).encode("utf-8"))
+        if name == "metrics":
+            return self.send(200, instrumentation.METRICS.prometheus().encode("utf-8"),
+                             content_type="text/plain; version=0.0.4")
+        if name not in QUERIES:
+            return self.error(404, f"unknown query {name!r}; one of {', '.join(QUERIES)}")
+        try:
+            version, body = self.service.query(name, parse_qs(url.query))
+        except ValueError as exc:
+            return self.error(400, str(exc))
+        except Exception as exc:
+            # A bug, not a bad request: keep serving, but leave the traceback
+            # on stderr even when request logging is off.
+            traceback.print_exc()
+            return self.error(500, f"{type(exc).__name__} while answering {name!r}")
+        self.send(200, body, version)
+
+    def do_POST(self):
+        if urlsplit(self.path).path.strip("/") != "reload":
+            return self.error(404, "POST /reload")
+        try:
+            version = self.service.reload()
+        except Exception as exc:
+            # The source may be mid-write or unreachable; the loaded version
+            # keeps serving, and the traceback goes to stderr as in do_GET.
+            traceback.print_exc()
+            current = self.service.data.version if self.service.data else None
+            return self.error(500, f"reload failed ({type(exc).__name__}: {exc}); still serving version {current}")
+        self.send(200, json.dumps({"version": version}).encode("utf-8"), version)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+def serve(service, host=HOST, port=PORT, verbose=False):
+    handler = type("Handler", (QueryHandler,), {"service": service, "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+# ---------------- MAIN ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the recipe insights from memory as cached HTTP queries.")
+    parser.add_argument("--source", choices=["firestore", "snapshot", "columnar"], default="snapshot")
+    parser.add_argument("--export-dir", default=EXPORT_DIR)
+    parser.add_argument("--columnar-dir", default=COLUMNAR_DIR)
+    parser.add_argument("--fake", action="store_true",
+                        help="with --source firestore, query an in-process fake client preloaded from --export-dir")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--cache-mb", type=float, default=CACHE_BYTES / 2 ** 20, help="memory for cached results")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help="seconds between checks for changed source files (0: only POST /reload)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    instrumentation.configure("query_service")
+    if args.source == "snapshot":
+        load, fingerprint = snapshot_source(args.export_dir)
+    elif args.source == "columnar":
+        load, fingerprint = columnar_source(args.columnar_dir)
+    else:
+        if args.fake:
+            from fake_firestore import FakeFirestore
+            db = FakeFirestore.from_export(args.export_dir)
+        else:
+            db = init_firestore()
+        load, fingerprint = firestore_source(db)
+
+    service = QueryService(load, fingerprint, cache_bytes=int(args.cache_mb * 2 ** 20))
+    if fingerprint and args.poll > 0:
+        service.watch(args.poll)
+    server = serve(service, args.host, args.port, args.verbose)
+    print(f"Serving {', '.join('/' + q for q in QUERIES)} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
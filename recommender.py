@@ -0,0 +1,451 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import argparse
+import itertools
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import columnar
+from columnar import iter_table, read_table, table_path
+from json_stream import iter_json_array
+
+# -------------------------------------------------------------------
+# ITEM-ITEM RECOMMENDATIONS
+#
+# Interactions become a sparse user x recipe matrix X of implicit-feedback
+# weights. Recipe similarity is the cosine between columns of X, computed
+# as blocks of rows of X^T X (one sparse product per block, blocks spread
+# across processes), keeping only each recipe's top-K neighbours.
+#
+# A user's recommendations are the neighbours of everything they have
+# interacted with, summed by weight x similarity, minus what they have
+# already seen, then filtered by diet and difficulty. Unknown users and
+# users whose neighbours are all filtered out fall back to the most
+# popular recipes that pass the same filters.
+#
+#   <model>/_meta.json
+#   <model>/recipes/, users/       columnar tables, row = code
+#   <model>/neighbours.npy         recipes x K codes (-1 = none)
+#   <model>/similarities.npy       recipes x K cosine similarities
+#   <model>/history_*.npy          CSR rows of X, one per user
+#   <model>/popular.npy            recipe codes, most interacted first
+# -------------------------------------------------------------------
+MODEL_DIR = "recommender_model"
+EXPORT_DIR = "firestore_export"
+META_FILE = "_meta.json"
+TOP_K = 50  # neighbours kept per recipe
+BLOCK_SIZE = 2_000  # recipes per similarity block
+DENSE_CELLS = 16_000_000  # top-K selection works on at most this many dense cells at once
+DENSE_FRACTION = 0.01  # ...when at least this share of them are non-zero
+BATCH_SIZE = 500_000  # interactions per read batch
+RESULT_CACHE = 100_000  # recommendation lists kept per loaded model
+MAX_HISTORY = 200  # strongest interactions per user used to score candidates
+DIETS = ["vegetarian", "vegan", "gluten-free", "keto"]  # "non-veg" excludes nothing
+# A recipe fits a diet when none of its ingredient names match.
+DIET_EXCLUDES = {
+    "vegetarian": r"chicken|mutton|lamb|beef|pork|fish|prawns?|shrimp|surmai|kingfish|egg|eggs",
+    "vegan": r"chicken|mutton|lamb|beef|pork|fish|prawns?|shrimp|surmai|kingfish|egg|eggs|milk|butter|cream|"
+             r"cheese|paneer|yogurt|curd|ghee|honey",
+    "gluten-free": r"flour|bread|noodles|pasta|wheat|maida|semolina|soy sauce",
+    "keto": r"sugar|rice|potato|flour|bread|noodles|pasta|honey|banana|lentils",
+}
+DIFFICULTIES = ["easy", "medium", "hard"]
+SKILL_DIFFICULTIES = {"beginner": ["easy"], "intermediate": ["easy", "medium"], "expert": DIFFICULTIES}
+
+# ---------------- INPUTS ----------------
+def interaction_weights(df):
+    # Any interaction counts 1; likes and ratings above 3 count extra.
+    def number(name):
+        values = df[name] if name in df.columns else pd.Series(np.nan, index=df.index)
+        return pd.to_numeric(values, errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    return 1 + np.log1p(np.maximum(number("likes"), 0)) + np.maximum(number("rating") - 3, 0)
+
+def diet_bits(ingredient_names):
+    # One bit per entry of DIETS, set when the recipe fits that diet.
+    names = pd.Series(ingredient_names, dtype=object).fillna("").str.lower()
+    bits = np.zeros(len(names), dtype=np.uint8)
+    for d, diet in enumerate(DIETS):
+        bits |= (~names.str.contains(rf"\b(?:{DIET_EXCLUDES[diet]})\b", regex=True)).to_numpy(dtype=np.uint8) << d
+    return bits
+
+def split_list(value):
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    if isinstance(value, str) and value:
+        return value.split(",")
+    return []
+
+def export_sources(export_dir):
+    def recipes():
+        rows = [{"recipeId": d.get("recipeId"), "title": d.get("title"), "difficulty": d.get("difficulty"),
+                 "ingredients": "|".join(str(i.get("name")) for i in d.get("ingredients") or [])}
+                for d in iter_json_array(os.path.join(export_dir, "recipes.json"))]
+        return pd.DataFrame(rows, columns=["recipeId", "title", "difficulty", "ingredients"])
+
+    def users():
+        path = os.path.join(export_dir, "users.json")
+        rows = [{"userId": d.get("userId"), "skillLevel": d.get("skillLevel"),
+                 "dietPreferences": ",".join(split_list(d.get("dietPreferences")))}
+                for d in iter_json_array(path)] if os.path.exists(path) else []
+        return pd.DataFrame(rows, columns=["userId", "skillLevel", "dietPreferences"])
+
+    def interactions():
+        docs = iter_json_array(os.path.join(export_dir, "interactions.json"))
+        while batch := list(itertools.islice(docs, BATCH_SIZE)):
+            yield pd.DataFrame(batch).reindex(columns=["userId", "recipeId", "likes", "rating"])
+
+    return recipes, users, interactions
+
+def table_sources(data_dir):
+    # CSV or columnar normalized tables. The CSV interactions carry ratings
+    # but no likes.
+    def recipes():
+        df = read_table(table_path(data_dir, "recipe.csv"), ["recipeId", "title", "difficulty"])
+        ingredients = read_table(table_path(data_dir, "ingredients.csv"), ["recipeId", "name"]).dropna()
+        names = ingredients.groupby("recipeId")["name"].agg("|".join)
+        return df.assign(ingredients=df["recipeId"].map(names))
+
+    def users():
+        path = table_path(data_dir, "users.csv")
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=["userId", "skillLevel", "dietPreferences"])
+        return read_table(path, ["userId", "skillLevel", "dietPreferences"])
+
+    def interactions():
+        yield from iter_table(table_path(data_dir, "interactions.csv"), BATCH_SIZE,
+                              ["userId", "recipeId", "likes", "rating"])
+
+    return recipes, users, interactions
+
+def encode(index, values):
+    # Codes for values, extending the (append-only) index with new keys.
+    codes = index.get_indexer(values)
+    if (codes == -1).any():
+        index = index.append(pd.Index(pd.unique(values[codes == -1]), dtype=object))
+        codes = index.get_indexer(values)
+    return index, codes
+
+# ---------------- SIMILARITY ----------------
+_matrices = {}
+
+def load_matrices(path):
+    # Worker state: the normalized item-major matrix and its transpose,
+    # memory-mapped from the build directory once per process.
+    if path not in _matrices:
+        def csr(name, shape):
+            arrays = [np.load(os.path.join(path, f"{name}_{part}.npy"), mmap_mode="r")
+                      for part in ("data", "indices", "indptr")]
+            return sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+        with open(os.path.join(path, "shape.json"), encoding="utf-8") as f:
+            users, recipes = json.load(f)
+        _matrices[path] = (csr("items", (recipes, users)), csr("users", (users, recipes)))
+    return _matrices[path]
+
+def similarity_block(path, start, stop, k):
+    # Top-k cosine neighbours of recipes [start, stop).
+    items, users = load_matrices(path)
+    block = (items[start:stop] @ users).tocsr()
+    neighbours = np.full((stop - start, k), -1, dtype=np.int32)
+    similarities = np.zeros((stop - start, k), dtype=np.float32)
+    step = max(1, DENSE_CELLS // max(block.shape[1], 1))
+    for a in range(0, stop - start, step):
+        part = block[a:a + step]
+        select = top_k_dense if part.nnz > DENSE_FRACTION * part.shape[0] * part.shape[1] else top_k_sparse
+        neighbours[a:a + part.shape[0]], similarities[a:a + part.shape[0]] = select(part, start + a, k)
+    return start, neighbours, similarities
+
+def top_k_dense(part, first, k):
+    # Popular recipes co-occur with most others. A dense partition finds each
+    # row's k-th best score, and only entries at or above it (ties included,
+    # so the result matches top_k_sparse) are sorted.
+    rows = part.shape[0]
+    dense = part.toarray()
+    dense[np.arange(rows), np.arange(first, first + rows)] = 0  # not its own neighbour
+    if k < dense.shape[1]:
+        kth = -np.partition(-dense, k - 1, axis=1)[:, k - 1:k]
+        dense[dense < kth] = 0
+    return top_k_sparse(sparse.csr_matrix(dense), first, k)
+
+def top_k_sparse(part, first, k):
+    rows = np.repeat(np.arange(part.shape[0]), np.diff(part.indptr))
+    keep = (part.indices != rows + first) & (part.data > 0)
+    rows, cols, sims = rows[keep], part.indices[keep], part.data[keep]
+    order = np.lexsort((cols, -sims, rows))
+    rows, cols, sims = rows[order], cols[order], sims[order]
+    counts = np.bincount(rows, minlength=part.shape[0])
+    rank = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    top = rank < k
+    neighbours = np.full((part.shape[0], k), -1, dtype=np.int32)
+    similarities = np.zeros((part.shape[0], k), dtype=np.float32)
+    neighbours[rows[top], rank[top]] = cols[top]
+    similarities[rows[top], rank[top]] = sims[top]
+    return neighbours, similarities
+
+def save_csr(path, name, matrix):
+    for part in ("data", "indices", "indptr"):
+        np.save(os.path.join(path, f"{name}_{part}.npy"), getattr(matrix, part))
+
+# ---------------- BUILD ----------------
+def build(sources, out_dir=MODEL_DIR, k=TOP_K, block_size=BLOCK_SIZE, workers=None):
+    recipes_of, users_of, interactions_of = sources
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+
+    recipes = recipes_of().drop_duplicates("recipeId", keep="last").reset_index(drop=True)
+    users = users_of().drop_duplicates("userId", keep="last").reset_index(drop=True)
+    recipe_index = pd.Index(recipes["recipeId"].to_numpy(dtype=object), dtype=object)
+    user_index = pd.Index(users["userId"].to_numpy(dtype=object), dtype=object)
+
+    # One streaming pass over interactions, kept as (user, recipe, weight).
+    parts, interactions = [], 0
+    for df in interactions_of():
+        df = df.dropna(subset=["userId", "recipeId"])
+        user_index, user_codes = encode(user_index, df["userId"].to_numpy(dtype=object))
+        recipe_index, recipe_codes = encode(recipe_index, df["recipeId"].to_numpy(dtype=object))
+        parts.append((user_codes.astype(np.int32), recipe_codes.astype(np.int32),
+                      interaction_weights(df).astype(np.float32)))
+        interactions += len(df)
+    shape = (len(user_index), len(recipe_index))
+    if parts:
+        u, r, w = (np.concatenate(p) for p in zip(*parts))
+    else:
+        u, r, w = np.zeros(0, np.int32), np.zeros(0, np.int32), np.zeros(0, np.float32)
+    del parts
+    history = sparse.csr_matrix((w, (u, r)), shape=shape, dtype=np.float32)  # duplicates are summed
+    history.sum_duplicates()
+    del u, r, w
+    read_s = time.perf_counter() - start
+
+    tmp = out_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    save_csr(tmp, "history", history)
+
+    # Cosine similarity = dot products of L2-normalized recipe columns.
+    norms = np.sqrt(np.asarray(history.multiply(history).sum(axis=0)).ravel())
+    normalized = (history @ sparse.diags(np.where(norms > 0, 1 / np.maximum(norms, 1e-12), 0))).tocsr()
+    normalized.data = normalized.data.astype(np.float32)
+    work = os.path.join(tmp, "work")
+    os.makedirs(work)
+    save_csr(work, "users", normalized)
+    save_csr(work, "items", normalized.T.tocsr())
+    with open(os.path.join(work, "shape.json"), "w", encoding="utf-8") as f:
+        json.dump(shape, f)
+    del normalized
+
+    neighbours = np.lib.format.open_memmap(os.path.join(tmp, "neighbours.npy"), mode="w+", dtype=np.int32,
+                                           shape=(shape[1], k))
+    similarities = np.lib.format.open_memmap(os.path.join(tmp, "similarities.npy"), mode="w+",
+                                             dtype=np.float32, shape=(shape[1], k))
+    blocks = [(b, min(b + block_size, shape[1])) for b in range(0, shape[1], block_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Workers memory-map the matrices; each block comes back as K columns.
+        for b, block_neighbours, block_sims in pool.map(similarity_block, itertools.repeat(work),
+                                                        *zip(*blocks), itertools.repeat(k)) if blocks else []:
+            neighbours[b:b + len(block_neighbours)] = block_neighbours
+            similarities[b:b + len(block_sims)] = block_sims
+    neighbours.flush()
+    similarities.flush()
+    del neighbours, similarities
+    shutil.rmtree(work)
+
+    popularity = np.bincount(history.indices, minlength=shape[1])
+    np.save(os.path.join(tmp, "popular.npy"), np.argsort(-popularity, kind="stable").astype(np.int32))
+
+    # Recipe and user attributes, aligned with the codes.
+    recipes = recipes.set_index("recipeId").reindex(recipe_index).rename_axis("recipeId").reset_index()
+    recipes["diets"] = diet_bits(recipes["ingredients"])
+    columnar.write_frame(recipes[["recipeId", "title", "difficulty", "diets"]], os.path.join(tmp, "recipes"))
+    users = users.set_index("userId").reindex(user_index).rename_axis("userId").reset_index()
+    columnar.write_frame(users[["userId", "skillLevel", "dietPreferences"]], os.path.join(tmp, "users"))
+
+    meta = {"version": 1, "built": pd.Timestamp.now(tz="UTC").isoformat(), "k": k, "users": shape[0],
+            "recipes": shape[1], "interactions": interactions, "pairs": int(history.nnz)}
+    with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=4)
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.replace(tmp, out_dir)
+    print(f" Read {interactions} interactions in {read_s:.2f}s; model of {shape[0]} users x {shape[1]} recipes "
+          f"built in {time.perf_counter() - start:.2f}s")
+    return meta
+
+# ---------------- SERVING ----------------
+class Recommender:
+    def __init__(self, path=MODEL_DIR):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        # Memory-mapped, viewed as plain arrays: slicing a np.memmap costs
+        # more than the lookup itself.
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r").view(np.ndarray)
+        self.neighbours, self.similarities = load("neighbours.npy"), load("similarities.npy")
+        self.popular = load("popular.npy")
+        self.indptr, self.items, self.weights = load("history_indptr.npy"), load("history_indices.npy"), \
+            load("history_data.npy")
+
+        recipes = columnar.read_frame(os.path.join(path, "recipes"), mmap=False)
+        self.recipe_ids = recipes["recipeId"].to_numpy(dtype=object)
+        self.titles = recipes["title"].to_numpy(dtype=object)
+        self.recipe_diets = recipes["diets"].to_numpy(dtype=np.uint8)
+        self.recipe_levels = pd.Categorical(recipes["difficulty"], categories=DIFFICULTIES).codes.astype(np.int8)
+        self.recipe_index = pd.Index(self.recipe_ids, dtype=object)
+
+        users = columnar.read_frame(os.path.join(path, "users"), mmap=False)
+        self.user_index = pd.Index(users["userId"].to_numpy(dtype=object), dtype=object)
+        self.skills = users["skillLevel"].to_numpy(dtype=object)
+        self.user_diets = users["dietPreferences"].to_numpy(dtype=object)
+        self._cache = OrderedDict()
+
+    def profile_filters(self, user, diet, difficulty):
+        # Explicit arguments win; otherwise the user's dietPreferences and a
+        # skill-appropriate difficulty. Pass () to turn a filter off.
+        if diet is None:
+            diet = split_list(self.user_diets[user]) if user is not None else []
+        if difficulty is None:
+            skill = self.skills[user] if user is not None else None
+            difficulty = SKILL_DIFFICULTIES.get(skill, DIFFICULTIES)
+        need = 0
+        for d in [diet] if isinstance(diet, str) else diet:
+            if d in DIETS:
+                need |= 1 << DIETS.index(d)
+        levels = 0
+        for level in [difficulty] if isinstance(difficulty, str) else (difficulty or DIFFICULTIES):
+            if level in DIFFICULTIES:
+                levels |= 1 << DIFFICULTIES.index(level)
+        return need, levels
+
+    def allowed(self, codes, need, levels):
+        # A recipe with no difficulty passes every difficulty filter.
+        level = self.recipe_levels[codes].astype(np.int64)
+        level_bits = np.where(level >= 0, 1 << np.maximum(level, 0), (1 << len(DIFFICULTIES)) - 1)
+        return ((self.recipe_diets[codes] & need) == need) & ((level_bits & levels) != 0)
+
+    def recommend(self, user_id, n=10, diet=None, difficulty=None):
+        # [(recipeId, title, score)], best first. Repeated lookups are served
+        # from an LRU cache of results.
+        key = (user_id, n, diet if diet is None or isinstance(diet, str) else tuple(diet),
+               difficulty if difficulty is None or isinstance(difficulty, str) else tuple(difficulty))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        user = lookup(self.user_index, user_id)
+        need, levels = self.profile_filters(user, diet, difficulty)
+        picks, scores = np.zeros(0, dtype=np.int64), np.zeros(0)
+        seen = np.zeros(0, dtype=np.int64)
+        if user is not None:
+            seen = np.asarray(self.items[self.indptr[user]:self.indptr[user + 1]], dtype=np.int64)
+            weights = np.asarray(self.weights[self.indptr[user]:self.indptr[user + 1]], dtype=np.float64)
+            # Heavy users: only their strongest MAX_HISTORY recipes vote.
+            votes = np.argsort(-weights, kind="stable")[:MAX_HISTORY] if len(seen) > MAX_HISTORY else slice(None)
+            candidates = np.asarray(self.neighbours[seen[votes]]).ravel()
+            contributions = (np.asarray(self.similarities[seen[votes]]) * weights[votes, None]).ravel()
+            valid = candidates >= 0
+            picks, inverse = np.unique(candidates[valid], return_inverse=True)
+            scores = np.bincount(inverse, weights=contributions[valid], minlength=len(picks))
+            # Both are sorted, so "already seen" is one binary search.
+            hit = np.searchsorted(seen, picks)
+            already = (hit < len(seen)) & (seen[np.minimum(hit, len(seen) - 1)] == picks)
+            keep = ~already & self.allowed(picks, need, levels)
+            picks, scores = picks[keep], scores[keep]
+            best = np.lexsort((picks, -scores))[:n]
+            picks, scores = picks[best], scores[best]
+        if len(picks) < n:
+            picks, scores = self.fill_popular(picks, scores, seen, n, need, levels)
+
+        result = [(self.recipe_ids[p], self.titles[p], round(float(s), 4)) for p, s in zip(picks, scores)]
+        self._cache[key] = result
+        if len(self._cache) > RESULT_CACHE:
+            self._cache.popitem(last=False)
+        return result
+
+    def fill_popular(self, picks, scores, seen, n, need, levels, chunk=1_000):
+        # Tops up a short list with popular recipes (score 0) that pass the filters.
+        taken = set(picks.tolist()) | set(seen.tolist())
+        extra = []
+        for start in range(0, len(self.popular), chunk):
+            codes = np.asarray(self.popular[start:start + chunk], dtype=np.int64)
+            for code in codes[self.allowed(codes, need, levels)].tolist():
+                if code not in taken:
+                    extra.append(code)
+                    if len(picks) + len(extra) == n:
+                        return np.append(picks, extra).astype(np.int64), np.append(scores, np.zeros(len(extra)))
+        return np.append(picks, extra).astype(np.int64), np.append(scores, np.zeros(len(extra)))
+
+    def similar(self, recipe_id, n=10):
+        code = lookup(self.recipe_index, recipe_id)
+        if code is None:
+            return []
+        return [(self.recipe_ids[c], self.titles[c], round(float(s), 4))
+                for c, s in zip(self.neighbours[code][:n], self.similarities[code][:n]) if c >= 0]
+
+def lookup(index, key):
+    try:
+        position = index.get_loc(key)
+    except KeyError:
+        return None
+    return position if isinstance(position, int) else None
+
+@lru_cache(maxsize=4)
+def cached_model(path, built):
+    return Recommender(path)
+
+def load_model(path=MODEL_DIR):
+    # One loaded model per build: a rebuild changes "built" and reloads.
+    with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+        return cached_model(path, json.load(f)["built"])
+
+# ---------------- MAIN ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the item-item recipe recommender.")
+    parser.add_argument("--model", default=MODEL_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = sub.add_parser("build")
+    source = build_cmd.add_mutually_exclusive_group()
+    source.add_argument("--export-dir", default=EXPORT_DIR)
+    source.add_argument("--data-dir", help="read the normalized tables instead of the JSON export")
+    build_cmd.add_argument("--k", type=int, default=TOP_K, help="neighbours kept per recipe")
+    build_cmd.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    build_cmd.add_argument("--workers", type=int, default=None)
+
+    rec = sub.add_parser("recommend", help="recipes for a user")
+    rec.add_argument("user")
+    rec.add_argument("--n", type=int, default=10)
+    rec.add_argument("--diet", action="append", help="overrides the user's dietPreferences")
+    rec.add_argument("--difficulty", action="append", help="overrides the skill-based difficulty")
+    rec.add_argument("--any", action="store_true", help="ignore the user's diet and skill level")
+
+    sim = sub.add_parser("similar", help="recipes most similar to a recipe")
+    sim.add_argument("recipe")
+    sim.add_argument("--n", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        sources = table_sources(args.data_dir) if args.data_dir else export_sources(args.export_dir)
+        build(sources, args.model, args.k, args.block_size, args.workers)
+    else:
+        model = load_model(args.model)
+        if args.command == "recommend":
+            diet = () if args.any and args.diet is None else args.diet
+            difficulty = () if args.any and args.difficulty is None else args.difficulty
+            call = lambda: model.recommend(args.user, args.n, diet, difficulty)
+        else:
+            call = lambda: model.similar(args.recipe, args.n)
+        start = time.perf_counter()
+        results = call()
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        call()
+        cached = time.perf_counter() - start
+        for recipe_id, title, score in results:
+            print(f"{score:>8.4f}  {recipe_id}  {title}")
+        print(f"\n({first * 1e6:.0f} µs, {cached * 1e6:.1f} µs cached)")
@@ -0,0 +1,400 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar
+from json_stream import iter_json_array
+
+# -------------------------------------------------------------------
+# TIME-BUCKETED ROLLUPS
+#
+# Interactions are pre-aggregated per (bucket, recipe, source) at three
+# grains: hour, day and week (weeks start on Monday). Each grain is a list
+# of columnar segments sorted by bucket, so a time-range query is a binary
+# search and a slice of memory-mapped columns per segment. Cuisine,
+# category and difficulty are recipe attributes, joined through a small
+# recipe dimension table at query time rather than multiplied into the cube.
+#
+#   <store>/_meta.json        recipe/source codes, segment lists, newest event
+#   <store>/recipes/          recipe dimensions, row i = recipe code i
+#   <store>/<grain>/seg-NNNNN bucket, recipe, source + measures
+#
+# Appending writes new segments; compact() merges them back into one.
+# Rollups count events by createdAt: an interaction is added once, when it
+# first arrives, and later edits to it are not re-counted.
+# -------------------------------------------------------------------
+STORE_DIR = "rollups"
+EXPORT_DIR = "firestore_export"
+META_FILE = "_meta.json"
+BATCH_SIZE = 500_000
+GRAINS = {"hour": 1, "day": 24, "week": 168}  # bucket width in hours
+MEASURES = ["interactions", "views", "likes", "rating_sum", "rating_count"]
+RECIPE_DIMENSIONS = ["cuisine", "category", "difficulty"]
+EPOCH = pd.Timestamp("1970-01-01", tz="UTC")
+WEEK_OFFSET = 72  # 1970-01-01 was a Thursday; shift weeks to start on Monday
+
+def hour_buckets(timestamps):
+    return ((timestamps - EPOCH) // pd.Timedelta(hours=1)).to_numpy(dtype=np.int64)
+
+def hour_of(timestamp):
+    ts = pd.Timestamp(timestamp)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    return int((ts - EPOCH) // pd.Timedelta(hours=1))
+
+def to_bucket(hours, grain):
+    if grain == "week":
+        return (hours + WEEK_OFFSET) // GRAINS["week"]
+    return hours // GRAINS[grain]
+
+def bucket_start(bucket, grain):
+    hours = bucket * GRAINS[grain] - (WEEK_OFFSET if grain == "week" else 0)
+    return EPOCH + pd.to_timedelta(hours, unit="h")
+
+def cover(lo, hi):
+    # Splits the hour range [lo, hi) into the fewest whole buckets: weeks
+    # where they fit, days around them and hours at the ragged ends.
+    parts, h = [], lo
+    while h < hi:
+        if (h + WEEK_OFFSET) % GRAINS["week"] == 0 and h + GRAINS["week"] <= hi:
+            grain = "week"
+        elif h % GRAINS["day"] == 0 and h + GRAINS["day"] <= hi:
+            grain = "day"
+        else:
+            grain = "hour"
+        width = GRAINS[grain]
+        # Take whole buckets until the range ends or a coarser grain aligns.
+        end = h + width
+        while end + width <= hi and not (grain == "hour" and end % GRAINS["day"] == 0) \
+                and not (grain == "day" and (end + WEEK_OFFSET) % GRAINS["week"] == 0):
+            end += width
+        start_bucket = to_bucket(h, grain)
+        parts.append((grain, start_bucket, start_bucket + (end - h) // width))
+        h = end
+    return parts
+
+# ---------------- AGGREGATION ----------------
+def field(df, name, numeric=False):
+    values = df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+    return pd.to_numeric(values, errors="coerce") if numeric else values
+
+def aggregate_batch(df, codes):
+    # One batch of raw interactions -> partial rollups for every grain.
+    created = pd.to_datetime(field(df, "createdAt").astype(str), format="ISO8601", utc=True, errors="coerce")
+    keep = created.notna().to_numpy()
+    df, created = df[keep], created[keep]
+    hours = hour_buckets(created)
+    rating = field(df, "rating", numeric=True)
+    frame = pd.DataFrame({
+        "recipe": codes.encode("recipes", field(df, "recipeId")),
+        "source": codes.encode("sources", field(df, "source")),
+        "interactions": 1,
+        "views": field(df, "views", numeric=True).fillna(0).to_numpy(),
+        "likes": field(df, "likes", numeric=True).fillna(0).to_numpy(),
+        "rating_sum": rating.fillna(0).to_numpy(),
+        "rating_count": rating.notna().to_numpy(dtype=np.int64),
+    })
+    partials = {}
+    for grain in GRAINS:
+        frame["bucket"] = to_bucket(hours, grain)
+        partials[grain] = frame.groupby(["bucket", "recipe", "source"], as_index=False)[MEASURES].sum()
+    span = (created.min(), created.max()) if len(created) else None
+    return partials, span
+
+def combine(partials):
+    cube = pd.concat(partials, ignore_index=True).groupby(["bucket", "recipe", "source"], as_index=False)[MEASURES].sum()
+    return cube.sort_values(["bucket", "recipe", "source"], kind="stable").reset_index(drop=True)
+
+class Codes:
+    # Append-only key lists, so a code never changes once written.
+    def __init__(self, recipes=(), sources=()):
+        self.keys = {"recipes": list(recipes), "sources": list(sources)}
+        self.index = {name: pd.Index(keys, dtype=object) for name, keys in self.keys.items()}
+
+    def encode(self, name, values):
+        values = pd.Series(values, dtype=object).where(pd.notna(values), "unknown").to_numpy()
+        codes = self.index[name].get_indexer(values)
+        if (codes == -1).any():
+            new = pd.unique(values[codes == -1])
+            self.keys[name].extend(new.tolist())
+            self.index[name] = pd.Index(self.keys[name], dtype=object)
+            codes = self.index[name].get_indexer(values)
+        return codes.astype(np.int32)
+
+# ---------------- STORE ----------------
+class RollupStore:
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"recipes": [], "sources": [], "earliest": None, "latest": None, "next_segment": 0,
+                         "segments": {grain: [] for grain in GRAINS}}
+        self.codes = Codes(self.meta["recipes"], self.meta["sources"])
+        self._segments = {}
+        self._dimension_cache = {}
+        self._load_dimensions()
+
+    def _load_dimensions(self):
+        dims_path = os.path.join(self.path, "recipes")
+        if columnar.is_table(dims_path):
+            self.dimensions = columnar.read_frame(dims_path, mmap=False)
+        else:
+            self.dimensions = pd.DataFrame(columns=["recipeId", "title"] + RECIPE_DIMENSIONS)
+
+    def _save_meta(self):
+        self.meta["recipes"] = self.codes.keys["recipes"]
+        self.meta["sources"] = self.codes.keys["sources"]
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    # ---------------- WRITING ----------------
+    def append(self, interactions, recipes=None, batch_size=BATCH_SIZE):
+        # interactions: iterable of documents (dicts) or DataFrames. One
+        # streaming pass; only the per-batch partial rollups are kept.
+        os.makedirs(self.path, exist_ok=True)
+        partials = {grain: [] for grain in GRAINS}
+        rows = 0
+        for df in frames(interactions, batch_size):
+            batch, span = aggregate_batch(df, self.codes)
+            for grain, cube in batch.items():
+                partials[grain].append(cube)
+            if span is not None:
+                earliest, latest = self.meta["earliest"], self.meta["latest"]
+                if earliest is None or span[0] < pd.Timestamp(earliest):
+                    self.meta["earliest"] = span[0].isoformat()
+                if latest is None or span[1] > pd.Timestamp(latest):
+                    self.meta["latest"] = span[1].isoformat()
+            rows += len(df)
+
+        if rows:
+            segment = f"seg-{self.meta['next_segment']:05d}"
+            for grain in GRAINS:
+                columnar.write_frame(combine(partials[grain]), os.path.join(self.path, grain, segment))
+                self.meta["segments"][grain].append(segment)
+            self.meta["next_segment"] += 1
+        self.update_recipes(recipes)
+        self._save_meta()
+        return rows
+
+    def update_recipes(self, recipes):
+        # Recipe dimension rows, aligned with the recipe codes.
+        if recipes is not None:
+            recipes = recipes.drop_duplicates("recipeId", keep="last").set_index("recipeId")
+            known = self.dimensions.set_index("recipeId") if len(self.dimensions) else None
+            if known is not None:
+                recipes = recipes.combine_first(known)
+            self.codes.encode("recipes", recipes.index.to_numpy())
+        else:
+            recipes = self.dimensions.set_index("recipeId") if len(self.dimensions) else pd.DataFrame()
+        columns = ["title"] + RECIPE_DIMENSIONS
+        dims = recipes.reindex(index=self.codes.keys["recipes"], columns=columns)
+        dims = dims.astype(object).where(dims.notna(), None).rename_axis("recipeId").reset_index()
+        columnar.write_frame(dims, os.path.join(self.path, "recipes"))
+        self.dimensions = dims
+        self._dimension_cache = {}
+
+    def compact(self):
+        # Merges each grain's segments into one, summing duplicate keys.
+        segment = f"seg-{self.meta['next_segment']:05d}"
+        for grain in GRAINS:
+            old = self.meta["segments"][grain]
+            if len(old) < 2:
+                continue
+            cube = combine([columnar.read_frame(os.path.join(self.path, grain, s), mmap=False) for s in old])
+            columnar.write_frame(cube, os.path.join(self.path, grain, segment))
+            self.meta["segments"][grain] = [segment]
+            self._save_meta()
+            for s in old:
+                self._segments.pop((grain, s), None)
+                shutil.rmtree(os.path.join(self.path, grain, s))
+        self.meta["next_segment"] += 1
+        self._save_meta()
+
+    # ---------------- QUERIES ----------------
+    def window(self, since=None, until=None, last=None, now=None):
+        # Whole hours [lo, hi). "last" counts back from now, which defaults to
+        # the newest interaction in the store; no start means all history.
+        end = hour_of(now or until or self.meta["latest"] or pd.Timestamp.now(tz="UTC"))
+        if last:
+            start = end - int(pd.Timedelta(last) // pd.Timedelta(hours=1))
+        elif since is not None:
+            start = hour_of(since)
+        else:
+            start = hour_of(self.meta["earliest"]) if self.meta["earliest"] else end
+        return start, end + 1
+
+    def _segment(self, grain, segment):
+        # Segments never change once written, so their memory-mapped columns
+        # are opened once per store and reused by every query.
+        key = (grain, segment)
+        if key not in self._segments:
+            path = os.path.join(self.path, grain, segment)
+            self._segments[key] = {c["name"]: columnar.read_column(path, c)
+                                   for c in columnar.read_schema(path)["columns"]}
+        return self._segments[key]
+
+    def _scan(self, parts, columns):
+        # Segments are sorted by bucket: each part is one binary search and a
+        # zero-copy slice per column.
+        pieces = {c: [] for c in columns}
+        for grain, lo, hi in parts:
+            for segment in self.meta["segments"][grain]:
+                arrays = self._segment(grain, segment)
+                a, b = np.searchsorted(arrays["bucket"], [lo, hi])
+                for c in columns:
+                    pieces[c].append(arrays[c][a:b])
+        return pd.DataFrame({c: np.concatenate(p) if p else np.array([], dtype=np.int64)
+                             for c, p in pieces.items()}, copy=False)
+
+    def _dimension_codes(self, name):
+        if name not in self._dimension_cache:
+            codes, labels = pd.factorize(self.dimensions[name], use_na_sentinel=False)
+            self._dimension_cache[name] = (codes, np.asarray(labels, dtype=object))
+        return self._dimension_cache[name]
+
+    def recipe_mask(self, filters):
+        mask = np.ones(len(self.codes.keys["recipes"]), dtype=bool)
+        for name, value in filters.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if name == "recipeId":
+                mask &= self.dimensions["recipeId"].isin(values).to_numpy(dtype=bool)
+            else:
+                codes, labels = self._dimension_codes(name)
+                mask &= np.isin(codes, np.flatnonzero(np.isin(labels, values)))
+        return mask
+
+    def query(self, measure="likes", by="recipe", since=None, until=None, last=None, now=None, top=10,
+              source=None, **recipe_filters):
+        # e.g. query("likes", "recipe", last="7D", source="mobile", cuisine="Indian")
+        # A Series indexed by the group; by="recipe" gives a frame indexed by
+        # recipeId with the recipe's title alongside, as titles can repeat.
+        lo, hi = self.window(since, until, last, now)
+        if by in GRAINS:
+            # A timeline reads one grain, widened to whole buckets.
+            parts = [(by, to_bucket(lo, by), to_bucket(hi - 1, by) + 1)]
+        else:
+            parts = cover(lo, hi)
+        needed = ["rating_sum", "rating_count"] if measure == "avg_rating" else [measure]
+        rows = self._scan(parts, ["bucket", "recipe", "source"] + needed)
+
+        keep = np.ones(len(rows), dtype=bool)
+        if source is not None:
+            sources = source if isinstance(source, (list, tuple, set)) else [source]
+            keep &= np.isin(rows["source"].to_numpy(), self.codes.index["sources"].get_indexer(sources))
+        if recipe_filters:
+            keep &= self.recipe_mask(recipe_filters)[rows["recipe"].to_numpy()]
+        rows = rows[keep]
+
+        if by in GRAINS:
+            groups, labels = pd.factorize(rows["bucket"], sort=True)
+            labels = bucket_start(np.asarray(labels, dtype=np.int64), by)
+        elif by == "recipe":
+            groups = rows["recipe"].to_numpy()
+            labels = self.dimensions["recipeId"].to_numpy()
+        elif by == "source":
+            groups, labels = rows["source"].to_numpy(), np.array(self.codes.keys["sources"], dtype=object)
+        else:
+            dim_codes, labels = self._dimension_codes(by)
+            groups = dim_codes[rows["recipe"].to_numpy()]
+
+        counts = np.bincount(groups, minlength=len(labels))
+        if measure == "avg_rating":
+            totals = np.bincount(groups, weights=rows["rating_sum"].to_numpy(dtype=np.float64), minlength=len(labels))
+            rated = np.bincount(groups, weights=rows["rating_count"].to_numpy(dtype=np.float64), minlength=len(labels))
+            present = rated > 0
+            values = totals[present] / rated[present]
+        else:
+            present = counts > 0
+            values = np.bincount(groups, weights=rows[measure].to_numpy(dtype=np.float64),
+                                 minlength=len(labels))[present]
+        labels = labels[present] if isinstance(labels, pd.Index) else np.asarray(labels)[present]
+        result = pd.Series(values, index=pd.Index(labels, name=by), name=measure)
+        if by in GRAINS:
+            return result
+        result = result.sort_values(ascending=False, kind="stable").head(top)
+        if by == "recipe":
+            titles = self.dimensions.set_index("recipeId")["title"]
+            return pd.DataFrame({"title": titles.reindex(result.index).to_numpy(), measure: result},
+                                index=result.index.rename("recipeId"))
+        return result
+
+def frames(interactions, batch_size=BATCH_SIZE):
+    # Accepts DataFrames or an iterable of documents; yields DataFrame batches.
+    if isinstance(interactions, pd.DataFrame):
+        yield interactions
+        return
+    batch = []
+    for item in interactions:
+        if isinstance(item, pd.DataFrame):
+            yield item
+            continue
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+def load_recipes(path):
+    fields = ["recipeId", "title"] + RECIPE_DIMENSIONS
+    return pd.DataFrame([{f: doc.get(f) for f in fields} for doc in iter_json_array(path)], columns=fields)
+
+# ---------------- MAIN ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query time-bucketed interaction rollups.")
+    parser.add_argument("--store", default=STORE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="rebuild the store from the export in one streaming pass")
+    build.add_argument("--export-dir", default=EXPORT_DIR)
+    append = sub.add_parser("append", help="add new interactions (a JSON array file) to the store")
+    append.add_argument("interactions")
+    append.add_argument("--recipes", help="recipes.json with new or changed recipes")
+    sub.add_parser("compact", help="merge appended segments")
+
+    query = sub.add_parser("query")
+    query.add_argument("--measure", default="likes", choices=MEASURES + ["avg_rating"])
+    query.add_argument("--by", default="recipe", choices=["recipe", "source"] + RECIPE_DIMENSIONS + list(GRAINS))
+    query.add_argument("--last", help="window ending at --now, e.g. 7D or 36h")
+    query.add_argument("--since")
+    query.add_argument("--until", help="end of the window, like --now; the hour it falls in is included")
+    query.add_argument("--now", help="end of the window (default: newest interaction)")
+    query.add_argument("--top", type=int, default=10)
+    query.add_argument("--source")
+    for dim in RECIPE_DIMENSIONS:
+        query.add_argument(f"--{dim}")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "build":
+        if os.path.exists(args.store):
+            shutil.rmtree(args.store)
+        store = RollupStore(args.store)
+        rows = store.append(iter_json_array(os.path.join(args.export_dir, "interactions.json")),
+                            load_recipes(os.path.join(args.export_dir, "recipes.json")))
+        print(f" Rolled up {rows} interactions in {time.perf_counter() - start:.2f}s")
+    elif args.command == "append":
+        store = RollupStore(args.store)
+        recipes = load_recipes(args.recipes) if args.recipes else None
+        rows = store.append(iter_json_array(args.interactions), recipes)
+        print(f" Appended {rows} interactions in {time.perf_counter() - start:.2f}s")
+    elif args.command == "compact":
+        RollupStore(args.store).compact()
+        print(f" Compacted in {time.perf_counter() - start:.2f}s")
+    else:
+        store = RollupStore(args.store)
+        filters = {dim: getattr(args, dim) for dim in RECIPE_DIMENSIONS if getattr(args, dim)}
+        start = time.perf_counter()
+        result = store.query(args.measure, args.by, since=args.since, until=args.until, last=args.last, now=args.now,
+                             top=args.top, source=args.source, **filters)
+        print(result)
+        print(f"\n({(time.perf_counter() - start) * 1000:.1f} ms)")
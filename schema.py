@@ -0,0 +1,15 @@
+# -------------------------------------------------------------------
+# NORMALIZED TABLE SCHEMA
+#
+# Column order of the normalized tables (normalized_csv_output/*.csv and
+# their columnar versions), shared by the synthetic generator and the
+# export normalizer. Ingredients and steps are keyed by their recipeId.
+# -------------------------------------------------------------------
+RECIPE_COLUMNS = ["recipeId", "title", "description", "authorId", "cuisine", "category",
+                  "difficulty", "prepTimeMinutes", "cookTimeMinutes", "totalTimeMinutes",
+                  "servings", "tags", "createdAt", "updatedAt", "isPublic"]
+INGREDIENT_COLUMNS = ["recipeId", "ingredientId", "name", "quantity", "unit", "notes"]
+STEP_COLUMNS = ["recipeId", "stepNumber", "instruction", "approxMinutes"]
+INTERACTION_COLUMNS = ["interactionId", "userId", "recipeId", "type", "createdAt", "rating",
+                       "difficultyRating", "successStatus", "comment", "source"]
+USER_COLUMNS = ["userId", "displayName", "email", "createdAt", "skillLevel", "dietPreferences"]
@@ -0,0 +1,578 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar
+from columnar import read_table, table_path
+from json_stream import iter_json_array
+
+# -------------------------------------------------------------------
+# RECIPE SEARCH INDEX
+#
+# An inverted index over title, description, tags, ingredient names and
+# step instructions, ranked with BM25. Every field's tokens count towards
+# one bag of words, weighted by FIELD_WEIGHTS, so a title hit outranks the
+# same word in a step.
+#
+#   <index>/_meta.json         segments, facet labels, live document count
+#   <index>/live.npy           packed bitset: documents not deleted/replaced
+#   <index>/facets.npy         packed bitset per (facet, value), one row each
+#   <index>/seg-NNNNN/docs/    columnar table, row i = document base + i
+#   <index>/seg-NNNNN/terms.json, offsets.npy, postings.bin
+#
+# A posting list is (doc id delta, term frequency) pairs, varint-encoded:
+# seven bits per byte, high bit set on every byte but a value's last. Doc
+# ids are global and increase across segments, so a term's postings are
+# the concatenation of its lists in segment order.
+#
+# Updates never rewrite a segment: a changed recipe is re-indexed into a
+# new segment and its old document is cleared from the live bitset.
+# compact() rewrites everything into one segment without dead documents.
+# -------------------------------------------------------------------
+INDEX_DIR = "search_index"
+EXPORT_DIR = "firestore_export"
+DATA_DIR = "normalized_csv_output"
+META_FILE = "_meta.json"
+SHARD_SIZE = 10_000  # documents per work unit
+SEGMENT_SIZE = 250_000  # documents per segment while building
+MAX_SEGMENTS = 16  # update() compacts once there are more segments than this
+CACHE_POSTINGS = 20_000_000  # scored postings kept in memory for repeated terms
+FIELD_WEIGHTS = {"title": 3, "tags": 2, "ingredients": 2, "description": 1, "steps": 1}
+FACETS = ["cuisine", "difficulty", "isPublic"]
+DOC_COLUMNS = ["recipeId", "title", "cuisine", "difficulty", "totalTimeMinutes", "isPublic", "updatedAt"]
+K1, B = 1.2, 0.75
+STOP_WORDS = frozenset("a an and are as at be by for from in into is it of on or the to until with".split())
+TOKEN = re.compile(r"\w+")
+
+# ---------------- TOKENIZING ----------------
+def tokenize(text):
+    if not isinstance(text, str):
+        return []
+    return [t for t in TOKEN.findall(text.lower()) if t not in STOP_WORDS]
+
+def joined(values, key):
+    # Export documents nest dicts; the normalized tables arrive pre-joined.
+    if isinstance(values, str):
+        return values
+    if not isinstance(values, list):
+        return ""
+    return " ".join(str(v.get(key) or "") if isinstance(v, dict) else str(v) for v in values)
+
+def field_texts(doc):
+    return {
+        "title": doc.get("title"),
+        "description": doc.get("description"),
+        "tags": joined(doc.get("tags"), None),
+        "ingredients": joined(doc.get("ingredients"), "name"),
+        "steps": joined(doc.get("steps"), "instruction"),
+    }
+
+def index_shard(docs):
+    # Runs in a worker: term frequencies for a batch of documents, with term
+    # ids local to the shard.
+    vocab, term_ids, doc_ids, tfs, lengths = {}, [], [], [], []
+    for i, doc in enumerate(docs):
+        counts = Counter()
+        for name, text in field_texts(doc).items():
+            weight = FIELD_WEIGHTS[name]
+            for token, n in Counter(tokenize(text)).items():
+                counts[token] += weight * n
+        lengths.append(sum(counts.values()))
+        for token, tf in counts.items():
+            term_ids.append(vocab.setdefault(token, len(vocab)))
+            doc_ids.append(i)
+            tfs.append(tf)
+    rows = pd.DataFrame([[doc.get(c) for c in DOC_COLUMNS] for doc in docs], columns=DOC_COLUMNS)
+    rows["length"] = np.asarray(lengths, dtype=np.float32)
+    return (list(vocab), np.asarray(term_ids, dtype=np.int32), np.asarray(doc_ids, dtype=np.int64),
+            np.asarray(tfs, dtype=np.int64), rows)
+
+# ---------------- POSTINGS ----------------
+def encode_varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        sizes += values >= np.uint64(1 << (7 * k))
+    ends = np.cumsum(sizes)
+    position = (np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - sizes, sizes)).astype(np.uint64)
+    data = (np.repeat(values, sizes) >> (np.uint64(7) * position)) & np.uint64(0x7F)
+    data |= (position < np.repeat(sizes - 1, sizes).astype(np.uint64)).astype(np.uint64) << np.uint64(7)
+    return data.astype(np.uint8), sizes
+
+def decode_varints(data):
+    data = np.asarray(data, dtype=np.uint8)
+    last = data < 0x80
+    if last.all():
+        # Small deltas and frequencies: one byte each, nothing to combine.
+        return data.astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    sizes = np.diff(np.append(starts, len(data)))
+    position = np.arange(len(data)) - np.repeat(starts, sizes)
+    return np.add.reduceat((data & 0x7F).astype(np.int64) << (7 * position), starts)
+
+def write_segment(path, terms, term_ids, doc_ids, tfs, rows):
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columnar.write_frame(rows, os.path.join(tmp, "docs"))
+
+    # Grouped by term; the stable sort keeps each list in doc id order.
+    order = np.argsort(term_ids, kind="stable")
+    term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+    present, starts = np.unique(term_ids, return_index=True)
+    deltas = np.diff(doc_ids, prepend=0)
+    deltas[starts] = doc_ids[starts]
+    pairs = np.empty(2 * len(doc_ids), dtype=np.int64)
+    pairs[0::2], pairs[1::2] = deltas, tfs
+    data, sizes = encode_varints(pairs)
+    value_offsets = np.concatenate([[0], np.cumsum(sizes)])
+    np.save(os.path.join(tmp, "offsets.npy"), value_offsets[np.append(2 * starts, len(pairs))])
+    data.tofile(os.path.join(tmp, "postings.bin"))
+    with open(os.path.join(tmp, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump([terms[i] for i in present], f, ensure_ascii=False)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+class Segment:
+    def __init__(self, path, base):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.base = base
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self.terms = {term: i for i, term in enumerate(json.load(f))}
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.postings = np.memmap(os.path.join(path, "postings.bin"), dtype=np.uint8, mode="r") \
+            if os.path.getsize(os.path.join(path, "postings.bin")) else np.zeros(0, dtype=np.uint8)
+        self.docs = columnar.read_frame(os.path.join(path, "docs"), categorical=True)
+        # Result rows are picked straight from codes and dictionaries.
+        self.columns = {}
+        for c in DOC_COLUMNS:
+            series = self.docs[c]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                labels = np.append(np.asarray(series.cat.categories, dtype=object), None)
+                self.columns[c] = (series.cat.codes.to_numpy(), labels)
+            else:
+                self.columns[c] = (series.to_numpy(), None)
+
+    def take(self, column, rows):
+        values, labels = self.columns[column]
+        return values[rows] if labels is None else labels[values[rows]]
+
+    def lookup(self, term):
+        k = self.terms.get(term)
+        if k is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        values = decode_varints(self.postings[self.offsets[k]:self.offsets[k + 1]])
+        return np.cumsum(values[0::2]), values[1::2]
+
+class SegmentBuilder:
+    # Collects shard results for one segment, renumbering shard-local terms.
+    def __init__(self, base):
+        self.base = base
+        self.vocab = {}
+        self.parts = []
+        self.rows = []
+        self.count = 0
+
+    def add(self, shard):
+        terms, term_ids, doc_ids, tfs, rows = shard
+        mapping = np.asarray([self.vocab.setdefault(t, len(self.vocab)) for t in terms], dtype=np.int32)
+        self.parts.append((mapping[term_ids] if len(term_ids) else term_ids, doc_ids + self.base + self.count, tfs))
+        self.rows.append(rows)
+        self.count += len(rows)
+
+    def write(self, path):
+        term_ids, doc_ids, tfs = (np.concatenate(p) for p in zip(*self.parts))
+        rows = pd.concat(self.rows, ignore_index=True)
+        write_segment(path, list(self.vocab), term_ids, doc_ids, tfs, rows)
+        return rows
+
+# ---------------- FACETS ----------------
+def facet_labels(values):
+    return pd.Series(values, dtype=object).map(lambda v: None if v is None or v != v else str(v)).to_numpy()
+
+def extend_bitsets(bitsets, size, labels):
+    # Bitsets cover doc ids [0, size); append one bit per new document.
+    labels = facet_labels(labels)
+    out = {}
+    for label in list(bitsets) + [l for l in pd.unique(labels) if l is not None and l not in bitsets]:
+        old = np.unpackbits(bitsets[label], count=size).astype(bool) if label in bitsets else np.zeros(size, bool)
+        out[label] = np.packbits(np.concatenate([old, labels == label]))
+    return out
+
+# ---------------- INDEX ----------------
+class SearchIndex:
+    def __init__(self, path=INDEX_DIR):
+        self.path = path
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"version": 1, "documents": 0, "next_segment": 0, "segments": [],
+                         "facets": {facet: [] for facet in FACETS}}
+        size = self.meta["documents"]
+        self.segments = [Segment(os.path.join(path, s["name"]), s["base"]) for s in self.meta["segments"]]
+        if self.segments:
+            self.live = np.unpackbits(np.load(os.path.join(path, "live.npy")), count=size).astype(bool)
+            packed = np.load(os.path.join(path, "facets.npy"))
+        else:
+            self.live, packed = np.zeros(0, dtype=bool), None
+        self.facets, row = {}, 0
+        for facet in FACETS:
+            self.facets[facet] = {}
+            for label in self.meta["facets"][facet]:
+                self.facets[facet][label] = packed[row]
+                row += 1
+        self.lengths = np.concatenate([s.docs["length"].to_numpy(dtype=np.float64) for s in self.segments]) \
+            if self.segments else np.zeros(0)
+        self.times = np.concatenate([pd.to_numeric(s.docs["totalTimeMinutes"], errors="coerce").to_numpy(dtype=np.float64)
+                                     for s in self.segments]) if self.segments else np.zeros(0)
+        self._ids = None
+        self._cache = OrderedDict()
+        self._changed()
+
+    @property
+    def size(self):
+        return self.meta["documents"]
+
+    def ids(self):
+        # recipeId -> live doc id, built on first update.
+        if self._ids is None:
+            self._ids = {}
+            for s in self.segments:
+                ids = np.asarray(s.docs["recipeId"], dtype=object)
+                for recipe_id, doc in zip(ids.tolist(), range(s.base, s.base + len(ids))):
+                    if self.live[doc]:
+                        self._ids[recipe_id] = doc
+        return self._ids
+
+    # ---------------- WRITING ----------------
+    def add(self, docs, workers=None, shard_size=SHARD_SIZE, segment_size=SEGMENT_SIZE):
+        # Indexes documents into new segments. Documents with a recipeId that
+        # is already indexed replace the old version.
+        workers = workers or os.cpu_count()
+        os.makedirs(self.path, exist_ok=True)
+        added = 0
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            builder = SegmentBuilder(self.size)
+            shards = (pool.submit(index_shard, batch) if pool else batch
+                      for batch in batches(docs, shard_size))
+            pending = []
+            for shard in itertools.chain(shards, [None]):
+                if shard is not None:
+                    pending.append(shard)
+                while pending and (len(pending) >= 2 * workers or shard is None):
+                    item = pending.pop(0)
+                    builder.add(item.result() if pool else index_shard(item))
+                    if builder.count >= segment_size:
+                        added += self._commit_segment(builder)
+                        builder = SegmentBuilder(self.size)
+            if builder.count:
+                added += self._commit_segment(builder)
+        finally:
+            if pool:
+                pool.shutdown()
+        self.save()
+        return added
+
+    def _commit_segment(self, builder):
+        ids = self.ids()
+        name = f"seg-{self.meta['next_segment']:05d}"
+        rows = builder.write(os.path.join(self.path, name))
+        self.meta["next_segment"] += 1
+        self.meta["segments"].append({"name": name, "base": builder.base, "documents": len(rows)})
+        self.segments.append(Segment(os.path.join(self.path, name), builder.base))
+
+        # A recipe that appears again (here or in an older segment) keeps only
+        # its newest document.
+        recipe_ids = rows["recipeId"].to_numpy(dtype=object)
+        newest = ~pd.Series(recipe_ids).duplicated(keep="last").to_numpy()
+        for recipe_id in recipe_ids[newest]:
+            old = ids.get(recipe_id)
+            if old is not None:
+                self.live[old] = False
+        for recipe_id, doc in zip(recipe_ids[newest].tolist(), (builder.base + np.flatnonzero(newest)).tolist()):
+            ids[recipe_id] = doc
+
+        size = self.size
+        self.live = np.concatenate([self.live, newest])
+        for facet in FACETS:
+            self.facets[facet] = extend_bitsets(self.facets[facet], size, rows[facet])
+        self.lengths = np.concatenate([self.lengths, rows["length"].to_numpy(dtype=np.float64)])
+        self.times = np.concatenate([self.times, pd.to_numeric(rows["totalTimeMinutes"], errors="coerce")
+                                    .to_numpy(dtype=np.float64)])
+        self.meta["documents"] = size + len(rows)
+        self._changed()
+        return len(rows)
+
+    def delete(self, recipe_ids):
+        ids = self.ids()
+        deleted = 0
+        for recipe_id in recipe_ids:
+            doc = ids.pop(recipe_id, None)
+            if doc is not None:
+                self.live[doc] = False
+                deleted += 1
+        self._changed()
+        return deleted
+
+    def refresh(self, docs, complete=True, workers=None):
+        # Re-indexes recipes whose updatedAt differs from the indexed copy.
+        # With a complete listing, recipes missing from it are deleted.
+        ids = self.ids()
+        updated_at = {}
+        for s in self.segments:
+            live = self.live[s.base:s.base + len(s.docs)]
+            updated_at.update(zip(np.asarray(s.docs["recipeId"], dtype=object)[live].tolist(),
+                                  np.asarray(s.docs["updatedAt"], dtype=object)[live].tolist()))
+        seen, changed = set(), []
+        for doc in docs:
+            recipe_id = doc.get("recipeId")
+            seen.add(recipe_id)
+            if recipe_id not in ids or str(updated_at.get(recipe_id)) != str(doc.get("updatedAt")):
+                changed.append(doc)
+        added = self.add(changed, workers) if changed else 0
+        deleted = self.delete([r for r in list(ids) if r not in seen]) if complete else 0
+        if len(self.segments) > MAX_SEGMENTS:
+            self.compact()
+        else:
+            self.save()
+        return {"updated": added, "deleted": deleted}
+
+    def compact(self):
+        # One segment holding only live documents, renumbered from 0.
+        if not self.segments:
+            return
+        keep = self.live
+        renumber = np.cumsum(keep) - 1
+        vocab = sorted(set().union(*(s.terms for s in self.segments)))
+        term_ids, doc_ids, tfs = [], [], []
+        for k, term in enumerate(vocab):
+            docs, freqs = self.postings(term)
+            live = keep[docs]
+            term_ids.append(np.full(live.sum(), k, dtype=np.int32))
+            doc_ids.append(renumber[docs[live]])
+            tfs.append(freqs[live])
+        rows = pd.concat([s.docs for s in self.segments], ignore_index=True)[keep].reset_index(drop=True)
+        old = [s["name"] for s in self.meta["segments"]]
+
+        name = f"seg-{self.meta['next_segment']:05d}"
+        write_segment(os.path.join(self.path, name), vocab, np.concatenate(term_ids) if vocab else np.zeros(0, np.int32),
+                      np.concatenate(doc_ids) if vocab else np.zeros(0, np.int64),
+                      np.concatenate(tfs) if vocab else np.zeros(0, np.int64), rows)
+        self.meta.update({"documents": len(rows), "next_segment": self.meta["next_segment"] + 1,
+                          "segments": [{"name": name, "base": 0, "documents": len(rows)}]})
+        self.segments = [Segment(os.path.join(self.path, name), 0)]
+        self.live = np.ones(len(rows), dtype=bool)
+        self.lengths, self.times = self.lengths[keep], self.times[keep]
+        for facet in FACETS:
+            self.facets[facet] = extend_bitsets({}, 0, rows[facet])
+        self._ids = None
+        self._changed()
+        self.save()
+        for s in old:
+            shutil.rmtree(os.path.join(self.path, s), ignore_errors=True)
+
+    def save(self):
+        # Segments are already on disk; the meta file is replaced last, so a
+        # crash mid-update leaves the previous index intact.
+        os.makedirs(self.path, exist_ok=True)
+        self.meta["facets"] = {facet: list(self.facets[facet]) for facet in FACETS}
+        self.meta["live"] = self.live_count
+        bitsets = [bits for facet in FACETS for bits in self.facets[facet].values()]
+        width = (self.size + 7) // 8
+        facets = np.stack(bitsets) if bitsets else np.zeros((0, width), dtype=np.uint8)
+        np.save(os.path.join(self.path, "live.npy.tmp.npy"), np.packbits(self.live))
+        np.save(os.path.join(self.path, "facets.npy.tmp.npy"), facets)
+        os.replace(os.path.join(self.path, "live.npy.tmp.npy"), os.path.join(self.path, "live.npy"))
+        os.replace(os.path.join(self.path, "facets.npy.tmp.npy"), os.path.join(self.path, "facets.npy"))
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    # ---------------- QUERIES ----------------
+    def postings(self, term):
+        # (doc ids, term frequencies) across all segments, dead docs included.
+        parts = [s.lookup(term) for s in self.segments]
+        if not parts:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def _changed(self):
+        # Any add or delete moves N, avgdl and document frequencies.
+        self.live_count = int(self.live.sum())
+        self.avg_length = self.lengths[self.live].mean() if self.live_count else 1.0
+        self._cache.clear()
+        self._cached = 0
+        self._live_bits = None
+
+    def impacts(self, term):
+        # (live doc ids, BM25 score) for one term. Scores only change when
+        # the index does, so hot terms are kept, up to CACHE_POSTINGS in all.
+        if term in self._cache:
+            self._cache.move_to_end(term)
+            return self._cache[term]
+        docs, tfs = self.postings(term)
+        alive = self.live[docs]
+        docs, tfs = docs[alive], tfs[alive]
+        documents = max(self.live_count, 1)
+        idf = np.log(1 + (documents - len(docs) + 0.5) / (len(docs) + 0.5))
+        norm = K1 * (1 - B + B * self.lengths[docs] / self.avg_length)
+        result = docs, (idf * tfs * (K1 + 1) / (tfs + norm)).astype(np.float32)
+        self._cache[term] = result
+        self._cached += len(docs)
+        while self._cached > CACHE_POSTINGS and len(self._cache) > 1:
+            _, (old, _) = self._cache.popitem(last=False)
+            self._cached -= len(old)
+        return result
+
+    def filter_mask(self, cuisine=None, difficulty=None, is_public=None, min_time=None, max_time=None):
+        # AND across facets, OR within a facet's values, on the packed bits.
+        # None when nothing is filtered.
+        facets = [(f, v) for f, v in [("cuisine", cuisine), ("difficulty", difficulty), ("isPublic", is_public)]
+                  if v is not None]
+        if not facets and min_time is None and max_time is None:
+            return None
+        if self._live_bits is None:
+            self._live_bits = np.packbits(self.live)
+        packed = self._live_bits.copy()
+        for facet, value in facets:
+            bits = np.zeros_like(packed)
+            for v in value if isinstance(value, (list, tuple, set)) else [value]:
+                if str(v) in self.facets[facet]:
+                    bits |= self.facets[facet][str(v)]
+            packed &= bits
+        mask = np.unpackbits(packed, count=self.size).view(bool)
+        if min_time is not None:
+            mask &= self.times >= min_time
+        if max_time is not None:
+            mask &= self.times <= max_time
+        return mask
+
+    def search(self, text="", top=10, **filters):
+        # e.g. search("paneer curry", cuisine="Indian", max_time=30)
+        # Returns the top results and the total number of matches.
+        allowed = self.filter_mask(**filters)
+        terms = list(dict.fromkeys(tokenize(text)))
+        if not terms:
+            matches = np.flatnonzero(self.live if allowed is None else allowed)
+            return self.documents(matches[:top], np.zeros(min(top, len(matches)))), len(matches)
+
+        if len(terms) == 1:
+            matches, scores = self.impacts(terms[0])
+        else:
+            dense = np.zeros(self.size, dtype=np.float32)
+            for term in terms:
+                docs, impact = self.impacts(term)
+                dense[docs] += impact
+            matches = np.flatnonzero(dense)
+            scores = dense[matches]
+        if allowed is not None:
+            keep = allowed[matches]
+            matches, scores = matches[keep], scores[keep]
+
+        best = np.argpartition(-scores, top - 1)[:top] if len(matches) > top else np.arange(len(matches))
+        best = best[np.lexsort((matches[best], -scores[best]))]
+        return self.documents(matches[best], scores[best]), len(matches)
+
+    def documents(self, doc_ids, scores):
+        bases = np.array([s.base for s in self.segments], dtype=np.int64)
+        owner = np.searchsorted(bases, doc_ids, side="right") - 1
+        columns = {c: np.empty(len(doc_ids), dtype=object) for c in DOC_COLUMNS}
+        for k in np.unique(owner):
+            s, picked = self.segments[k], owner == k
+            for c in DOC_COLUMNS:
+                columns[c][picked] = s.take(c, doc_ids[picked] - s.base)
+        result = pd.DataFrame(columns)
+        result["score"] = np.round(scores, 4)
+        return result
+
+# ---------------- SOURCES ----------------
+def batches(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+def export_recipes(export_dir=EXPORT_DIR):
+    return iter_json_array(os.path.join(export_dir, "recipes.json"))
+
+def table_recipes(data_dir=DATA_DIR):
+    # The normalized tables (CSV or columnar), one document per recipe with
+    # ingredient names and instructions joined into a string.
+    recipes = read_table(table_path(data_dir, "recipe.csv"), ["recipeId", "description", "tags"] + DOC_COLUMNS)
+    ingredients = read_table(table_path(data_dir, "ingredients.csv"), ["recipeId", "name"]).dropna()
+    steps = read_table(table_path(data_dir, "steps.csv"), ["recipeId", "stepNumber", "instruction"]).dropna()
+    steps = steps.sort_values(["recipeId", "stepNumber"], kind="stable")
+    recipes["ingredients"] = recipes["recipeId"].map(ingredients.groupby("recipeId")["name"].agg(" ".join))
+    recipes["steps"] = recipes["recipeId"].map(steps.groupby("recipeId")["instruction"].agg(" ".join))
+    recipes = recipes.astype(object).where(recipes.notna(), None)
+    for batch in batches(range(len(recipes)), SHARD_SIZE):
+        yield from recipes.iloc[batch[0]:batch[-1] + 1].to_dict("records")
+
+# ---------------- MAIN ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, update and query the recipe search index.")
+    parser.add_argument("--index", default=INDEX_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in [("build", "index every recipe from scratch"),
+                            ("update", "re-index recipes whose updatedAt changed and drop deleted ones")]:
+        command = sub.add_parser(name, help=help_text)
+        source = command.add_mutually_exclusive_group()
+        source.add_argument("--export-dir", default=EXPORT_DIR)
+        source.add_argument("--data-dir", help="read the normalized tables instead of the JSON export")
+        command.add_argument("--workers", type=int, default=None)
+    sub.add_parser("compact", help="merge segments and drop replaced documents")
+
+    query = sub.add_parser("query")
+    query.add_argument("text", nargs="?", default="")
+    query.add_argument("--cuisine", action="append")
+    query.add_argument("--difficulty", action="append")
+    query.add_argument("--min-time", type=float)
+    query.add_argument("--max-time", type=float)
+    query.add_argument("--public", dest="is_public", action="store_const", const=True)
+    query.add_argument("--private", dest="is_public", action="store_const", const=False)
+    query.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command in ("build", "update"):
+        docs = table_recipes(args.data_dir) if args.data_dir else export_recipes(args.export_dir)
+        if args.command == "build":
+            if os.path.exists(args.index):
+                shutil.rmtree(args.index)
+            count = SearchIndex(args.index).add(docs, args.workers)
+            print(f" Indexed {count} recipes in {time.perf_counter() - start:.2f}s")
+        else:
+            counts = SearchIndex(args.index).refresh(docs, workers=args.workers)
+            print(f" Updated {counts['updated']} and deleted {counts['deleted']} recipes "
+                  f"in {time.perf_counter() - start:.2f}s")
+    elif args.command == "compact":
+        SearchIndex(args.index).compact()
+        print(f" Compacted in {time.perf_counter() - start:.2f}s")
+    else:
+        index = SearchIndex(args.index)
+        loaded = time.perf_counter()
+        results, total = index.search(args.text, args.top, cuisine=args.cuisine, difficulty=args.difficulty,
+                                      is_public=args.is_public, min_time=args.min_time, max_time=args.max_time)
+        elapsed = time.perf_counter() - loaded
+        with pd.option_context("display.width", 200, "display.max_columns", None):
+            print(results.to_string(index=False) if len(results) else "No matching recipes.")
+        print(f"\n{total} matches ({elapsed * 1000:.1f} ms, index loaded in {(loaded - start) * 1000:.0f} ms)")
@@ -0,0 +1,398 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+import columnar
+from analytics import aggregate_interactions, prepare_interactions
+from json_stream import iter_json_array
+
+# -------------------------------------------------------------------
+# STREAMING TOP-K
+#
+# The "Top 10" insights in fixed memory, in two modes:
+#   exact   bounded top-k selections over data that is already aggregated
+#           per recipe (the incremental state), read a chunk at a time
+#   sketch  mergeable summaries over raw interactions, whatever their count:
+#             space-saving  candidate heavy hitters with per-item bounds
+#             count-min     a second, independent upper bound per item
+#             HyperLogLog   distinct recipes, users and ingredients
+# Memory is set by TOP_N, CAPACITY, CM_WIDTH x CM_DEPTH and HLL_PRECISION,
+# never by the number of events or distinct keys. Every sketch has merge(),
+# so partial sketches from separate batches, files or workers combine into
+# the same result as one pass over everything.
+# -------------------------------------------------------------------
+TOP_N = 10
+BATCH_SIZE = 250_000
+CAPACITY = 10_000        # space-saving counters per ranking
+CM_WIDTH = 1 << 16
+CM_DEPTH = 5
+HLL_PRECISION = 14       # 2^14 registers, ~0.8% standard error
+HASH_KEY = "recipe-sketches1"  # 16 characters; sketches merge only under one key
+MEASURES = ['views', 'likes', 'rating_sum', 'rating_count', 'interactions']
+INTERACTION_COLUMNS = ['interactionId', 'recipeId', 'userId', 'views', 'likes', 'rating']
+BIT_LENGTHS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+
+def hash_keys(keys):
+    return pd.util.hash_array(np.asarray(keys, dtype=object), hash_key=HASH_KEY)
+
+# ---------------- EXACT: BOUNDED TOP-K ----------------
+class TopK:
+    # Keeps the k largest rows of a stream, like a size-k min-heap but a chunk
+    # at a time: each chunk is cut to its own k largest (ties kept) before it
+    # is merged, so memory is O(k + chunk). Ties break on `ties`, ascending.
+    def __init__(self, k, column, ties=()):
+        self.k, self.column, self.ties = k, column, list(ties)
+        self.top = None
+
+    def push(self, frame):
+        frame = frame[frame[self.column].notna()]
+        candidates = frame.nlargest(self.k, self.column, keep='all')
+        if self.top is not None:
+            candidates = pd.concat([self.top, candidates], ignore_index=True)
+        self.top = candidates.sort_values([self.column] + self.ties, ascending=[False] + [True] * len(self.ties),
+                                          kind='stable').head(self.k).reset_index(drop=True)
+        return self
+
+    def merge(self, other):
+        return self.push(other.top) if other.top is not None else self
+
+    def series(self, label, name=None):
+        top = self.top if self.top is not None else pd.DataFrame(columns=[label, self.column])
+        return top.set_index(label)[self.column].rename(name or self.column)
+
+def exact_report(conn, n=TOP_N, batch_size=BATCH_SIZE):
+    # Reads the incremental state's per-recipe aggregates (see
+    # incremental_analytics.py) in chunks; only the k best rows of each
+    # ranking are ever held. Ties break on title, then recipeId.
+    rankings = {
+        'views': ("Top 10 Recipes by Views", 'views'),
+        'likes': ("Top 10 Recipes by Likes", 'likes'),
+        'avg_rating': ("Top 10 Recipes by Average Rating", 'rating'),
+        'like_view_ratio': ("Top Recipes by Like/View Ratio", 'like_view_ratio'),
+        'interactions': ("Recipes with Most Interactions", 'interactionId'),
+    }
+    heaps = {column: TopK(n, column, ['title', 'recipeId']) for column in rankings}
+    query = ("SELECT a.recipeId, r.title, a.views, a.likes, a.rating_sum, a.rating_count, a.interactions "
+             "FROM recipe_agg a JOIN recipes r USING (recipeId)")
+    for chunk in pd.read_sql_query(query, conn, chunksize=batch_size):
+        chunk['avg_rating'] = chunk['rating_sum'] / chunk['rating_count']
+        chunk['like_view_ratio'] = chunk['likes'] / chunk['views'].replace(0, 1)
+        for heap in heaps.values():
+            heap.push(chunk)
+
+    ingredients = TopK(n, 'occurrences', ['name'])
+    for chunk in pd.read_sql_query("SELECT name, occurrences FROM ingredient_agg", conn, chunksize=batch_size):
+        ingredients.push(chunk)
+
+    results = {}
+    for column, (title, name) in rankings.items():
+        results[column] = heaps[column].series('title', name)
+        print(f"\n===== {title} (exact, bounded) =====")
+        print(results[column].round(2) if column in ('avg_rating', 'like_view_ratio') else results[column])
+    results['ingredients'] = ingredients.series('name')
+    print("\n===== Top 10 Most Common Ingredients (exact, bounded) =====")
+    for ing, count in results['ingredients'].items():
+        print(f"{ing}: {count}")
+    return results
+
+# ---------------- SKETCHES ----------------
+class CountMin:
+    # depth rows of width counters; a key adds its weight to one counter per
+    # row and is estimated by the smallest. With non-negative weights the
+    # estimate never undercounts, and overcounts by more than
+    # epsilon * total with probability at most delta.
+    def __init__(self, width=CM_WIDTH, depth=CM_DEPTH):
+        self.table = np.zeros((depth, width))
+        self.total = 0.0
+
+    @property
+    def epsilon(self):
+        return math.e / self.table.shape[1]
+
+    @property
+    def delta(self):
+        return math.exp(-self.table.shape[0])
+
+    def cells(self, hashes):
+        # Double hashing: row i uses h1 + i * h2 (Kirsch-Mitzenmacher).
+        depth, width = self.table.shape
+        h1, h2 = hashes & np.uint64(0xFFFFFFFF), (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(depth, dtype=np.uint64)[:, None]
+        return ((h1 + rows * h2) % np.uint64(width)).astype(np.intp)
+
+    def add(self, hashes, weights):
+        width = self.table.shape[1]
+        for row, cells in zip(self.table, self.cells(hashes)):
+            row += np.bincount(cells, weights, minlength=width)
+        self.total += float(np.sum(weights))
+
+    def estimate(self, hashes):
+        cells = self.cells(hashes)
+        return self.table[np.arange(len(self.table))[:, None], cells].min(axis=0)
+
+    def merge(self, other):
+        self.table += other.table
+        self.total += other.total
+        return self
+
+class SpaceSaving:
+    # At most `capacity` counters, each an overestimate with its error:
+    # count - error <= true <= count. Once full, any key not held has a true
+    # total of at most floor(). Batches are pre-aggregated and merged as exact
+    # summaries; two summaries merge by treating a key one of them lacks as
+    # that summary's floor, then keeping the largest `capacity` counts.
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.float64)
+        self.errors = pd.Series(dtype=np.float64)
+        self.total = 0.0
+
+    def floor(self):
+        return float(self.counts.min()) if len(self.counts) >= self.capacity else 0.0
+
+    def update(self, counts):
+        # counts: exact per-key totals of one batch, indexed by key.
+        counts = counts.astype(np.float64)
+        self.combine(counts, pd.Series(0.0, index=counts.index), 0.0)
+        self.total += float(counts.sum())
+        return self
+
+    def merge(self, other):
+        self.combine(other.counts, other.errors, other.floor())
+        self.total += other.total
+        return self
+
+    def combine(self, counts, errors, other_floor):
+        floor = self.floor()
+        keys = self.counts.index.union(counts.index)
+        merged = self.counts.reindex(keys).fillna(floor) + counts.reindex(keys).fillna(other_floor)
+        merged_errors = self.errors.reindex(keys).fillna(floor) + errors.reindex(keys).fillna(other_floor)
+        kept = merged.nlargest(self.capacity).index
+        self.counts, self.errors = merged[kept], merged_errors[kept]
+
+class HyperLogLog:
+    # 2^precision registers holding the longest run of leading zero bits
+    # seen per bucket. Merging is an elementwise max; the relative standard
+    # error is 1.04 / sqrt(2^precision).
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, hashes):
+        bits = 64 - self.precision
+        buckets = (hashes >> np.uint64(bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        ranks = (bits + 1 - np.searchsorted(BIT_LENGTHS[:bits], rest, side='right')).astype(np.uint8)
+        np.maximum.at(self.registers, buckets, ranks)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return estimate
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+class HeavyHitters:
+    # Space-saving picks the candidates; count-min gives every key a second
+    # upper bound, so each reported total carries a guaranteed interval.
+    def __init__(self, capacity=CAPACITY, width=CM_WIDTH, depth=CM_DEPTH):
+        self.summary = SpaceSaving(capacity)
+        self.sketch = CountMin(width, depth)
+
+    def add(self, counts):
+        self.summary.update(counts)
+        self.sketch.add(hash_keys(counts.index), counts.to_numpy(dtype=np.float64))
+
+    def merge(self, other):
+        self.summary.merge(other.summary)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def bounds(self, keys):
+        counts = self.summary.counts.reindex(keys)
+        held = counts.notna().to_numpy()
+        counts = counts.to_numpy()
+        errors = self.summary.errors.reindex(keys).to_numpy()
+        high = np.minimum(self.sketch.estimate(hash_keys(keys)), np.where(held, counts, self.summary.floor()))
+        low = np.where(held, counts - errors, 0.0)
+        return low, high
+
+    def top(self, n=TOP_N):
+        # Ranked by the tightest upper bound. in_top marks keys whose lower
+        # bound beats every other key's upper bound: certainly in the true top n.
+        keys = self.summary.counts.index
+        low, high = self.bounds(keys)
+        ranked = pd.DataFrame({'key': keys, 'estimate': high, 'low': low, 'high': high}).sort_values(
+            ['estimate', 'key'], ascending=[False, True], kind='stable').reset_index(drop=True)
+        top, rest = ranked.head(n).copy(), ranked.iloc[n:]
+        beaten = max(rest['high'].max() if len(rest) else 0.0, self.summary.floor())
+        top['in_top'] = top['low'] >= beaten
+        return top
+
+    def footnote(self, what):
+        return (f"space-saving: {len(self.summary.counts):,} counters, anything not listed has {what} "
+                f"<= {self.summary.floor():,.0f}; count-min: overcounts by <= {self.sketch.epsilon * self.sketch.total:,.0f} "
+                f"with probability {1 - self.sketch.delta:.3f}")
+
+class InteractionSketch:
+    # Fixed-size summary of any number of raw interactions.
+    def __init__(self, capacity=CAPACITY, width=CM_WIDTH, depth=CM_DEPTH, precision=HLL_PRECISION):
+        self.measures = {m: HeavyHitters(capacity, width, depth) for m in MEASURES}
+        self.recipes = HyperLogLog(precision)
+        self.users = HyperLogLog(precision)
+        self.rows = 0
+
+    def add(self, batch):
+        batch = prepare_interactions(batch)
+        agg = aggregate_interactions(batch)
+        agg.index = agg.index.astype(object)
+        for m, hitters in self.measures.items():
+            hitters.add(agg[m])
+        self.recipes.add(hash_keys(agg.index))
+        if 'userId' in batch.columns:
+            self.users.add(hash_keys(batch['userId'].dropna().unique()))
+        self.rows += len(batch)
+
+    def merge(self, other):
+        for m, hitters in self.measures.items():
+            hitters.merge(other.measures[m])
+        self.recipes.merge(other.recipes)
+        self.users.merge(other.users)
+        self.rows += other.rows
+        return self
+
+    def ratio(self, numerator, denominator, n=TOP_N, min_denominator=0.0):
+        # Ratios rank among the recipes certainly ahead of every recipe the
+        # denominator's summary dropped (the most viewed / most rated); the
+        # interval comes from dividing the bounds.
+        held = self.measures[denominator]
+        keys = held.summary.counts.index
+        num_low, num_high = self.measures[numerator].bounds(keys)
+        den_low, den_high = held.bounds(keys)
+        certain = (den_low >= held.summary.floor()) & (den_low > 0)
+        den_low, den_high = np.maximum(den_low, min_denominator), np.maximum(den_high, min_denominator)
+        ranked = pd.DataFrame({'key': keys, 'estimate': num_high / den_high,
+                               'low': num_low / den_high, 'high': num_high / den_low})[certain]
+        return ranked.sort_values(['estimate', 'key'], ascending=[False, True], kind='stable').head(n)
+
+class IngredientSketch:
+    def __init__(self, capacity=CAPACITY, width=CM_WIDTH, depth=CM_DEPTH, precision=HLL_PRECISION):
+        self.hitters = HeavyHitters(capacity, width, depth)
+        self.distinct = HyperLogLog(precision)
+
+    def add(self, names):
+        counts = pd.Series(np.asarray(names, dtype=object)).value_counts(sort=False)
+        if len(counts):
+            self.hitters.add(counts)
+            self.distinct.add(hash_keys(counts.index))
+
+    def merge(self, other):
+        self.hitters.merge(other.hitters)
+        self.distinct.merge(other.distinct)
+        return self
+
+# ---------------- SOURCES ----------------
+def export_interactions(export_dir, batch_size=BATCH_SIZE):
+    # Raw interactions from firestore_export, batch_size documents per frame.
+    columns = {c: [] for c in INTERACTION_COLUMNS}
+    for doc in iter_json_array(os.path.join(export_dir, "interactions.json")):
+        for c, values in columns.items():
+            values.append(doc.get(c))
+        if len(columns['recipeId']) >= batch_size:
+            yield pd.DataFrame(columns)
+            columns = {c: [] for c in INTERACTION_COLUMNS}
+    if columns['recipeId']:
+        yield pd.DataFrame(columns)
+
+def export_recipes(export_dir, batch_size=BATCH_SIZE):
+    # (recipeId/title frame, ingredient names) per batch of recipe documents.
+    ids, titles, names = [], [], []
+    for doc in iter_json_array(os.path.join(export_dir, "recipes.json")):
+        ids.append(doc.get('recipeId'))
+        titles.append(doc.get('title'))
+        for ing in doc.get('ingredients') or []:
+            names.append(ing.get('name'))
+        if len(ids) >= batch_size:
+            yield pd.DataFrame({'recipeId': ids, 'title': titles}), names
+            ids, titles, names = [], [], []
+    if ids:
+        yield pd.DataFrame({'recipeId': ids, 'title': titles}), names
+
+def columnar_interactions(columnar_dir):
+    path = os.path.join(columnar_dir, "interactions")
+    yield from columnar.iter_row_groups(path, INTERACTION_COLUMNS)
+
+def columnar_recipes(columnar_dir):
+    # Recipe rows first, then the ingredients table's names with no recipes.
+    for frame in columnar.iter_row_groups(os.path.join(columnar_dir, "recipe"), ['recipeId', 'title']):
+        yield frame, []
+    for frame in columnar.iter_row_groups(os.path.join(columnar_dir, "ingredients"), ['name']):
+        yield pd.DataFrame(columns=['recipeId', 'title']), frame['name'].dropna().to_numpy()
+
+# ---------------- SKETCH REPORT ----------------
+def sketch_interactions(batches, capacity=CAPACITY):
+    sketch = InteractionSketch(capacity)
+    for batch in batches:
+        sketch.add(batch)
+    return sketch
+
+def scan_recipes(batches, wanted, capacity=CAPACITY):
+    # One pass over recipes: titles for the reported ids only, and the
+    # ingredient sketch.
+    titles, ingredients = {}, IngredientSketch(capacity)
+    wanted = pd.Index(list(wanted), dtype=object)
+    for frame, names in batches:
+        hits = frame[frame['recipeId'].isin(wanted)]
+        titles.update(zip(hits['recipeId'], hits['title']))
+        ingredients.add(names)
+    return titles, ingredients
+
+def labelled(ranked, titles, integer=False):
+    out = ranked.assign(title=ranked['key'].map(titles)).set_index('title')[['estimate', 'low', 'high']
+                                                                          + (['in_top'] if 'in_top' in ranked else [])]
+    columns = ['estimate', 'low', 'high']
+    out[columns] = out[columns].round(0).astype('int64') if integer else out[columns].round(2)
+    return out
+
+def sketch_report(interaction_batches, recipe_batches, capacity=CAPACITY, n=TOP_N):
+    sketch = sketch_interactions(interaction_batches, capacity)
+    rankings = {
+        'views': ("Top 10 Recipes by Views (approximate)", sketch.measures['views'].top(n)),
+        'likes': ("Top 10 Recipes by Likes (approximate)", sketch.measures['likes'].top(n)),
+        'avg_rating': ("Top 10 Recipes by Average Rating (approximate, most-rated recipes)",
+                       sketch.ratio('rating_sum', 'rating_count', n)),
+        'like_view_ratio': ("Top Recipes by Like/View Ratio (approximate, most-viewed recipes)",
+                            sketch.ratio('likes', 'views', n, min_denominator=1.0)),
+        'interactions': ("Recipes with Most Interactions (approximate)", sketch.measures['interactions'].top(n)),
+    }
+    wanted = set().union(*(ranked['key'] for _, ranked in rankings.values()))
+    titles, ingredients = scan_recipes(recipe_batches, wanted, capacity)
+
+    print(f"\nSketched {sketch.rows:,} interactions: ~{sketch.recipes.count():,.0f} distinct recipes and "
+          f"~{sketch.users.count():,.0f} distinct users (+/- {sketch.recipes.relative_error:.1%} standard error)")
+    results = {}
+    for column, (title, ranked) in rankings.items():
+        results[column] = labelled(ranked, titles, integer=column in MEASURES)
+        print(f"\n===== {title} =====")
+        print(results[column])
+        if column in MEASURES:
+            print(sketch.measures[column].footnote(column))
+
+    results['ingredients'] = ingredients.hitters.top(n).set_index('key')
+    print(f"\n===== Top 10 Most Common Ingredients (approximate, ~{ingredients.distinct.count():,.0f} distinct) =====")
+    for name, row in results['ingredients'].iterrows():
+        print(f"{name}: {row['estimate']:.0f} [{row['low']:.0f}, {row['high']:.0f}]")
+    print(ingredients.hitters.footnote("occurrences"))
+    return results
@@ -0,0 +1,289 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+from main_file import create_synthetic_recipe
+from schema import INGREDIENT_COLUMNS, INTERACTION_COLUMNS, RECIPE_COLUMNS, STEP_COLUMNS, USER_COLUMNS
+
+# -------------------------------------------------------------------
+# CONFIG
+# -------------------------------------------------------------------
+OUTPUT_DIR = "synthetic_output"
+EXPORT_SUBDIR = "firestore_export"
+CSV_SUBDIR = "normalized_csv_output"
+SHARD_SIZE = 50_000
+REFERENCE_TIME = "2025-11-20T00:00:00+00:00"  # fixed so output is reproducible
+HISTORY_DAYS = 365
+ZIPF_EXPONENT = 1.1
+
+CUISINES = ["Indian", "Italian", "Chinese", "American", "Mexican", "Thai", "Global", "French", "Japanese"]
+CATEGORIES = ["Main Course", "Breakfast", "Dessert", "Snack", "Salad", "Beverage", "Starter", "Seafood"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+SKILL_LEVELS = ["beginner", "intermediate", "expert"]
+DIETS = ["vegetarian", "vegan", "non-veg", "gluten-free", "keto"]
+ADJECTIVES = ["Spicy", "Classic", "Quick", "Creamy", "Crispy", "Smoky", "Tangy", "Homestyle", "Herbed", "Roasted"]
+DISHES = ["Curry", "Pulao", "Omelette", "Brownie", "Sandwich", "Noodles", "Salad Bowl", "Dal", "Fried Rice",
+          "Pancakes", "Smoothie", "Soup", "Wrap", "Tacos", "Pasta", "Stir Fry", "Biryani", "Risotto", "Stew"]
+# Ordered roughly by how common they are; picked with a Zipf-like skew.
+INGREDIENTS = [
+    ("Salt", "tsp"), ("Oil", "tbsp"), ("Onion", "piece"), ("Garlic", "clove"), ("Tomato", "piece"),
+    ("Water", "cup"), ("Butter", "tbsp"), ("Black pepper", "tsp"), ("Sugar", "tbsp"), ("Ginger", "tbsp"),
+    ("Green chili", "piece"), ("Turmeric powder", "tsp"), ("Cumin seeds", "tsp"), ("Lemon juice", "tbsp"),
+    ("Fresh coriander", "tbsp"), ("Milk", "cup"), ("Egg", "piece"), ("Flour", "cup"), ("Rice", "cup"),
+    ("Potato", "piece"), ("Red chili powder", "tsp"), ("Garam masala", "tsp"), ("Paneer", "grams"),
+    ("Chicken", "grams"), ("Carrot", "piece"), ("Capsicum", "piece"), ("Cream", "cup"), ("Cheese", "grams"),
+    ("Soy sauce", "tbsp"), ("Basil", "tbsp"), ("Olive oil", "tbsp"), ("Honey", "tbsp"), ("Yogurt", "cup"),
+    ("Mushroom", "grams"), ("Spinach", "cup"), ("Peas", "cup"), ("Cocoa powder", "tbsp"), ("Banana", "piece"),
+    ("Berries", "cup"), ("Bread", "slice"), ("Noodles", "grams"), ("Lentils", "cup"), ("Coconut milk", "cup"),
+    ("Vinegar", "tbsp"), ("Mustard seeds", "tsp"), ("Curry leaves", "piece"), ("Cinnamon", "stick"),
+    ("Cardamom", "piece"), ("Saffron", "pinch"), ("Surmai (Kingfish) steaks", "grams"),
+]
+STEP_TEMPLATES = [
+    ("Heat {a} in a pan over medium flame.", 3),
+    ("Add {a} and sauté until fragrant.", 4),
+    ("Stir in {a} and {b} and mix well.", 2),
+    ("Cook covered until {a} is soft.", 10),
+    ("Season with {a} and adjust to taste.", 1),
+    ("Simmer for a few minutes until the sauce thickens.", 8),
+    ("Whisk {a} with {b} in a bowl.", 3),
+    ("Bake until golden and set in the middle.", 25),
+    ("Let it rest before serving.", 5),
+    ("Garnish with {a} and serve hot.", 2),
+]
+
+# -------------------------------------------------------------------
+# HELPERS
+# -------------------------------------------------------------------
+@lru_cache(maxsize=8)
+def zipf_cdf(n, exponent=ZIPF_EXPONENT):
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+def scatter(ranks, n):
+    # Map popularity ranks onto IDs with a fixed multiplicative permutation so
+    # the hottest recipes/users are not simply the lowest-numbered ones.
+    step = 2_654_435_761 % n or 1
+    while np.gcd(step, n) != 1:
+        step += 1
+    return (ranks.astype(np.int64) * step) % n
+
+def recipe_id(i):
+    return f"recipe_syn_{i:07d}"
+
+def user_id(i):
+    return f"user_syn_{i:06d}"
+
+def iso(dt):
+    return dt.isoformat()
+
+def json_items(docs):
+    # Same layout as firestore_export: a 4-space indented top-level array.
+    return ",\n".join("    " + json.dumps(doc, indent=4, ensure_ascii=False).replace("\n", "\n    ")
+                      for doc in docs)
+
+def csv_rows(rows):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+# -------------------------------------------------------------------
+# SHARD GENERATORS
+# -------------------------------------------------------------------
+def generate_users_shard(cfg, shard):
+    rng = random.Random(f"{cfg['seed']}:users:{shard}")
+    now = datetime.fromisoformat(cfg["now"])
+    start, stop = shard * cfg["shard_size"], min((shard + 1) * cfg["shard_size"], cfg["users"])
+
+    docs, rows = [], []
+    for i in range(start, stop):
+        uid = user_id(i)
+        diets = rng.sample(DIETS, rng.choice([0, 0, 1, 1, 2]))
+        user = {
+            "userId": uid,
+            "displayName": f"User {i}",
+            "email": f"{uid}@example.com",
+            "createdAt": iso(now - timedelta(seconds=rng.randrange(cfg["days"] * 86400))),
+            "skillLevel": rng.choice(SKILL_LEVELS),
+            "dietPreferences": diets,
+        }
+        docs.append(user)
+        rows.append([uid, user["displayName"], user["email"], user["createdAt"],
+                     user["skillLevel"], ",".join(diets)])
+
+    return {"users.json": json_items(docs), "users.csv": csv_rows(rows)}
+
+def generate_recipes_shard(cfg, shard):
+    rng = random.Random(f"{cfg['seed']}:recipes:{shard}")
+    np_rng = np.random.default_rng([cfg["seed"], 1, shard])
+    now = datetime.fromisoformat(cfg["now"])
+    start, stop = shard * cfg["shard_size"], min((shard + 1) * cfg["shard_size"], cfg["recipes"])
+    count = stop - start
+
+    # Prolific authors write most recipes; common ingredients appear most often.
+    authors = scatter(np.searchsorted(zipf_cdf(cfg["users"]), np_rng.random(count)), cfg["users"])
+    ingredient_cdf = zipf_cdf(len(INGREDIENTS), 0.9)
+
+    docs, recipe_rows, ingredient_rows, step_rows = [], [], [], []
+    for offset, i in enumerate(range(start, stop)):
+        suffix = f"syn_{i:07d}"
+        picks = np.searchsorted(ingredient_cdf, np_rng.random(rng.randint(3, 15)))
+        names = list(dict.fromkeys(INGREDIENTS[p] for p in picks))
+        ingredients = [
+            {"ingredientId": f"{suffix}-ING-{n:02d}", "name": name, "quantity": rng.choice([1, 1, 2, 2, 3, 4, 250, 500]),
+             "unit": unit, "notes": rng.choice(["", "", "", "finely chopped", "to taste", "optional"])}
+            for n, (name, unit) in enumerate(names, start=1)
+        ]
+        steps = []
+        for n in range(1, rng.randint(2, 12) + 1):
+            template, minutes = rng.choice(STEP_TEMPLATES)
+            a, b = rng.choice(names)[0].lower(), rng.choice(names)[0].lower()
+            steps.append({"stepNumber": n, "instruction": template.format(a=a, b=b),
+                          "approxMinutes": max(1, minutes + rng.randint(-2, 5))})
+
+        cuisine = rng.choice(CUISINES)
+        recipe = create_synthetic_recipe(
+            suffix, f"{rng.choice(ADJECTIVES)} {cuisine} {rng.choice(DISHES)}", cuisine,
+            rng.choice(CATEGORIES), rng.choice(DIFFICULTIES), rng.randint(5, 60),
+            rng.choice([0, 5, 10, 15, 20, 30, 45, 60, 90]), rng.randint(1, 8),
+            user_id(int(authors[offset])), now,
+            rng=rng, ingredients=ingredients, steps=steps, max_age_days=cfg["days"],
+        )
+        recipe["createdAt"] = iso(recipe["createdAt"])
+        recipe["updatedAt"] = iso(recipe["updatedAt"])
+        docs.append(recipe)
+
+        recipe_rows.append([recipe[c] if c != "tags" else ",".join(recipe["tags"]) for c in RECIPE_COLUMNS])
+        ingredient_rows.extend([recipe["recipeId"]] + [ing[c] for c in INGREDIENT_COLUMNS[1:]] for ing in ingredients)
+        step_rows.extend([recipe["recipeId"]] + [st[c] for c in STEP_COLUMNS[1:]] for st in steps)
+
+    return {
+        "recipes.json": json_items(docs),
+        "recipe.csv": csv_rows(recipe_rows),
+        "ingredients.csv": csv_rows(ingredient_rows),
+        "steps.csv": csv_rows(step_rows),
+    }
+
+def generate_interactions_shard(cfg, shard):
+    np_rng = np.random.default_rng([cfg["seed"], 2, shard])
+    now = np.datetime64(datetime.fromisoformat(cfg["now"]).replace(tzinfo=None), "us")
+    start, stop = shard * cfg["shard_size"], min((shard + 1) * cfg["shard_size"], cfg["interactions"])
+    count = stop - start
+
+    recipes = scatter(np.searchsorted(zipf_cdf(cfg["recipes"]), np_rng.random(count)), cfg["recipes"])
+    users = scatter(np.searchsorted(zipf_cdf(cfg["users"], 0.8), np_rng.random(count)), cfg["users"])
+    views = 1 + np.floor(np_rng.lognormal(2.5, 1.0, count)).astype(np.int64)
+    likes = np_rng.binomial(views, np_rng.beta(2.0, 5.0, count))
+    ratings = np_rng.choice(np.arange(1, 6), size=count, p=[0.05, 0.07, 0.18, 0.35, 0.35])
+    # Skewed towards recent activity: more interactions near the reference time.
+    age_us = (cfg["days"] * 86_400e6 * (1.0 - np.sqrt(np_rng.random(count)))).astype(np.int64)
+    created = np.datetime_as_string(now - age_us.astype("timedelta64[us]"), unit="us")
+    updated = np.datetime_as_string(now - (age_us * np_rng.random(count)).astype("timedelta64[us]"), unit="us")
+    sources = np.where(np_rng.random(count) < 0.55, "mobile", "web")
+
+    docs, rows = [], []
+    for offset, i in enumerate(range(start, stop)):
+        iid, rid, uid = f"int_{i:010d}", recipe_id(int(recipes[offset])), user_id(int(users[offset]))
+        created_at, source = created[offset] + "+00:00", str(sources[offset])
+        docs.append({
+            "interactionId": iid,
+            "recipeId": rid,
+            "userId": uid,
+            "views": int(views[offset]),
+            "likes": int(likes[offset]),
+            "rating": int(ratings[offset]),
+            "createdAt": created_at,
+            "updatedAt": updated[offset] + "+00:00",
+            "source": source,
+        })
+        rows.append([iid, uid, rid, "", created_at, int(ratings[offset]), "", "", "", source])
+
+    return {"interactions.json": json_items(docs), "interactions.csv": csv_rows(rows)}
+
+# -------------------------------------------------------------------
+# DRIVER
+# -------------------------------------------------------------------
+KINDS = [
+    ("users", generate_users_shard, {"users.json": None, "users.csv": USER_COLUMNS}),
+    ("recipes", generate_recipes_shard, {"recipes.json": None, "recipe.csv": RECIPE_COLUMNS,
+                                         "ingredients.csv": INGREDIENT_COLUMNS, "steps.csv": STEP_COLUMNS}),
+    ("interactions", generate_interactions_shard, {"interactions.json": None,
+                                                   "interactions.csv": INTERACTION_COLUMNS}),
+]
+
+def open_outputs(out_dir, files):
+    handles = {}
+    for name, header in files.items():
+        subdir = EXPORT_SUBDIR if name.endswith(".json") else CSV_SUBDIR
+        os.makedirs(os.path.join(out_dir, subdir), exist_ok=True)
+        f = open(os.path.join(out_dir, subdir, name), "w", encoding="utf-8", newline="")
+        f.write("[\n" if header is None else ",".join(header) + "\n")
+        handles[name] = f
+    return handles
+
+def generate(out_dir=OUTPUT_DIR, seed=0, recipes=17, users=6, interactions=102,
+             shard_size=SHARD_SIZE, workers=None, now=REFERENCE_TIME, days=HISTORY_DAYS):
+    cfg = {"seed": seed, "recipes": recipes, "users": users, "interactions": interactions,
+           "shard_size": shard_size, "now": now, "days": days}
+    workers = workers or os.cpu_count()
+    stats = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for kind, fn, files in KINDS:
+            start = time.perf_counter()
+            shards = -(-cfg[kind] // shard_size)
+            handles = open_outputs(out_dir, files)
+            try:
+                # Shards are generated in parallel but written strictly in order,
+                # with at most 2x workers results held in memory at a time.
+                pending, next_shard = [], 0
+                for written in range(shards):
+                    while next_shard < shards and len(pending) < 2 * workers:
+                        pending.append(pool.submit(fn, cfg, next_shard))
+                        next_shard += 1
+                    chunks = pending.pop(0).result()
+                    for name, text in chunks.items():
+                        if name.endswith(".json") and written:
+                            handles[name].write(",\n")
+                        handles[name].write(text)
+            finally:
+                for name, f in handles.items():
+                    if name.endswith(".json"):
+                        f.write("\n]")
+                    f.close()
+            elapsed = time.perf_counter() - start
+            stats[kind] = {"documents": cfg[kind], "seconds": round(elapsed, 3),
+                           "docs_per_sec": round(cfg[kind] / elapsed, 1) if elapsed > 0 else 0.0}
+            print(f" Generated {cfg[kind]} {kind} in {elapsed:.2f}s ({stats[kind]['docs_per_sec']} docs/sec)")
+
+    return stats
+
+# -------------------------------------------------------------------
+# MAIN
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic recipe dataset.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--recipes", type=int, default=1_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--interactions", type=int, default=10_000)
+    parser.add_argument("--out", default=OUTPUT_DIR)
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE,
+                        help="documents per work unit; output is byte-identical for the same seed and shard size")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--now", default=REFERENCE_TIME, help="reference time that createdAt values count back from")
+    parser.add_argument("--days", type=int, default=HISTORY_DAYS, help="span of history to spread createdAt over")
+    args = parser.parse_args()
+
+    generate(args.out, args.seed, args.recipes, args.users, args.interactions,
+             args.shard_size, args.workers, args.now, args.days)
+    print(" Synthetic dataset written to", args.out)
@@ -1,13 +1,29 @@
 import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import json
 from datetime import datetime
 import os
+import pickle
+import tempfile
+
+import instrumentation
+from columnar import iter_table, read_table, table_path
 
 # -------------------------------------------------------------------
 # CONFIG
 # -------------------------------------------------------------------
 DATA_DIR = "normalized_csv_output"  # your CSV folder
 OUTPUT_FILE = "validation_report.json"
+CHUNK_SIZE = 100_000  # rows per chunk in --stream mode
+METRICS_PATH = "metrics/validate"
+
+# pandas also accepts loose forms (e.g. "2025-11" or single-digit fields) that
+# fromisoformat rejects, so the vectorized parse is only trusted for values in
+# this canonical shape; anything else is re-checked one by one.
+ISO_TIMESTAMP = (r"\d{4}-\d{2}-\d{2}"
+                 r"(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?(?:[+-]\d{2}:\d{2})?)?")
 
 # -------------------------------------------------------------------
 # HELPERS
@@ -28,112 +44,96 @@ def ok():
     return {"valid": True, "reason": ""}
 
 # -------------------------------------------------------------------
-# VALIDATION FUNCTIONS
+# VECTORIZED HELPERS
 # -------------------------------------------------------------------
-def validate_recipes(df):
-    results = []
-
-    for _, row in df.iterrows():
-        required = ["recipeId", "title", "description", "authorId",
-                    "difficulty", "prepTimeMinutes", "cookTimeMinutes",
-                    "totalTimeMinutes", "servings", "createdAt", "updatedAt"]
-
-        # Check required fields
-        for col in required:
-            if pd.isna(row.get(col)):
-                results.append(fail(f"Missing required field: {col}"))
-                break
-        else:
-            # Difficulty
-            if str(row["difficulty"]).lower() not in ["easy", "medium", "hard"]:
-                results.append(fail("Invalid difficulty value"))
-                continue
-
-            # Numeric checks
-            if row["prepTimeMinutes"] <= 0:
-                results.append(fail("prepTimeMinutes must be > 0"))
-                continue
-            if row["cookTimeMinutes"] < 0:
-                results.append(fail("cookTimeMinutes must be >= 0"))
-                continue
-            if row["prepTimeMinutes"] + row["cookTimeMinutes"] != row["totalTimeMinutes"]:
-                results.append(fail("totalTimeMinutes mismatch"))
-                continue
-            if row["servings"] <= 0:
-                results.append(fail("servings must be > 0"))
-                continue
-
-            # Timestamp
-            if not is_valid_timestamp(row["createdAt"]):
-                results.append(fail("Invalid createdAt timestamp"))
-                continue
-            if not is_valid_timestamp(row["updatedAt"]):
-                results.append(fail("Invalid updatedAt timestamp"))
-                continue
-
-            results.append(ok())
-
-    return results
+def column(df, name):
+    # Missing columns behave like all-null ones, as row.get() did.
+    if name in df.columns:
+        return df[name]
+    return pd.Series(None, index=df.index, dtype=object)
 
-def validate_ingredients(df):
-    results = []
-    for _, row in df.iterrows():
-        if pd.isna(row.get("recipeId")):
-            results.append(fail("Missing recipeId"))
-            continue
-        if pd.isna(row.get("ingredientId")):
-            results.append(fail("Missing ingredientId"))
-            continue
-        if pd.isna(row.get("name")) or str(row.get("name")).strip() == "":
-            results.append(fail("Invalid ingredient name"))
-            continue
-        if row.get("quantity") is not None and row["quantity"] < 0:
-            results.append(fail("quantity must be >= 0"))
-            continue
+def numeric(df, name):
+    return pd.to_numeric(column(df, name), errors="coerce")
 
-        results.append(ok())
-    return results
+def is_blank(series):
+    return series.isna() | (series.astype(str).str.strip() == "")
 
-def validate_steps(df):
-    results = []
-    for _, row in df.iterrows():
-        if row.get("stepNumber") is None or row["stepNumber"] < 1:
-            results.append(fail("stepNumber must be >= 1"))
-            continue
-        if pd.isna(row.get("instruction")) or str(row.get("instruction")).strip() == "":
-            results.append(fail("Invalid instruction"))
-            continue
-        if row.get("approxMinutes") is not None and row["approxMinutes"] < 0:
-            results.append(fail("approxMinutes must be >= 0"))
-            continue
+def valid_timestamps(series):
+    # Exports repeat timestamps heavily (one `now` per seeding run), so parse
+    # each distinct value once and broadcast the result back through the codes.
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype=object)
 
-        results.append(ok())
-    return results
+    # One vectorized ISO-8601 parse; only values it rejects fall back to the
+    # per-value check, so edge cases pandas cannot represent still match
+    # datetime.fromisoformat exactly.
+    text = uniques.astype(str).str.replace("Z", "", regex=False)
+    parsed = pd.to_datetime(text, format="ISO8601", errors="coerce", utc=True)
+    valid = parsed.notna() & text.str.fullmatch(ISO_TIMESTAMP)
+    if not valid.all():
+        valid[~valid] = uniques[~valid].map(is_valid_timestamp)
 
-def validate_interactions(df):
-    results = []
-    for _, row in df.iterrows():
-        # Validate timestamp
-        if not is_valid_timestamp(row.get("createdAt")):
-            results.append(fail("Invalid createdAt timestamp"))
-            continue
+    # factorize codes nulls as -1; they are never valid.
+    valid = np.append(valid.to_numpy(dtype=bool), False)
+    return pd.Series(valid[codes], index=series.index)
+
+def first_failure(df, checks):
+    # checks is an ordered list of (failed_mask, reason); each row reports the
+    # first rule it breaks, exactly like the early `continue`s of a row loop.
+    if not len(df):
+        return []
+    reasons = np.select([mask.to_numpy(dtype=bool) for mask, _ in checks],
+                        [reason for _, reason in checks], default="")
+    return [{"valid": not reason, "reason": reason} for reason in reasons.tolist()]
+
+# -------------------------------------------------------------------
+# VALIDATION FUNCTIONS
+# -------------------------------------------------------------------
+RECIPE_REQUIRED = ["recipeId", "title", "description", "authorId",
+                   "difficulty", "prepTimeMinutes", "cookTimeMinutes",
+                   "totalTimeMinutes", "servings", "createdAt", "updatedAt"]
+
+def validate_recipes(df):
+    checks = [(column(df, col).isna(), f"Missing required field: {col}") for col in RECIPE_REQUIRED]
+    if len(df) and not all(col in df.columns for col in RECIPE_REQUIRED):
+        return first_failure(df, checks)
+
+    prep, cook = numeric(df, "prepTimeMinutes"), numeric(df, "cookTimeMinutes")
+    checks += [
+        (~df["difficulty"].astype(str).str.lower().isin(["easy", "medium", "hard"]), "Invalid difficulty value"),
+        (prep <= 0, "prepTimeMinutes must be > 0"),
+        (cook < 0, "cookTimeMinutes must be >= 0"),
+        (prep + cook != numeric(df, "totalTimeMinutes"), "totalTimeMinutes mismatch"),
+        (numeric(df, "servings") <= 0, "servings must be > 0"),
+        (~valid_timestamps(df["createdAt"]), "Invalid createdAt timestamp"),
+        (~valid_timestamps(df["updatedAt"]), "Invalid updatedAt timestamp"),
+    ]
+    return first_failure(df, checks)
 
-        # rating validation
-        rating = row.get("rating")
-        if rating is not None and not pd.isna(rating):
-            if not (1 <= rating <= 5):
-                results.append(fail("rating must be 1–5"))
-                continue
+def validate_ingredients(df):
+    return first_failure(df, [
+        (column(df, "recipeId").isna(), "Missing recipeId"),
+        (column(df, "ingredientId").isna(), "Missing ingredientId"),
+        (is_blank(column(df, "name")), "Invalid ingredient name"),
+        (numeric(df, "quantity") < 0, "quantity must be >= 0"),
+    ])
 
-        # difficultyRating validation
-        diff_rating = row.get("difficultyRating")
-        if diff_rating is not None and not pd.isna(diff_rating):
-            if not (1 <= diff_rating <= 5):
-                results.append(fail("difficultyRating must be 1–5"))
-                continue
+def validate_steps(df):
+    step_number = numeric(df, "stepNumber")
+    missing = pd.Series("stepNumber" not in df.columns, index=df.index)
+    return first_failure(df, [
+        (missing | (step_number < 1), "stepNumber must be >= 1"),
+        (is_blank(column(df, "instruction")), "Invalid instruction"),
+        (numeric(df, "approxMinutes") < 0, "approxMinutes must be >= 0"),
+    ])
 
-        results.append(ok())
-    return results
+def validate_interactions(df):
+    rating, diff_rating = numeric(df, "rating"), numeric(df, "difficultyRating")
+    return first_failure(df, [
+        (~valid_timestamps(column(df, "createdAt")), "Invalid createdAt timestamp"),
+        (rating.notna() & ~rating.between(1, 5), "rating must be 1–5"),
+        (diff_rating.notna() & ~diff_rating.between(1, 5), "difficultyRating must be 1–5"),
+    ])
 
 # -------------------------------------------------------------------
 # MAIN
@@ -143,33 +143,228 @@ def summarize(results):
     invalid = len(results) - valid
     return valid, invalid, results
 
-if __name__ == "__main__":
-    # Load CSVs
-    recipes_df = pd.read_csv(os.path.join(DATA_DIR, "recipe.csv"))
-    ingredients_df = pd.read_csv(os.path.join(DATA_DIR, "ingredients.csv"))
-    steps_df = pd.read_csv(os.path.join(DATA_DIR, "steps.csv"))
-    interactions_df = pd.read_csv(os.path.join(DATA_DIR, "interactions.csv"))
-
-    # Validate
-    r1 = validate_recipes(recipes_df)
-    r2 = validate_ingredients(ingredients_df)
-    r3 = validate_steps(steps_df)
-    r4 = validate_interactions(interactions_df)
-
-    # Summarize
-    report = {
-        "recipes": {"valid": summarize(r1)[0], "invalid": summarize(r1)[1]},
-        "ingredients": {"valid": summarize(r2)[0], "invalid": summarize(r2)[1]},
-        "steps": {"valid": summarize(r3)[0], "invalid": summarize(r3)[1]},
-        "interactions": {
-            "valid": summarize(r4)[0],
-            "invalid": summarize(r4)[1],
-            "invalid_records": [r for r in summarize(r4)[2] if not r["valid"]]
+def validate_csv_chunked(path, table, chunksize=CHUNK_SIZE):
+    # Runs in a worker process: only one chunk of one table is in memory at a
+    # time, and per-chunk counts are merged as they arrive.
+    validator = VALIDATORS[table]
+    valid = invalid = 0
+    invalid_records = []
+    for chunk in iter_table(path, chunksize, VALIDATOR_COLUMNS[table]):
+        chunk_valid, chunk_invalid, results = summarize(validator(chunk))
+        valid += chunk_valid
+        invalid += chunk_invalid
+        if table == "interactions":
+            invalid_records.extend(r for r in results if not r["valid"])
+    return valid, invalid, invalid_records
+
+def validate_streaming(data_dir=DATA_DIR, chunksize=CHUNK_SIZE, workers=None, integrity=False):
+    with ProcessPoolExecutor(max_workers=workers or len(TABLE_FILES) + integrity) as pool:
+        futures = {
+            table: pool.submit(validate_csv_chunked, table_path(data_dir, filename), table, chunksize)
+            for table, filename in TABLE_FILES.items()
         }
-    }
+        if integrity:
+            integrity_future = pool.submit(check_referential_integrity, data_dir, chunksize)
+        counts = {table: future.result() for table, future in futures.items()}
+        # Tables are validated in worker processes; only their totals are seen here.
+        for table, (valid, invalid, _) in counts.items():
+            instrumentation.record(rows_in=valid + invalid, rows_out=valid, collection=table)
+        report = build_report(counts)
+        if integrity:
+            report["referential_integrity"] = integrity_future.result()
+    return report
+
+def validate_in_memory(data_dir=DATA_DIR, integrity=False):
+    counts = {}
+    for table, filename in TABLE_FILES.items():
+        with instrumentation.stage(f"validate_{table}"):
+            df = read_table(table_path(data_dir, filename), VALIDATOR_COLUMNS[table])
+            valid, invalid, results = summarize(VALIDATORS[table](df))
+            counts[table] = (valid, invalid, [r for r in results if not r["valid"]])
+            instrumentation.record(rows_in=len(df), rows_out=valid, collection=table)
+    report = build_report(counts)
+    if integrity:
+        with instrumentation.stage("integrity"):
+            report["referential_integrity"] = check_referential_integrity(data_dir)
+    return report
+
+def build_report(counts):
+    report = {}
+    for table, (valid, invalid, invalid_records) in counts.items():
+        report[table] = {"valid": valid, "invalid": invalid}
+        if table == "interactions":
+            report[table]["invalid_records"] = invalid_records
+    return report
+
+# -------------------------------------------------------------------
+# REFERENTIAL INTEGRITY
+# -------------------------------------------------------------------
+# Foreign keys per table as (column, referenced table); ROW_IDS names the
+# columns that identify an orphaned row in the report (steps are numbered per
+# recipe, so a step needs both).
+FOREIGN_KEYS = {
+    "recipes": [("authorId", "users")],
+    "ingredients": [("recipeId", "recipes")],
+    "steps": [("recipeId", "recipes")],
+    "interactions": [("recipeId", "recipes"), ("userId", "users")],
+}
+ROW_IDS = {"recipes": ["recipeId"], "ingredients": ["ingredientId"], "steps": ["recipeId", "stepNumber"],
+           "interactions": ["interactionId"]}
+PRIMARY_KEYS = {"recipes": ("recipe.csv", "recipeId"), "users": ("users.csv", "userId")}
+
+def key_index(path, column, chunksize=CHUNK_SIZE):
+    # A hash index over the distinct primary keys, built once per table.
+    keys = [chunk[column].dropna().unique() for chunk in iter_table(path, chunksize, [column], text=True)]
+    return pd.Index(np.concatenate(keys) if keys else [], dtype=object).unique()
+
+def find_orphans(path, table, indexes, chunksize=CHUNK_SIZE):
+    checks = [(col, indexes[ref]) for col, ref in FOREIGN_KEYS[table] if ref in indexes]
+    if not checks:
+        return []
+    id_cols = ROW_IDS[table]
+    usecols = list(dict.fromkeys(id_cols + [col for col, _ in checks]))
+    orphans = []
+    for chunk in iter_table(path, chunksize, usecols, text=True):
+        for col, index in checks:
+            # get_indexer probes the hash table for the whole column at once;
+            # -1 marks keys with no matching parent row.
+            missing = index.get_indexer(chunk[col]) == -1
+            ids = zip(*(chunk[id_col][missing] for id_col in id_cols))
+            for row, row_id, value in zip(chunk.index[missing], ids, chunk[col][missing]):
+                row_id = [None if pd.isna(part) else part for part in row_id]
+                # row is the 1-based data row in the CSV (header excluded).
+                orphans.append({"row": int(row) + 1, "id": row_id[0] if len(row_id) == 1 else row_id,
+                                "column": col, "value": None if pd.isna(value) else value})
+    return orphans
+
+def step_stats(steps):
+    step_number = pd.to_numeric(steps["stepNumber"], errors="coerce")
+    return step_number.groupby(steps["recipeId"]).agg(["size", "count", "min", "max", "nunique"])
+
+def broken_sequences(stats):
+    # A gapless 1..n sequence has n distinct values starting at 1 and ending at n.
+    broken = stats[(stats["min"] != 1) | (stats["max"] != stats["count"]) | (stats["nunique"] != stats["count"])]
+    return {recipe_id: {"recipeId": recipe_id, "steps": int(row["count"]),
+                        "min": None if pd.isna(row["min"]) else int(row["min"]),
+                        "max": None if pd.isna(row["max"]) else int(row["max"]),
+                        "distinct": int(row["nunique"])}
+            for recipe_id, row in broken.iterrows()}
+
+def check_step_sequences(path, chunksize=CHUNK_SIZE):
+    # Streams the steps table. Rows arrive grouped by recipe (normalize_export
+    # writes them that way), so a recipe is checked as soon as its run of rows
+    # ends; the run still open at the end of a chunk is carried into the next.
+    # Recipes whose rows turn up in more than one run are re-checked afterwards:
+    # one more pass spills their rows to disk in batches of about a chunk's
+    # worth, and each batch is then checked on its own.
+    columns = ["recipeId", "stepNumber"]
+    rows, broken, scattered = {}, {}, set()
+
+    def settle(steps):
+        stats = step_stats(steps)
+        seen = np.fromiter((recipe_id in rows for recipe_id in stats.index), bool, len(stats))
+        for recipe_id, size in stats.loc[seen, "size"].items():
+            scattered.add(recipe_id)
+            broken.pop(recipe_id, None)
+            rows[recipe_id] += int(size)
+        fresh = stats[~seen]
+        rows.update(zip(fresh.index, fresh["size"].astype(int)))
+        broken.update(broken_sequences(fresh))
+
+    carry = None
+    for chunk in iter_table(path, chunksize, columns):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if not len(chunk):
+            continue
+        open_run = (chunk["recipeId"] == chunk["recipeId"].iloc[-1]).to_numpy()
+        carry = chunk[open_run]
+        settle(chunk[~open_run])
+    if carry is not None:
+        settle(carry)
+
+    if scattered:
+        batch_of, batches, batch_rows = {}, 0, 0
+        for recipe_id in sorted(scattered):
+            if batch_rows and batch_rows + rows[recipe_id] > chunksize:
+                batches, batch_rows = batches + 1, 0
+            batch_of[recipe_id] = batches
+            batch_rows += rows[recipe_id]
+        with tempfile.TemporaryDirectory() as spill:
+            for chunk in iter_table(path, chunksize, columns):
+                chunk = chunk[chunk["recipeId"].isin(scattered)]
+                for batch, part in chunk.groupby(chunk["recipeId"].map(batch_of)):
+                    with open(os.path.join(spill, f"{int(batch)}.pkl"), "ab") as f:
+                        pickle.dump(part, f)
+            for batch in range(batches + 1):
+                parts = []
+                with open(os.path.join(spill, f"{batch}.pkl"), "rb") as f:
+                    while f.peek(1):
+                        parts.append(pickle.load(f))
+                broken.update(broken_sequences(step_stats(pd.concat(parts, ignore_index=True))))
+    return [broken[recipe_id] for recipe_id in sorted(broken)]
+
+def check_referential_integrity(data_dir=DATA_DIR, chunksize=CHUNK_SIZE):
+    indexes = {}
+    for table, (filename, column) in PRIMARY_KEYS.items():
+        path = table_path(data_dir, filename)
+        if os.path.exists(path):
+            indexes[table] = key_index(path, column, chunksize)
+
+    report = {"skipped": sorted(set(PRIMARY_KEYS) - set(indexes))}
+    for table, filename in TABLE_FILES.items():
+        orphans = find_orphans(table_path(data_dir, filename), table, indexes, chunksize)
+        report[table] = {"orphans": len(orphans), "orphaned_rows": orphans}
+    broken = check_step_sequences(table_path(data_dir, TABLE_FILES["steps"]), chunksize)
+    report["step_sequences"] = {"broken": len(broken), "recipes": broken}
+    return report
+
+TABLE_FILES = {
+    "recipes": "recipe.csv",
+    "ingredients": "ingredients.csv",
+    "steps": "steps.csv",
+    "interactions": "interactions.csv",
+}
+# The columns each validator reads; nothing else is loaded.
+VALIDATOR_COLUMNS = {
+    "recipes": RECIPE_REQUIRED,
+    "ingredients": ["recipeId", "ingredientId", "name", "quantity"],
+    "steps": ["stepNumber", "instruction", "approxMinutes"],
+    "interactions": ["createdAt", "rating", "difficultyRating"],
+}
+VALIDATORS = {
+    "recipes": validate_recipes,
+    "ingredients": validate_ingredients,
+    "steps": validate_steps,
+    "interactions": validate_interactions,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate the normalized CSV tables.")
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help="folder of normalized CSVs and/or columnar tables (see columnar.py)")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--stream", action="store_true",
+                        help="read each CSV in chunks and validate the tables in parallel processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--integrity", action="store_true",
+                        help="also check foreign keys and step sequences across tables")
+    parser.add_argument("--metrics", default=METRICS_PATH, help="write stage metrics to <path>.json and <path>.prom")
+    parser.add_argument("--profile", default=None,
+                        help="dump a cProfile file per stage into this directory (--stream work runs in other processes)")
+    args = parser.parse_args()
+
+    instrumentation.configure("validate", args.profile)
+    if args.stream:
+        with instrumentation.stage("validate"):
+            report = validate_streaming(args.data_dir, args.chunk_size, args.workers, args.integrity)
+    else:
+        report = validate_in_memory(args.data_dir, args.integrity)
 
     # Save JSON report
-    with open(OUTPUT_FILE, "w") as f:
+    with open(args.output, "w") as f:
         json.dump(report, f, indent=4)
 
-    print("Validation complete! Report saved to", OUTPUT_FILE)
+    print("Validation complete! Report saved to", args.output)
+    print("Metrics written to", " and ".join(instrumentation.write(args.metrics)))